@@ -1,6 +1,7 @@
 
 import streamlit as st
-from services import azure_storage, azure_transcription
+from datetime import datetime, timezone
+from services import azure_storage
 
 # Custom CSS to reduce button width and add margin
 st.markdown("""
@@ -20,47 +21,131 @@ st.markdown("""
 st.header("1. 🎧 Upload Files")
 st.markdown("Use the sections below to upload your audio files. All uploads are stored in Azure Blob Storage.")
 
+def track_transcription_job(audio_name):
+    st.session_state.setdefault("transcription_jobs", {})[audio_name] = datetime.now(timezone.utc)
+
+
 audio_files = st.file_uploader("Choose audio files", type=["wav", "mp3", "m4a"], accept_multiple_files=True)
 if st.button("Upload & Transcribe File(s)", key="upload_audio"):
     if audio_files:
         
-        with st.spinner("Uploading and running transcriptions..."):
+        with st.spinner("Uploading files and queuing transcriptions..."):
             info_box = st.empty()
             for audio_file in audio_files:
                 info_box.info(azure_storage.upload_audio_to_blob(audio_file))
-                info_box.info(f"Transcribing  **{audio_file.name}** ...")
-                transcript = azure_transcription.transcribe_audio(audio_file.name)            
-                name_no_ext = audio_file.name.split(".")[0]
-                azure_storage.upload_transcription_to_blob(name_no_ext, transcript)
-                info_box.info(f"Transcription for **{audio_file.name}** uploaded successfully.")
-        st.success("All audio files uploaded successfully.", icon="✅")
+                azure_storage.enqueue_transcription_job(audio_file.name)
+                track_transcription_job(audio_file.name.replace(" ", "_"))
+        st.success("All audio files uploaded. Transcriptions are processed in the background.", icon="✅")
     else:
         st.error("No audio files selected.")
-    
 
+
+def show_transcription_progress():
+    """
+    Progress of the jobs queued from this session, based on which transcripts now exist.
+    """
+    jobs = st.session_state.get("transcription_jobs", {})
+    if not jobs:
+        return
+    # A job is done once its transcript was written after the job was queued
+    transcripts = azure_storage.get_blob_index(azure_storage.TRANSCRIPTION_FOLDER, refresh=True)
+    done = []
+    for audio_name, queued_at in jobs.items():
+        entry = transcripts.get(f"{azure_storage.TRANSCRIPTION_FOLDER}/{audio_name.split('.')[0]}.txt")
+        if entry and entry["last_modified"] and entry["last_modified"] >= queued_at:
+            done.append(audio_name)
+    st.progress(len(done) / len(jobs), text=f"Transcribed {len(done)} of {len(jobs)} queued file(s)")
+    try:
+        st.caption(f"Jobs waiting in queue: {azure_storage.get_queue_length(azure_storage.TRANSCRIPTION_QUEUE_NAME)}")
+    except Exception as e:
+        st.caption(f"Queue length unavailable: {e}")
+    if len(done) == len(jobs):
+        st.session_state["transcription_jobs"] = {}
+    elif st.button("Refresh progress"):
+        st.rerun()
+
+
+show_transcription_progress()
 st.markdown("---")
 
 # 2. Manage Existing Files
 st.header("2. Manage Existing Calls")
+
+CALLS_PER_PAGE_OPTIONS = [10, 25, 50, 100]
+
+
+class TranscriptMissing(Exception):
+    """Raised inside the cached loader so a missing transcript is not cached."""
+
+
+@st.cache_data(show_spinner=False, ttl=300, max_entries=64)
+def _load_cached_transcript(transcript_name):
+    transcript = azure_storage.read_transcription(transcript_name)
+    if transcript is None:
+        # st.cache_data does not cache exceptions: the next render reads the blob again,
+        # so a transcription finished by the worker shows up at once
+        raise TranscriptMissing(transcript_name)
+    return transcript
+
+
+def load_transcript(transcript_name):
+    try:
+        return _load_cached_transcript(transcript_name)
+    except TranscriptMissing:
+        return None
+
+
+def render_call(blob_name, transcript_name):
+    """
+    Fetch and show the audio and transcript of one call. Only runs for opened calls.
+    """
+    with st.spinner("Loading call..."):
+        audio = azure_storage.acquire_audio(blob_name)
+        transcript = load_transcript(transcript_name)
+    # st.audio reads the file right away; the lease keeps it cached until then
+    with audio as audio_file:
+        st.audio(audio_file, format="audio/mp3")  # or the correct format
+
+    if transcript:
+        st.markdown(transcript)
+    else:
+        st.write("Transcript not found.")
+
+
+# Only the names are listed up front; audio and transcripts are fetched when a call is opened.
 blobs = azure_storage.list_audios()
 if not blobs:
     st.info("No audio files found.")
 else:
-    for blob_name in blobs:
+    if "opened_calls" not in st.session_state:
+        st.session_state["opened_calls"] = set()
+    opened_calls = st.session_state["opened_calls"]
+
+    filter_col, size_col, page_col = st.columns([2, 1, 1])
+    with filter_col:
+        name_filter = st.text_input("Filter calls by name", "")
+    filtered = [b for b in blobs if name_filter.lower() in b.lower()]
+    with size_col:
+        page_size = st.selectbox("Calls per page", CALLS_PER_PAGE_OPTIONS)
+    total_pages = max(1, -(-len(filtered) // page_size))
+    with page_col:
+        page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1)
+
+    start = (page - 1) * page_size
+    page_blobs = filtered[start:start + page_size]
+    st.caption(f"Showing {start + 1 if page_blobs else 0}-{start + len(page_blobs)} of {len(filtered)} calls")
+
+    for blob_name in page_blobs:
         name_only = blob_name.rsplit(".")[0]
-        
-        with st.expander(f"📞 {blob_name}"):
-            # Add an audio player if you’d like
-            audio_file = azure_storage.download_audio_to_local_file(blob_name)
-            st.audio(audio_file, format="audio/mp3")  # or the correct format
-
-            # Show transcript
-            transcript_name = f"{name_only}.txt"
-            transcript = azure_storage.read_transcription(transcript_name)
-            if transcript:
-                st.markdown(transcript)
-            else:
-                st.write("Transcript not found.")
+        transcript_name = f"{name_only}.txt"
+        is_open = blob_name in opened_calls
+
+        with st.expander(f"📞 {blob_name}", expanded=is_open):
+            if is_open:
+                render_call(blob_name, transcript_name)
+            elif st.button("Load audio & transcript", key=f"open_{blob_name}"):
+                opened_calls.add(blob_name)
+                st.rerun()
 
             # Create two columns with equal width
             col1, col2 = st.columns(2)
@@ -71,15 +156,18 @@ else:
                 if st.button("Delete", key=f"delete_{blob_name}"):
                     outcome = azure_storage.delete_audio(blob_name)
                     azure_storage.delete_transcription(transcript_name)
+                    opened_calls.discard(blob_name)
+                    _load_cached_transcript.clear()
                     st.success(outcome)
                 st.markdown('</div>', unsafe_allow_html=True)
 
             with col2:
                 st.markdown('<div class="custom-div">', unsafe_allow_html=True)
                 if st.button("Transcribe", key=f"transcribe_{blob_name}"):
-                    transcript = azure_transcription.transcribe_audio(blob_name)
-                    azure_storage.upload_transcription_to_blob(name_only, transcript)
-                    st.success("Transcription completed.")
+                    azure_storage.enqueue_transcription_job(blob_name)
+                    track_transcription_job(blob_name)
+                    _load_cached_transcript.clear()
+                    st.success("Transcription queued.")
                 st.markdown('</div>', unsafe_allow_html=True)
 
 
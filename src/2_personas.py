@@ -1,12 +1,10 @@
 import sys
 import uuid
 import pandas as pd
-import json
 import streamlit as st
-from datetime import datetime
 
 # Adjust path as needed to import your modules
-from services import azure_storage, azure_oai
+from services import azure_storage, azure_oai, persona_analysis, analysis_snapshot, analysis_schema
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -37,29 +35,34 @@ st.markdown(
 
 
 # Function to process a single blob
-def analyze_blob(persona_prompt, blob_name):
+def analyze_blob(persona_run, analysis_model, kpis, persona_prompt, blob_name, metadata=None):
     # Read transcription
     transcribed_text = azure_storage.read_transcription(blob_name)
-    # Call the LLM with the prompt and transcription text
-    analysis_result = azure_oai.call_llm(prompt_content, transcribed_text)
-    # Upload the analysis result back to storage
-    azure_storage.upload_llm_analysis_to_blob(
-        blob_name, 
-        persona_prompt, 
-        analysis_result
-    )
-
-    persona = persona_prompt.split(".")[0]
-    azure_storage.send_message_to_queue(
-        json.dumps({
-            "blob_uri": azure_storage.get_uri(blob_name,persona ),
-            "persona": persona,
-            "date": datetime.now().isoformat()
-        })
-    )
+    # Call the LLM with the run's persona and the transcription text. With KPIs configured the
+    # output is parsed against the persona's schema.
+    if analysis_model is not None:
+        analysis_result = analysis_schema.to_record(persona_run.analyze(transcribed_text, response_format=analysis_model))
+    else:
+        analysis_result = persona_run.analyze(transcribed_text)
+    # Validate against the KPIs and upload the analysis result back to storage, tagged with what it was built from
+    persona_analysis.store_analysis(blob_name, persona_prompt, analysis_result, metadata, kpis)
 
     return f"Analysis completed for **{blob_name}**."
 
+def show_throughput(placeholder, persona_run):
+    """
+    Live gauge of the LLM deployment's throughput and prompt cache hits during an analysis run.
+    """
+    gauge = azure_oai.get_throughput().get(azure_oai.AZURE_OPENAI_DEPLOYMENT_NAME)
+    if gauge:
+        cache = persona_run.get_stats()
+        placeholder.info(
+            f"⚡ {gauge['requests_per_minute']} requests/min, {gauge['tokens_per_minute']} tokens/min, "
+            f"concurrency {gauge['in_flight']}/{gauge['concurrency_limit']}, "
+            f"throttled {gauge['throttled']}, retries {gauge['retries']}, "
+            f"prompt cache {cache['cache_hit_rate']:.0%} of {cache['prompt_tokens']} tokens"
+        )
+
 # -------------------------------------------------------- #
 # SIDEBAR
 # -------------------------------------------------------- #
@@ -126,27 +129,94 @@ st.title("3. 🤖 LLM Analysis")
 st.markdown("Analyze all transcribed files using a selected persona.")
 
 
-if st.button("Analyze with GenAI"):
-    transcription_blobs = azure_storage.list_transcriptions()
-    if not transcription_blobs:
+only_stale = st.checkbox(
+    "Only analyze new or changed calls",
+    value=True,
+    help="Skip calls whose analysis was produced from the same transcript and the same persona definition.",
+)
+
+checkpoint = persona_analysis.read_checkpoint(selected_prompt_name)
+current_prompt = azure_storage.read_prompt(selected_prompt_name)
+kpis = analysis_schema.read_kpis(selected_prompt_name)
+resume_files = persona_analysis.resume_files(checkpoint, current_prompt, kpis)
+resume = False
+if resume_files:
+    st.info(
+        f"A previous run was interrupted after {checkpoint['completed']} call(s) with "
+        f"{len(resume_files)} left. Click **Resume interrupted run** to analyze only those, "
+        f"or **Analyze with GenAI** to plan a new run."
+    )
+    resume = st.button("Resume interrupted run")
+
+if st.button("Analyze with GenAI") or resume:
+    prompt_content = current_prompt
+    to_analyze, up_to_date = persona_analysis.plan_analysis(
+        selected_prompt_name, prompt_content, only_stale, kpis, only_files=resume_files if resume else None
+    )
+    if resume and not to_analyze:
+        # The calls left were analyzed or deleted since the run was interrupted
+        persona_analysis.save_checkpoint(
+            selected_prompt_name, prompt_content, set(), checkpoint["completed"], checkpoint["failed"],
+            status="completed", kpis=kpis,
+        )
+    if not to_analyze and not up_to_date:
         st.warning("No transcribed files available for analysis.")
+    elif not to_analyze:
+        st.success(f"All {up_to_date} calls are already analyzed with this persona.")
     else:
-        prompt_content = azure_storage.read_prompt(selected_prompt_name)
+        if up_to_date:
+            st.info(f"Skipping {up_to_date} call(s) already analyzed with this persona.")
+        content_hash = persona_analysis.prompt_hash(prompt_content, kpis)
+        pending = {blob_name for blob_name, _ in to_analyze}
+        # A resumed run carries on the interrupted run's counts
+        failed = set(checkpoint["failed"]) if resume else set()
+        completed = checkpoint["completed"] if resume else 0
+        persona_analysis.save_checkpoint(selected_prompt_name, prompt_content, pending, completed, failed, kpis=kpis)
+        # The persona is loaded and counted once and sent as the same prefix on every call
+        persona_run = azure_oai.PersonaRun(prompt_content)
+        analysis_model = analysis_schema.build_analysis_model(kpis) if kpis else None
+
+        progress_bar = st.progress(0.0)
+        throughput_box = st.empty()
         with st.spinner("Running analysis on transcriptions..."):
-        # Create a thread pool with a maximum of 5 threads
-            with ThreadPoolExecutor(max_workers=5) as executor:
+        # Concurrency and throttling are governed by the Azure OpenAI scheduler; the pool only
+        # needs enough threads to reach its maximum concurrency.
+            with ThreadPoolExecutor(max_workers=azure_oai.OAI_MAX_CONCURRENCY) as executor:
                 # Submit each blob's analysis task to the executor
                 future_to_blob = {
-                    executor.submit(analyze_blob, selected_prompt_name, blob_name): blob_name
-                    for blob_name in transcription_blobs
+                    executor.submit(
+                        analyze_blob,
+                        persona_run,
+                        analysis_model,
+                        kpis,
+                        selected_prompt_name,
+                        blob_name,
+                        persona_analysis.analysis_metadata(transcript_etag, content_hash),
+                    ): blob_name
+                    for blob_name, transcript_etag in to_analyze
                 }
                 # Process and display the results as each thread completes
                 for future in as_completed(future_to_blob):
                     blob_name = future_to_blob[future]
+                    pending.discard(blob_name)
                     try:
                         result = future.result()
                     except Exception as exc:
+                        failed.add(blob_name)
                         st.error(f"Analysis generated an exception for {blob_name}: {exc}")
                     else:
+                        completed += 1
                         st.success(result)
-
+                    show_throughput(throughput_box, persona_run)
+                    progress_bar.progress((len(to_analyze) - len(pending)) / len(to_analyze))
+                    if (completed + len(failed)) % persona_analysis.ANALYSIS_CHECKPOINT_EVERY == 0:
+                        persona_analysis.save_checkpoint(
+                            selected_prompt_name, prompt_content, pending, completed, failed, kpis=kpis
+                        )
+
+        persona_analysis.save_checkpoint(
+            selected_prompt_name, prompt_content, pending, completed, failed, status="completed", kpis=kpis
+        )
+        # Fold the new analyses into the persona's snapshot so the dashboards load them at once
+        with st.spinner("Updating the analysis snapshot..."):
+            analysis_snapshot.refresh_snapshot(selected_prompt_name)
@@ -1,70 +1,11 @@
 import streamlit as st
 from datetime import datetime
-from services import azure_storage, azure_oai
-from collections import defaultdict
-import numpy as np
+from services import azure_storage, analysis_snapshot, analysis_frame, insights
 import pandas as pd
 import altair as alt
 ############################
 # 1. Helper Functions
 ############################
-def flatten_json(nested_json, parent_key='', sep='.'):
-    """
-    Recursively flattens a nested JSON/dict.
-    E.g. {"Key1": {"SubKey1": "val1", "SubKey2": "val2"}, "Key2": true}
-    becomes {"Key1.SubKey1": "val1", "Key1.SubKey2": "val2", "Key2": true}
-    """
-    items = []
-    for k, v in nested_json.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_json(v, new_key, sep=sep).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
-
-def aggregate_data(json_list):
-    """
-    Flatten each JSON and collect values in a dict of lists:
-        {
-          "Key1.SubKey1": [val1, val2, ...],
-          "Key2": [val3, val4, ...],
-          ...
-        }
-    """
-    aggregated = defaultdict(list)
-    for j in json_list:
-        flat_j = flatten_json(j)
-        for key, val in flat_j.items():
-            aggregated[key].append(val)
-    return aggregated
-
-def is_numeric(val):
-    return isinstance(val, (int, float))
-
-def can_be_boolean(val):
-    """
-    Returns True if val is either a Python bool or a string "Yes"/"No" (case-insensitive).
-    """
-    if isinstance(val, bool):
-        return True
-    if isinstance(val, str) and val.strip().lower() in ["yes", "no"]:
-        return True
-    return False
-
-def coerce_to_boolean(val):
-    """
-    Convert Python bool or "Yes"/"No" string to a Python bool.
-    - "Yes" => True
-    - "No"  => False
-    """
-    if isinstance(val, bool):
-        return val
-    elif isinstance(val, str):
-        return (val.strip().lower() == "yes")
-    # Fallback
-    return False
-
 def to_string(val):
     # Convert any non-string to string if needed
     return str(val)
@@ -139,7 +80,7 @@ st.markdown("""
 
 @st.cache_data(show_spinner=False)
 def get_insights_cached(values):
-    return azure_oai.get_insights(values)
+    return insights.get_insights(values)
 
 def is_valid_analysis(data):
     """
@@ -172,50 +113,34 @@ if not all_prompt_files:
     st.stop()
 
 selected_prompt_txt = st.selectbox("Select Persona:", all_prompt_files)
-# 2. Load data for that prompt
-llm_analysis = azure_storage.list_llmanalysis(selected_prompt_txt)
-# Parse the JSON input
-all_jsons = []
-if llm_analysis:
-    for file in llm_analysis:
-        try:
-            data = azure_storage.read_llm_analysis(selected_prompt_txt, file)
-            all_jsons.append(data)
-        except Exception as e:
-            st.error(f"Error reading {file}: {e}")
-
-# Aggregate all JSON data
-if len(all_jsons) == 0:
+# 2. Load the persona's analysis snapshot (one row per call, flattened keys)
+snapshot, errors = analysis_snapshot.load_snapshot(
+    selected_prompt_txt, prefixes=(analysis_snapshot.ANALYSIS_PREFIX,)
+)
+for file, error in errors:
+    st.error(f"Error reading {file}: {error}")
+
+if snapshot.empty:
     st.warning("⚠️  No Persona or calls have been analyzed yet.")
     st.stop()
 
-aggregated = aggregate_data(all_jsons)
+# One column per key; calls where a key is missing hold None
+analysis = analysis_snapshot.strip_prefix(snapshot, analysis_snapshot.ANALYSIS_PREFIX)
+analysis = analysis.dropna(axis=1, how="all")
+kinds = analysis_frame.infer_kinds(analysis)
 
 # Create tabs for each key
-keys = list(aggregated.keys())
+keys = list(analysis.columns)
 tabs = st.tabs(keys)
 
 for i, key in enumerate(keys):
-    values = aggregated[key]
+    values = analysis[key].dropna()
     with tabs[i]:
 
-        # Classification
-        numeric_values = [v for v in values if is_numeric(v)]
-        bool_candidates = [v for v in values if can_be_boolean(v)]
-
         # 1) All numeric?
-        if len(numeric_values) == len(values):
-               # Convert list to a NumPy array of ints
-            arr = np.array(numeric_values, dtype=int)
-            
-            # Get unique values and their counts
-            unique_vals, counts = np.unique(arr, return_counts=True)
-            
-            # Prepare a DataFrame
-            chart_data = pd.DataFrame({
-                "Value": unique_vals,
-                "Count": counts
-            })
+        if kinds[key] == analysis_frame.NUMERIC:
+            # Count each distinct value (as int)
+            chart_data = analysis_frame.value_counts(values)
             
             # Create an Altair bar chart with a different color for each bin
             chart = alt.Chart(chart_data).mark_bar().encode(
@@ -230,9 +155,9 @@ for i, key in enumerate(keys):
             
             # Display the chart in Streamlit
             st.altair_chart(chart, use_container_width=True)
-        elif len(bool_candidates) == len(values):
-            actual_bool_values = [coerce_to_boolean(v) for v in values]
-            true_count = sum(actual_bool_values)
+        elif kinds[key] == analysis_frame.BOOLEAN:
+            actual_bool_values = analysis_frame.coerce_boolean(values)
+            true_count = int(actual_bool_values.sum())
             false_count = len(actual_bool_values) - true_count
 
             st.write(f"**True (Yes)**: {true_count}, **False (No)**: {false_count}")
@@ -246,8 +171,7 @@ for i, key in enumerate(keys):
 
         # 3) Otherwise, treat as text
         else:
-            insights = get_insights_cached(values)
-            st.write(insights)
+            st.write(get_insights_cached(values.tolist()))
             st.write("---")
 
 # -------------------------------------------------------------------------
@@ -1,9 +1,8 @@
 import streamlit as st
-import os
 import json
 from datetime import datetime
 # Import your azure storage helpers
-from services import azure_storage
+from services import azure_storage, analysis_snapshot, analysis_schema
 
 
 
@@ -94,14 +93,6 @@ def display_ai_evaluation(ground_truth, param_key, ai_evaluation):
                 unsafe_allow_html=True
             )
 
-def parse_call_id_from_filename(filename: str) -> str:
-    """
-    Given a filename like 'call123.json', extract call123 as the ID 
-    (or remove .json). Adjust logic if your naming differs.
-    """
-    return os.path.splitext(filename)[0]
-
-
 # -------------------- PARAMETERS ANALYSIS --------------------
 st.markdown("### 🎯 Call Details")
 
@@ -113,27 +104,26 @@ if not prompt_list:
 
 selected_prompt = st.selectbox("Select A Persona", prompt_list, format_func=lambda x: x )
 
-all_analysis_files = azure_storage.list_llmanalysis(selected_prompt)
-analysis_files = [f for f in all_analysis_files if f.endswith(".json")]
+# One snapshot download serves every call of the persona
+snapshot, _ = analysis_snapshot.load_snapshot(selected_prompt, columns=["analysis_json", "ground_truth_json"])
 
-if not analysis_files:
+if snapshot.empty:
     st.warning("No Call Analysis found for this Persona.")
     st.stop()
 
-# Convert each filename into a "call_id"
-call_ids = [parse_call_id_from_filename(f) for f in analysis_files]
+call_ids = snapshot["call_id"].tolist()
 selected_call_id = st.selectbox("Select Call ID", call_ids)
 
 # --- Main Content ---
-analysis_filename = f"{selected_call_id}.json"  # e.g. "call123.json"
-analysis_data = azure_storage.read_llm_analysis(selected_prompt, analysis_filename)
+selected_row = snapshot[snapshot["call_id"] == selected_call_id].iloc[0]
+analysis_data = json.loads(selected_row["analysis_json"])
 
 if not analysis_data:
     st.warning(f"No data found for Call ID {selected_call_id}")
     st.stop()
 
-eval_filename = f"{selected_call_id}.json"
-ground_truth = azure_storage.read_eval(selected_prompt, eval_filename)
+ground_truth_json = selected_row["ground_truth_json"]
+ground_truth = json.loads(ground_truth_json) if isinstance(ground_truth_json, str) else {}
 
 # --- Sidebar Controls ---
 with st.sidebar:   
@@ -155,11 +145,10 @@ for i, param_key in enumerate(param_keys):
         # Retrieve the analysis result for the parameter
         result = analysis_data.get(param_key, "N/A")
 
-        # Check if the result is a dictionary with score and explanation
+        # Check if the result is a dictionary with score and explanation (keys are lowercased when stored)
         if isinstance(result, dict):
-            lower_result = {k.lower(): v for k, v in result.items()}
-            ai_evaluation = lower_result.get("score", "N/A")
-            ai_explanation = lower_result.get("explanation", "N/A")
+            ai_evaluation = result.get(analysis_schema.SCORE_KEY, "N/A")
+            ai_explanation = result.get(analysis_schema.EXPLANATION_KEY, "N/A")
         else:
             ai_evaluation = result
             ai_explanation = "N/A"  # or handle differently if needed
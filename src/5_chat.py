@@ -53,29 +53,6 @@ def build_system_prompt(persona, provided_context):
     )
 
 
-def load_llm_analysis(prompt_file):
-    """
-    Load LLM analysis JSON documents from Azure Storage.
-
-    Args:
-        prompt_file (str): The filename used to fetch the analysis documents.
-
-    Returns:
-        list: A list of JSON documents.
-    """
-    llm_analysis = azure_storage.list_llmanalysis(prompt_file)
-    print(f"Found {len(llm_analysis)} analysis documents.")
-    all_jsons = []
-    if llm_analysis:
-        for file in llm_analysis:
-            try:
-                data = azure_storage.read_llm_analysis(prompt_file, file)
-                all_jsons.append(data)
-            except Exception as e:
-                st.error(f"❌ Error reading {file}: {e}")
-    return all_jsons
-
-
 # ---------------- Sidebar: Prompt Selection and Index Creation ----------------
 st.header("👤 Chat with your calls")
 
@@ -105,13 +82,13 @@ index_name = selected_prompt_txt.split('.')[0]
 button_text = "🔄 Re-Index your Calls" if azure_search.index_exists(index_name) else "🗂️ Index Your Calls"
 
 if st.button(button_text):
-    all_jsons = load_llm_analysis(selected_prompt_txt)
-    if not all_jsons or len(all_jsons) == 0:
+    if not azure_storage.list_llmanalysis(selected_prompt_txt):
         st.warning("⚠️ No analysis documents found for re-indexing.")
     else:
-        message, success = azure_search.load_json_into_azure_search(index_name, all_jsons)
+        # Only new or changed analyses are embedded; deleted calls are dropped from the index.
+        message, success = azure_search.sync_llm_analysis_index(index_name, selected_prompt_txt)
         if success:
-            st.success(f"✅ Index '{index_name}' created/re-indexed successfully.")
+            st.success(f"✅ Index '{index_name}' created/re-indexed successfully. {message}")
         else:
             st.error(f"❌ Error creating/updating index: '{message}'.")
 
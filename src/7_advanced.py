@@ -2,11 +2,9 @@ import pandas as pd
 import json
 import streamlit as st
 import os
-from sklearn.metrics import accuracy_score, precision_score, f1_score
-from collections import defaultdict
 
 # Adjust path as needed to import your modules
-from services import azure_storage
+from services import azure_storage, azure_evals, analysis_snapshot, analysis_frame
 
 st.markdown(
     """
@@ -33,100 +31,24 @@ st.markdown(
 ############################
 # 1. Helper Functions
 ############################
-def flatten_json(nested_json, parent_key='', sep='.'):
-    """
-    Recursively flattens a nested JSON/dict.
-    E.g. {"Key1": {"SubKey1": "val1", "SubKey2": "val2"}, "Key2": true}
-    becomes {"Key1.SubKey1": "val1", "Key1.SubKey2": "val2", "Key2": true}
-    """
-    items = []
-    for k, v in nested_json.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_json(v, new_key, sep=sep).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
-
-
-def aggregate_data(json_list):
-    """
-    Flatten each JSON and collect values in a dict of lists:
-        {
-          "Key1.SubKey1": [val1, val2, ...],
-          "Key2": [val3, val4, ...],
-          ...
-        }
-    """
-    aggregated = defaultdict(list)
-    for j in json_list:
-        flat_j = flatten_json(j)
-        for key, val in flat_j.items():
-            aggregated[key].append(val)
-    return aggregated
-
-def convert_value(x):
-
-    # Return booleans unchanged.
-    if isinstance(x, bool):
-        return x
-
-    # Leave integers unchanged.
-    if isinstance(x, int):
-        return x
-
-    # Process floats: only 1.0 and 0.0 are recognized.
-    if isinstance(x, float):
-        if x == 1.0:
-            return True
-        elif x == 0.0:
-            return False
-        else:
-            return None
-
-    # Process strings.
-    if isinstance(x, str):
-        s = x.strip().lower()
-        mapping = {"yes": True, "true": True, "no": False, "false": False}
-        if s in mapping:
-            return mapping[s]
-        # Also allow strings that are numeric representations.
-        try:
-            num = int(s)
-            if num == 1:
-                return True
-            elif num == 0:
-                return False
-        except ValueError:
-            return None
-        return None
-
-    # For other types, attempt to convert to a string and process.
-    try:
-        s = str(x).strip().lower()
-    except Exception:
-        return None
-    if s in ("yes", "true"):
-        return True
-    elif s in ("no", "false"):
-        return False
-    return None
-
 def get_eval_data(selected_prompt_name):
-    llm_analysis = azure_storage.list_llmanalysis(selected_prompt_name)
+    snapshot, errors = analysis_snapshot.load_snapshot(
+        selected_prompt_name,
+        columns=["eval_etag"],
+        prefixes=(analysis_snapshot.ANALYSIS_PREFIX, analysis_snapshot.GROUND_TRUTH_PREFIX),
+    )
+    for file, error in errors:
+        st.error(f"Error reading {file}: {error}")
+    # Only calls that have ground truth are evaluated
+    snapshot = snapshot[snapshot["eval_etag"].notna()]
+    analysis = analysis_snapshot.strip_prefix(snapshot, analysis_snapshot.ANALYSIS_PREFIX)
+    ground_truth = analysis_snapshot.strip_prefix(snapshot, analysis_snapshot.GROUND_TRUTH_PREFIX)
+    ground_truth = ground_truth[[c for c in ground_truth.columns if c.lower() != "call id"]]
+    ground_truth = ground_truth.rename(columns=lambda c: f"{c}.gt")
+
     all_jsons = []
-    if llm_analysis:
-        for file in llm_analysis:
-            try:
-                data = azure_storage.read_llm_analysis(selected_prompt_name, file)
-                ground_truth = azure_storage.read_eval(selected_prompt_name, file)
-                for key, value in ground_truth.items():
-                    if key.lower() == "call id":
-                        continue
-                    data[f"{key}.gt"] = value
-                    all_jsons.append(data) # we should ignore rows that don't have ground truth
-            except Exception as e:
-                st.error(f"Error reading {file}: {e}")
+    for record in pd.concat([analysis, ground_truth], axis=1).to_dict("records"):
+        all_jsons.append({key: value for key, value in record.items() if value is not None})
     return all_jsons
 
 ############################
@@ -243,6 +165,7 @@ if uploaded_eval_file is not None:
 
     if success_count:
         st.success(f"Successfully uploaded {success_count} evaluation file(s) to storage.")
+        analysis_snapshot.refresh_snapshot(selected_eval_prompt)
 
 st.markdown("---")
 
@@ -256,51 +179,38 @@ if len(eval_data) == 0:
     st.warning("⚠️  No Persona or calls have been analyzed yet.")
     st.stop()
 
-aggregated = aggregate_data(eval_data)
-st.markdown(f"**Total records that have ground truth**: {len(aggregated)}")
-df = pd.DataFrame({k: pd.Series(v) for k, v in aggregated.items()})
+# One row per call, so predictions and ground truth stay aligned; integer scores
+# of calls with a missing value stay integers instead of becoming floats
+df = analysis_frame.normalize_records(eval_data).convert_dtypes()
+st.markdown(f"**Total records that have ground truth**: {len(df)}")
 
 # Define the parameters to evaluate.
 parameters = azure_storage.read_prompt_config(selected_eval_prompt) or []
 cols = st.columns(len(parameters))
 
-for i, param in enumerate(parameters):
-    pred_col = f"{param}.score"
-    truth_col = f"{param}.gt"
+# Accuracy, precision, recall, F1 and confusion counts for every parameter at once
+metrics, confusion, missing = azure_evals.evaluate_parameters(df, parameters)
 
+for i, param in enumerate(parameters):
     with cols[i]:
         st.write(f"### {param}")
-        if pred_col not in df.columns or truth_col not in df.columns:
+        if param in missing:
             st.error(f"Columns for {param} not found.")
             continue
-        
-        # Convert the values using your conversion function.
-        y_true = df[truth_col].apply(convert_value)
-        y_pred = df[pred_col].apply(convert_value)
-
-        # Drop rows where conversion failed.
-        valid_mask = y_true.notnull() & y_pred.notnull()
-        y_true = y_true[valid_mask]
-        y_pred = y_pred[valid_mask]
 
-        if len(y_true) == 0:
+        result = metrics.loc[param]
+        if result["total"] == 0:
             st.warning(f"No valid data for {param}")
         else:
-            # Compute accuracy (works regardless of averaging).
-            acc = accuracy_score(y_true, y_pred)
-
-            # If the first elements in both series are booleans, assume binary classification.
-            # Otherwise (e.g. if integers are used), assume it's not binary.
-            if isinstance(y_true.iloc[0], bool) and isinstance(y_pred.iloc[0], bool):
-                # Binary classification.
-                prec = precision_score(y_true, y_pred, average='binary', pos_label=True, zero_division=0)
-                f1 = f1_score(y_true, y_pred, average='binary', pos_label=True, zero_division=0)
-            else:
-                # Assume multi-class (non-binary) when integers are used.
-                prec = precision_score(y_true, y_pred, average='weighted', zero_division=0)
-                f1 = f1_score(y_true, y_pred, average='weighted', zero_division=0)
-
             # Display the metrics.
-            st.metric("Accuracy", f"{acc:.2f}")
-            st.metric("Precision", f"{prec:.2f}")
-            st.metric("F1 Score", f"{f1:.2f}")
+            st.metric("Accuracy", f"{result['accuracy']:.2f}")
+            st.metric("Precision", f"{result['precision']:.2f}")
+            st.metric("Recall", f"{result['recall']:.2f}")
+            st.metric("F1 Score", f"{result['f1']:.2f}")
+            with st.expander("Confusion counts"):
+                st.dataframe(
+                    confusion.loc[param].rename("Count").reset_index()
+                    .astype({"y_true": str, "y_pred": str})
+                    .rename(columns={"y_true": "Ground truth", "y_pred": "Prediction"}),
+                    hide_index=True,
+                )
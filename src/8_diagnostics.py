@@ -2,6 +2,7 @@ import os
 import streamlit as st
 from services import azure_storage
 from services import azure_oai
+from services import audio_cache, embedding_cache, token_accounting
 
 
 def check_azure_openai():
@@ -106,6 +107,71 @@ def check_azure_search():
         return False, f"Error calling Azure Search: {str(e)}"
 
 
+def check_audio_cache():
+    """
+    Report the local audio cache footprint and hit rate.
+    """
+    try:
+        stats = audio_cache.get_stats()
+        return True, (
+            f"{stats['files']} files, {stats['bytes'] / 1024 ** 2:.1f} MB of "
+            f"{stats['max_bytes'] / 1024 ** 2:.0f} MB used. "
+            f"Hits: {stats['hits']}, misses: {stats['misses']}, evictions: {stats['evictions']} "
+            f"(hit rate {stats['hit_rate']:.0%})."
+        )
+    except Exception as e:
+        return False, f"Error reading the local audio cache: {str(e)}"
+
+
+def check_embedding_cache():
+    """
+    Report the embedding cache hit rate.
+    """
+    try:
+        stats = embedding_cache.get_stats()
+        return True, (
+            f"Memory hits: {stats['memory_hits']}, disk hits: {stats['disk_hits']}, "
+            f"misses: {stats['misses']} (hit rate {stats['hit_rate']:.0%}). "
+            f"{stats['memory_items']} vectors held in memory, cache file '{embedding_cache.EMBEDDING_CACHE_PATH}'."
+        )
+    except Exception as e:
+        return False, f"Error reading the embedding cache: {str(e)}"
+
+
+def check_config_cache():
+    """
+    Report how often config and prompt reads were served without a download.
+    """
+    try:
+        stats = azure_storage.get_text_cache_stats()
+        return True, (
+            f"{stats['items']} config/prompt blobs cached for {azure_storage.CONFIG_CACHE_TTL:.0f}s. "
+            f"Served from memory: {stats['hits']}, revalidated unchanged: {stats['revalidated']}, "
+            f"downloaded: {stats['downloads']}."
+        )
+    except Exception as e:
+        return False, f"Error reading the config cache: {str(e)}"
+
+
+def check_token_usage():
+    """
+    Report prompt/completion tokens and latency per deployment since start.
+    """
+    try:
+        stats = token_accounting.get_token_stats()
+        if not stats:
+            return True, "No chat calls recorded yet."
+        return True, " ".join(
+            f"{deployment}: {s['calls']} calls, {s['prompt_tokens']} prompt + {s['completion_tokens']} completion tokens "
+            f"({s['cache_hit_rate']:.0%} of prompt tokens cached), "
+            f"{s['tokens_last_minute']} tokens in the last minute, avg latency {s['avg_latency_seconds']:.1f}s, "
+            f"{s['truncated_calls']} truncated."
+            for deployment, s in stats.items()
+        )
+    except Exception as e:
+        return False, f"Error reading token usage: {str(e)}"
+
+
 def check_local_misc_file():
     # check if .misc/clean_transcription.txt exists
     #check if .misc/whisper_prompt.txt exists
@@ -135,6 +201,38 @@ with st.expander("Check Local Misc Files", expanded=True):
     else:
         st.error(misc_message)
 
+# Check local audio cache
+with st.expander("Check Local Audio Cache", expanded=True):
+    cache_ok, cache_message = check_audio_cache()
+    if cache_ok:
+        st.success(cache_message)
+    else:
+        st.error(cache_message)
+
+# Check embedding cache
+with st.expander("Check Embedding Cache", expanded=True):
+    embedding_cache_ok, embedding_cache_message = check_embedding_cache()
+    if embedding_cache_ok:
+        st.success(embedding_cache_message)
+    else:
+        st.error(embedding_cache_message)
+
+# Check config and prompt cache
+with st.expander("Check Config and Prompt Cache", expanded=True):
+    config_cache_ok, config_cache_message = check_config_cache()
+    if config_cache_ok:
+        st.success(config_cache_message)
+    else:
+        st.error(config_cache_message)
+
+# Check token usage
+with st.expander("Check Token Usage", expanded=True):
+    tokens_ok, tokens_message = check_token_usage()
+    if tokens_ok:
+        st.success(tokens_message)
+    else:
+        st.error(tokens_message)
+
 # Check Azure OpenAI
 with st.expander("Check Azure OpenAI Endpoint", expanded=True):
     openai_ok, openai_message = check_azure_openai()
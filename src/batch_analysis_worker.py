@@ -0,0 +1,37 @@
+"""
+Offline persona analysis through the Azure OpenAI Batch API.
+
+Plans the calls a persona still has to analyze (like the Personas page), writes
+them as JSONL request files under BATCH_DIR, submits one batch job per file,
+polls until the jobs finish and stores every analysis under
+/LLM_ANALYSIS_FOLDER/<persona>/<call>.json. Batch jobs run at the Batch API's
+lower price and throughput quota instead of the online deployment's.
+
+Run with: python batch_analysis_worker.py <persona.txt> [--all]
+Resume an interrupted run with: python batch_analysis_worker.py <persona.txt> --resume <run_dir>
+Set BATCH_API_BASE_URL to send the batch calls to an OpenAI-compatible (e.g. local mock) endpoint.
+"""
+import sys
+import signal
+import threading
+
+from services import batch_analysis
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    persona_prompt = args[0]
+    run_dir = args[args.index("--resume") + 1] if "--resume" in args else None
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    print(batch_analysis.run_batch_analysis(
+        persona_prompt,
+        only_stale="--all" not in args,
+        run_dir=run_dir,
+        stop_event=stop,
+    ))
@@ -0,0 +1,70 @@
+"""
+Container entry point: runs the transcription worker and the Streamlit UI side by side.
+
+If either process exits, the other one is stopped and the entry point exits with
+the status of the process that stopped first, so the container is restarted
+instead of serving a UI whose queued jobs are never processed. SIGTERM / SIGINT
+stop both processes.
+
+Run with: python entrypoint.py
+"""
+import sys
+import time
+import signal
+import subprocess
+
+# Seconds each process gets to shut down before it is killed
+STOP_TIMEOUT_SECONDS = 30
+
+PROCESSES = {
+    "transcription worker": [sys.executable, "transcription_worker.py"],
+    "streamlit": [sys.executable, "-m", "streamlit", "run", "main.py", "--server.port=80", "--server.address=0.0.0.0"],
+}
+
+
+def _stop(processes, timeout=STOP_TIMEOUT_SECONDS):
+    for process in processes.values():
+        if process.poll() is None:
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for name, process in processes.items():
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            print(f"{name} did not stop within {timeout}s, killing it")
+            process.kill()
+            process.wait()
+
+
+def supervise(commands=PROCESSES, poll_interval=1.0, stop_timeout=STOP_TIMEOUT_SECONDS):
+    """
+    Start every command and wait until one of them exits or a stop signal arrives,
+    then stop the others. Returns the exit status to leave with.
+    """
+    stopping = []
+    previous = {
+        signum: signal.signal(signum, lambda signum, frame: stopping.append(signum))
+        for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+
+    processes = {name: subprocess.Popen(command) for name, command in commands.items()}
+    status = 0
+    try:
+        while not stopping:
+            exited = [(name, process.returncode) for name, process in processes.items() if process.poll() is not None]
+            if exited:
+                name, status = exited[0]
+                print(f"{name} exited with status {status}, stopping the container")
+                # A process that exits cleanly on its own is still a failure of the container
+                status = status or 1
+                break
+            time.sleep(poll_interval)
+    finally:
+        _stop(processes, stop_timeout)
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(supervise())
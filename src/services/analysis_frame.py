@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Column kinds returned by infer_kinds()
+NUMERIC = "numeric"
+BOOLEAN = "boolean"
+TEXT = "text"
+
+_BOOLEAN_STRINGS = {"yes": True, "no": False}
+
+
+def flatten_json(nested_json, parent_key="", sep="."):
+    """
+    Recursively flattens a nested JSON/dict.
+    E.g. {"Key1": {"SubKey1": "val1", "SubKey2": "val2"}, "Key2": true}
+    becomes {"Key1.SubKey1": "val1", "Key1.SubKey2": "val2", "Key2": true}
+    """
+    items = {}
+    for k, v in nested_json.items():
+        new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        if isinstance(v, dict):
+            items.update(flatten_json(v, new_key, sep=sep))
+        else:
+            items[new_key] = v
+    return items
+
+
+def normalize_records(records, sep="."):
+    """
+    Flatten a batch of analysis records into one row-aligned frame in a single
+    pass: one row per record, one column per flattened key, missing keys as NaN.
+    """
+    # Flattening each dict and building the frame from records is faster than
+    # pd.json_normalize, which walks every record through generic nested handling.
+    return pd.DataFrame.from_records([flatten_json(record, sep=sep) for record in records])
+
+
+def column_kind(values: pd.Series) -> str:
+    """
+    Classify a column from its non-null values:
+    - numeric: every value is an int or float (booleans excluded)
+    - boolean: every value is a bool or a "Yes"/"No" string (any case)
+    - text: anything else
+    """
+    values = values.dropna()
+    if values.empty:
+        return TEXT
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return BOOLEAN
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return NUMERIC
+    if pd.api.types.is_string_dtype(values.dtype) and not pd.api.types.is_object_dtype(values.dtype):
+        words = values.str.strip().str.lower()
+        return BOOLEAN if words.isin(list(_BOOLEAN_STRINGS)).all() else TEXT
+
+    types = values.map(type)
+    is_bool = types.eq(bool) | types.eq(np.bool_)
+    if is_bool.all():
+        return BOOLEAN
+    if types.isin([int, float, np.int64, np.float64]).all():
+        return NUMERIC
+    is_str = types.eq(str)
+    if (is_bool | is_str).all():
+        words = values[is_str].str.strip().str.lower()
+        if words.isin(list(_BOOLEAN_STRINGS)).all():
+            return BOOLEAN
+    return TEXT
+
+
+def infer_kinds(df: pd.DataFrame) -> dict:
+    """
+    {column: kind} for every column of a normalized frame.
+    """
+    return {column: column_kind(df[column]) for column in df.columns}
+
+
+def coerce_boolean(values: pd.Series) -> pd.Series:
+    """
+    Map bools and "Yes"/"No" strings to booleans; anything else becomes False.
+    """
+    values = values.dropna()
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return values.astype(bool)
+    is_bool = values.map(type).isin([bool, np.bool_])
+    words = values.where(~is_bool).astype(str).str.strip().str.lower().map(_BOOLEAN_STRINGS)
+    return values.where(is_bool, words).fillna(False).astype(bool)
+
+
+def value_counts(values: pd.Series) -> pd.DataFrame:
+    """
+    Counts of each distinct numeric value (as int), sorted by value.
+    """
+    counts = values.dropna().astype(int).value_counts().sort_index()
+    return pd.DataFrame({"Value": counts.index.to_numpy(), "Count": counts.to_numpy()})
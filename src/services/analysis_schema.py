@@ -0,0 +1,141 @@
+import json
+import threading
+from typing import List, Type, Union
+
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+from services import azure_storage
+
+# Keys of a KPI result, stored lowercase whatever case the model used
+SCORE_KEY = "score"
+EXPLANATION_KEY = "explanation"
+
+_models = {}  # tuple of KPI names -> generated model
+_models_lock = threading.Lock()
+
+
+class AnalysisValidationError(ValueError):
+    """
+    Raised when an analysis is not a JSON object or lacks one of the persona's KPIs.
+    """
+
+
+class KPIResult(BaseModel):
+    """
+    One KPI of an analysis: the value compared with ground truth, and why.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    score: Union[int, float, bool, str]
+    explanation: str
+
+
+class AdditionalField(BaseModel):
+    """
+    Any other key the persona asks for (structured outputs allow no free-form keys).
+    The value is JSON text so nested objects and lists keep their structure.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    name: str
+    value: str = Field(description='The value as JSON, e.g. "text", 3, true, ["a", "b"] or {"key": "value"}')
+
+
+def build_analysis_model(kpis) -> Type[BaseModel]:
+    """
+    Pydantic model of a persona's analysis: a summary, one KPIResult per KPI
+    (keyed by the KPI name) and the persona's other keys as additional_fields.
+    Models are built once per distinct KPI list.
+    """
+    kpis = tuple(kpi.strip() for kpi in kpis if kpi and kpi.strip())
+    with _models_lock:
+        if kpis not in _models:
+            # KPI names are free text, so fields get safe names and the KPI name as alias
+            fields = {
+                f"kpi_{i}": (KPIResult, Field(alias=kpi)) for i, kpi in enumerate(kpis)
+            }
+            # A KPI named like a base field replaces it
+            base = {"summary": (str, ...), "additional_fields": (List[AdditionalField], ...)}
+            for name in kpis:
+                base.pop(name, None)
+            _models[kpis] = create_model(
+                "CallAnalysis",
+                __config__=ConfigDict(extra="forbid", populate_by_name=True),
+                **base,
+                **fields,
+            )
+        return _models[kpis]
+
+
+def read_kpis(prompt_name: str) -> list:
+    """
+    The KPI names in a persona's __config.txt (empty when it has none).
+    """
+    return [kpi.strip() for kpi in (azure_storage.read_prompt_config(prompt_name) or []) if kpi.strip()]
+
+
+def schema_json(kpis) -> str:
+    """
+    The analysis schema for a KPI list as canonical JSON ("" without KPIs), so a
+    change to the KPIs or the schema can be detected by hashing it.
+    """
+    kpis = [kpi for kpi in kpis if kpi and kpi.strip()]
+    if not kpis:
+        return ""
+    return json.dumps(build_analysis_model(kpis).model_json_schema(), sort_keys=True)
+
+
+def response_format(model: Type[BaseModel]) -> dict:
+    """
+    The structured-output response_format for a model, for requests not sent through
+    beta.chat.completions.parse (e.g. Batch API request files).
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "schema": model.model_json_schema(), "strict": True},
+    }
+
+
+def to_record(parsed: BaseModel) -> dict:
+    """
+    Plain analysis dict from a parsed model, in the layout the pages read:
+    KPIs under their names and additional fields as top-level keys, with their
+    JSON values decoded (a value that is not JSON is kept as text).
+    """
+    record = parsed.model_dump(by_alias=True)
+    for field in record.pop("additional_fields", []):
+        try:
+            value = json.loads(field["value"])
+        except ValueError:
+            value = field["value"]
+        record.setdefault(field["name"], value)
+    return record
+
+
+def validate_record(analysis, kpis=()) -> dict:
+    """
+    Check an analysis before it is stored or loaded: it must be a JSON object
+    (a string is parsed first), and every KPI in kpis must be present with a
+    score. Score/explanation keys of nested objects are lowercased so readers
+    need no case handling. Returns the normalized dict; raises
+    AnalysisValidationError otherwise.
+    """
+    if isinstance(analysis, str):
+        try:
+            analysis = json.loads(analysis)
+        except ValueError as e:
+            raise AnalysisValidationError(f"Analysis is not valid JSON: {e}")
+    if not isinstance(analysis, dict):
+        raise AnalysisValidationError(f"Analysis is a {type(analysis).__name__}, expected a JSON object.")
+
+    record = {}
+    for key, value in analysis.items():
+        if isinstance(value, dict):
+            value = {
+                k.lower() if k.lower() in (SCORE_KEY, EXPLANATION_KEY) else k: v for k, v in value.items()
+            }
+        record[key] = value
+    for kpi in kpis:
+        if not isinstance(record.get(kpi), dict) or SCORE_KEY not in record[kpi]:
+            raise AnalysisValidationError(f"Analysis has no score for KPI '{kpi}'.")
+    return record
@@ -0,0 +1,191 @@
+import io
+import os
+import json
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from services import azure_storage, analysis_frame, analysis_schema
+
+load_dotenv()
+
+# Snapshots live under /ANALYSIS_SNAPSHOT_FOLDER/<prompt_no_ext>.parquet
+ANALYSIS_SNAPSHOT_FOLDER = os.getenv("ANALYSIS_SNAPSHOT_FOLDER", "snapshots")
+
+# Flattened analysis keys and ground-truth keys are stored as columns with these
+# prefixes. Values are JSON-encoded, since the same key can hold numbers, booleans
+# or text depending on the call.
+ANALYSIS_PREFIX = "analysis."
+GROUND_TRUTH_PREFIX = "gt."
+# One row per call: its id, the etags the row was built from and the raw documents
+META_COLUMNS = ["call_id", "analysis_etag", "eval_etag", "analysis_json", "ground_truth_json"]
+# Stored in the Parquet metadata; snapshots written with another version are rebuilt
+# (2: analyses are validated and their score/explanation keys lowercased)
+SNAPSHOT_VERSION = "2"
+
+_snapshots = {}  # snapshot blob name -> {"etag", "table"}
+_snapshots_lock = threading.Lock()
+_refresh_locks = {}
+
+
+def _snapshot_name(prompt_name: str) -> str:
+    return f"{prompt_name.split('.')[0]}.parquet"
+
+
+def _build_row(call_id, analysis_etag, analysis, eval_etag, ground_truth):
+    row = {
+        "call_id": call_id,
+        "analysis_etag": analysis_etag,
+        "eval_etag": eval_etag,
+        "analysis_json": json.dumps(analysis),
+        "ground_truth_json": json.dumps(ground_truth) if ground_truth is not None else None,
+    }
+    for key, value in analysis_frame.flatten_json(analysis).items():
+        row[f"{ANALYSIS_PREFIX}{key}"] = json.dumps(value)
+    for key, value in analysis_frame.flatten_json(ground_truth or {}).items():
+        row[f"{GROUND_TRUTH_PREFIX}{key}"] = json.dumps(value)
+    return row
+
+
+def _load_table(prompt_name: str):
+    """
+    The persona's snapshot as a pyarrow Table, downloaded only when its etag changed.
+    """
+    name = _snapshot_name(prompt_name)
+    entry = azure_storage.get_blob_index(ANALYSIS_SNAPSHOT_FOLDER).get(f"{ANALYSIS_SNAPSHOT_FOLDER}/{name}")
+    etag = entry["etag"] if entry else None
+    with _snapshots_lock:
+        cached = _snapshots.get(name)
+    if cached and cached["etag"] == etag:
+        return cached["table"]
+
+    data = azure_storage.read_blob_bytes(name, ANALYSIS_SNAPSHOT_FOLDER) if etag else None
+    table = pq.read_table(io.BytesIO(data)) if data else None
+    if table is None or (table.schema.metadata or {}).get(b"version") != SNAPSHOT_VERSION.encode():
+        table = pa.table({column: pa.array([], pa.string()) for column in META_COLUMNS})
+    with _snapshots_lock:
+        _snapshots[name] = {"etag": etag, "table": table}
+    return table
+
+
+def _save_table(prompt_name: str, table):
+    name = _snapshot_name(prompt_name)
+    table = table.replace_schema_metadata({"version": SNAPSHOT_VERSION})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    azure_storage.upload_blob(buffer.getvalue(), name, ANALYSIS_SNAPSHOT_FOLDER)
+    etag = azure_storage.get_blob_etag(name, ANALYSIS_SNAPSHOT_FOLDER)
+    with _snapshots_lock:
+        _snapshots[name] = {"etag": etag, "table": table}
+
+
+def refresh_snapshot(prompt_name: str, relist: bool = True):
+    """
+    Bring the persona's snapshot up to date with blob storage. Only calls whose
+    analysis or eval etag changed are read; removed analyses are dropped.
+    With relist=False the analysis and eval versions come from the blob index
+    (listed at most once per BLOB_INDEX_TTL) instead of fresh listings.
+    Returns (table, errors) where errors is a list of (file_name, error) for
+    blobs that could not be read (their previous row, if any, is kept).
+    """
+    with _snapshots_lock:
+        lock = _refresh_locks.setdefault(_snapshot_name(prompt_name), threading.Lock())
+
+    with lock:
+        table = _load_table(prompt_name)
+        existing = {
+            call_id: (analysis_etag, eval_etag)
+            for call_id, analysis_etag, eval_etag in zip(
+                table.column("call_id").to_pylist(),
+                table.column("analysis_etag").to_pylist(),
+                table.column("eval_etag").to_pylist(),
+            )
+        }
+        analyses = {
+            f: etag for f, etag in azure_storage.get_llmanalysis_versions(prompt_name, refresh=relist).items()
+            if f.endswith(".json")
+        }
+        evals = azure_storage.get_eval_versions(prompt_name, refresh=relist)
+        wanted = {f[: -len(".json")]: (etag, evals.get(f)) for f, etag in analyses.items()}
+
+        changed = [call_id for call_id, versions in wanted.items() if existing.get(call_id) != versions]
+        removed = [call_id for call_id in existing if call_id not in wanted]
+        if not changed and not removed:
+            return table, []
+
+        files = [f"{call_id}.json" for call_id in changed]
+        errors = []
+        analysis_docs = {}
+        for file, data, error in azure_storage.read_llm_analyses(prompt_name, files):
+            if error is None:
+                # Validated once here (new analyses already were at write time), so readers get clean objects
+                try:
+                    data = analysis_schema.validate_record(data)
+                except analysis_schema.AnalysisValidationError as e:
+                    error = e
+            if error is not None:
+                errors.append((file, error))
+            else:
+                analysis_docs[file] = data
+        eval_docs = {}
+        for file, data, error in azure_storage.read_evals(prompt_name, [f for f in analysis_docs if f in evals]):
+            if error is not None:
+                errors.append((file, error))
+            else:
+                eval_docs[file] = data
+
+        rows = [
+            _build_row(file[: -len(".json")], analyses[file], data, evals.get(file) if file in eval_docs else None, eval_docs.get(file))
+            for file, data in analysis_docs.items()
+        ]
+        replaced = set(removed) | {row["call_id"] for row in rows}
+        kept = table.to_pandas()
+        kept = kept[~kept["call_id"].isin(replaced)]
+        combined = pd.concat([kept, pd.DataFrame(rows)], ignore_index=True)
+        combined = combined.sort_values("call_id", ignore_index=True).astype(object)
+        combined = combined.where(combined.notna(), None)
+
+        table = pa.Table.from_pandas(combined, schema=pa.schema([(column, pa.string()) for column in combined.columns]),
+                                     preserve_index=False)
+        _save_table(prompt_name, table)
+        return table, errors
+
+
+def load_snapshot(prompt_name: str, columns=None, prefixes=(), refresh: bool = True):
+    """
+    Load a persona's snapshot as a DataFrame with one row per analyzed call.
+    Only call_id, the exact `columns` and the columns starting with one of
+    `prefixes` are materialized; analysis and ground-truth values are decoded
+    back from JSON (missing keys are None).
+    With refresh=True the snapshot first catches up with the blob index, so
+    page reruns list nothing until BLOB_INDEX_TTL expires; writers call
+    refresh_snapshot() to fold in their changes at once.
+    Returns (DataFrame, errors) as refresh_snapshot does.
+    """
+    if refresh:
+        table, errors = refresh_snapshot(prompt_name, relist=False)
+    else:
+        table, errors = _load_table(prompt_name), []
+
+    wanted = set(columns or [])
+    selected = [
+        name for name in table.column_names
+        if name == "call_id" or name in wanted or any(name.startswith(prefix) for prefix in prefixes)
+    ]
+    df = table.select(selected).to_pandas()
+    for column in df.columns:
+        if column.startswith((ANALYSIS_PREFIX, GROUND_TRUTH_PREFIX)):
+            df[column] = df[column].map(lambda value: json.loads(value) if isinstance(value, str) else None)
+    # Give uniformly numeric / text columns a real dtype so they can be classified without per-value checks
+    return df.infer_objects(), errors
+
+
+def strip_prefix(df, prefix: str):
+    """
+    The columns of df starting with prefix, renamed without it.
+    """
+    columns = [c for c in df.columns if c.startswith(prefix)]
+    return df[columns].rename(columns=lambda c: c[len(prefix):])
@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local directory holding downloaded audio and its byte budget (default 2 GiB)
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "./tmp")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Leases older than this are left over by a crashed process and no longer pin their file
+AUDIO_CACHE_LEASE_MAX_SECONDS = float(os.getenv("AUDIO_CACHE_LEASE_MAX_SECONDS", str(6 * 3600)))
+
+TMP_SUFFIX = ".part"
+# <file name>.<token>.lease marks a cached file as in use, by this or another process
+LEASE_SUFFIX = ".lease"
+
+# file name -> size in bytes, ordered from least to most recently used
+_entries = OrderedDict()
+_lock = threading.Lock()
+_loaded = False
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _cache_file_name(blob_name: str, etag: str):
+    """
+    Content-addressed file name: a changed blob (new etag) gets a new cache entry.
+    """
+    digest = hashlib.sha256(f"{blob_name}\0{etag}".encode("utf-8")).hexdigest()[:32]
+    return digest + os.path.splitext(blob_name)[1]
+
+
+def _load():
+    """
+    Rebuild the LRU order from the files already on disk (oldest access first).
+    Must be called with _lock held.
+    """
+    global _loaded
+    if _loaded:
+        return
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    files = []
+    for entry in os.scandir(AUDIO_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith((TMP_SUFFIX, LEASE_SUFFIX)):
+            stat = entry.stat()
+            files.append((stat.st_atime, entry.name, stat.st_size))
+    for _, name, size in sorted(files):
+        _entries[name] = size
+    _loaded = True
+
+
+class CachedAudio:
+    """
+    A cached audio file pinned by a lease: it is not evicted, by this or any
+    other process sharing AUDIO_CACHE_DIR, until release() (or the end of a
+    with block, which yields the path).
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.path = os.path.abspath(os.path.join(AUDIO_CACHE_DIR, file_name))
+        self._lease = os.path.join(AUDIO_CACHE_DIR, f"{file_name}.{uuid.uuid4().hex}{LEASE_SUFFIX}")
+        with open(self._lease, "w"):
+            pass
+
+    def release(self):
+        try:
+            os.remove(self._lease)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self.path
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _leased(names=None) -> set:
+    """
+    Names of the cached files that hold a live lease (optionally only among names).
+    Stale leases are removed.
+    """
+    leased = set()
+    now = time.time()
+    for entry in os.scandir(AUDIO_CACHE_DIR):
+        if not entry.name.endswith(LEASE_SUFFIX):
+            continue
+        name = entry.name[: -len(LEASE_SUFFIX)].rsplit(".", 1)[0]
+        if names is not None and name not in names:
+            continue
+        try:
+            if now - entry.stat().st_mtime > AUDIO_CACHE_LEASE_MAX_SECONDS:
+                os.remove(entry.path)
+                continue
+        except FileNotFoundError:
+            continue
+        leased.add(name)
+    return leased
+
+
+def _remove_unleased(name: str) -> bool:
+    """
+    Delete a cached file unless it is leased. The file is moved aside before a
+    last lease check, so a reader that leased it in the meantime gets it back.
+    """
+    path = os.path.join(AUDIO_CACHE_DIR, name)
+    aside = f"{path}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return True
+    if _leased({name}):
+        os.replace(aside, path)
+        return False
+    os.remove(aside)
+    return True
+
+
+def _evict(keep: str):
+    """
+    Remove least recently used files until the cache fits its byte budget.
+    Leased files are skipped. Must be called with _lock held.
+    """
+    total = sum(_entries.values())
+    if total <= AUDIO_CACHE_MAX_BYTES:
+        return
+    leased = _leased()
+    for name in list(_entries):
+        if total <= AUDIO_CACHE_MAX_BYTES:
+            break
+        if name == keep or name in leased or not _remove_unleased(name):
+            continue
+        total -= _entries.pop(name)
+        _stats["evictions"] += 1
+
+
+def acquire(blob_name: str, etag: str, download) -> CachedAudio:
+    """
+    Return the cached file for blob_name at version etag, leased until released.
+    On a miss, download(tmp_path) is called to write the blob to a temporary
+    file, which is then atomically renamed into the cache.
+    """
+    file_name = _cache_file_name(blob_name, etag)
+    path = os.path.join(AUDIO_CACHE_DIR, file_name)
+
+    with _lock:
+        _load()
+        # Lease first, so the file cannot be evicted between this check and its use
+        cached = CachedAudio(file_name)
+        if os.path.exists(path):
+            _entries[file_name] = os.path.getsize(path)
+            _entries.move_to_end(file_name)
+            _stats["hits"] += 1
+            os.utime(path)
+            return cached
+        _entries.pop(file_name, None)
+        _stats["misses"] += 1
+
+    fd, tmp_path = tempfile.mkstemp(dir=AUDIO_CACHE_DIR, suffix=TMP_SUFFIX)
+    os.close(fd)
+    try:
+        download(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        cached.release()
+        raise
+
+    with _lock:
+        _entries[file_name] = os.path.getsize(path)
+        _entries.move_to_end(file_name)
+        _evict(keep=file_name)
+    return cached
+
+
+def get_stats():
+    """
+    Hit/miss/eviction counters plus the current footprint of the cache.
+    """
+    with _lock:
+        _load()
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+            "files": len(_entries),
+            "bytes": sum(_entries.values()),
+            "max_bytes": AUDIO_CACHE_MAX_BYTES,
+        }
@@ -0,0 +1,300 @@
+import os
+import re
+import time
+import wave
+import base64
+import threading
+from collections import deque
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Audio longer or larger than this is split before transcription
+AUDIO_SEGMENT_MAX_SECONDS = float(os.getenv("AUDIO_SEGMENT_MAX_SECONDS", "600"))
+AUDIO_SEGMENT_MAX_BYTES = int(os.getenv("AUDIO_SEGMENT_MAX_BYTES", str(24 * 1024 * 1024)))
+# Seconds shared by consecutive segments, and how far back from the target cut to look for silence
+AUDIO_SEGMENT_OVERLAP_SECONDS = float(os.getenv("AUDIO_SEGMENT_OVERLAP_SECONDS", "2"))
+AUDIO_SEGMENT_SEARCH_SECONDS = float(os.getenv("AUDIO_SEGMENT_SEARCH_SECONDS", "30"))
+# Segments of one call transcribed at the same time
+AUDIO_SEGMENT_CONCURRENCY = int(os.getenv("AUDIO_SEGMENT_CONCURRENCY", "4"))
+
+# gpt-4o-audio payloads: optional target sample rate (0 = keep) and mono conversion,
+# and the raw bytes read per base64 chunk (a multiple of 3, so chunks concatenate)
+AUDIO_PAYLOAD_SAMPLE_RATE = int(os.getenv("AUDIO_PAYLOAD_SAMPLE_RATE", "0"))
+AUDIO_PAYLOAD_MONO = os.getenv("AUDIO_PAYLOAD_MONO", "false").lower() == "true"
+AUDIO_PAYLOAD_CHUNK_BYTES = int(os.getenv("AUDIO_PAYLOAD_CHUNK_BYTES", str(3 * 256 * 1024))) // 3 * 3
+
+# Energy is measured over windows of this length when looking for silence
+ENERGY_WINDOW_SECONDS = 0.05
+# Frames copied per read when writing segments
+COPY_FRAMES = 1 << 16
+
+_SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+_payload_hooks = []
+_payload_measurements = deque(maxlen=100)
+_payload_lock = threading.Lock()
+
+
+def _to_samples(frames: bytes, sampwidth: int, nchannels: int):
+    """
+    Decode PCM frames into a float mono signal.
+    """
+    samples = np.frombuffer(frames, dtype=_SAMPLE_TYPES[sampwidth]).astype(np.float32)
+    if sampwidth == 1:
+        samples -= 128.0
+    if nchannels > 1:
+        samples = samples[: len(samples) - len(samples) % nchannels].reshape(-1, nchannels).mean(axis=1)
+    return samples
+
+
+def _quietest_frame(reader, start: int, end: int):
+    """
+    Return the frame position in [start, end) at the centre of the quietest energy window.
+    """
+    params = reader.getparams()
+    reader.setpos(start)
+    samples = _to_samples(reader.readframes(end - start), params.sampwidth, params.nchannels)
+    window = max(1, int(params.framerate * ENERGY_WINDOW_SECONDS))
+    usable = len(samples) - len(samples) % window
+    if usable == 0:
+        return end
+    energy = np.sqrt((samples[:usable].reshape(-1, window) ** 2).mean(axis=1))
+    return start + int(np.argmin(energy)) * window + window // 2
+
+
+def needs_segmentation(audio_path: str) -> bool:
+    """
+    True for PCM WAV files above the size or duration limits.
+    Other formats cannot be decoded here and are sent whole.
+    """
+    try:
+        with wave.open(audio_path, "rb") as reader:
+            duration = reader.getnframes() / reader.getframerate()
+            supported = reader.getsampwidth() in _SAMPLE_TYPES
+    except (wave.Error, EOFError):
+        return False
+    return supported and (duration > AUDIO_SEGMENT_MAX_SECONDS or os.path.getsize(audio_path) > AUDIO_SEGMENT_MAX_BYTES)
+
+
+def split_wav(audio_path: str, out_dir: str,
+              max_seconds: float = AUDIO_SEGMENT_MAX_SECONDS,
+              overlap_seconds: float = AUDIO_SEGMENT_OVERLAP_SECONDS,
+              search_seconds: float = AUDIO_SEGMENT_SEARCH_SECONDS):
+    """
+    Split a PCM WAV file into segments of at most max_seconds, cutting at the
+    quietest point in the last search_seconds of each segment. Consecutive
+    segments overlap by overlap_seconds. Only the search windows are decoded,
+    so memory use does not grow with file length.
+    Returns the segment file paths in order.
+    """
+    with wave.open(audio_path, "rb") as reader:
+        params = reader.getparams()
+        rate = params.framerate
+        total = params.nframes
+        # Keep segments under the byte limit as well as the duration limit
+        bytes_per_second = rate * params.sampwidth * params.nchannels
+        max_frames = int(min(max_seconds, AUDIO_SEGMENT_MAX_BYTES / bytes_per_second) * rate)
+        overlap = int(overlap_seconds * rate)
+        search = min(int(search_seconds * rate), max_frames // 2)
+
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        segments = []
+        start = 0
+        while start < total:
+            end = start + max_frames
+            if end >= total:
+                end = total
+            else:
+                end = _quietest_frame(reader, end - search, end)
+
+            segment_path = os.path.join(out_dir, f"{base_name}_{len(segments):03d}.wav")
+            with wave.open(segment_path, "wb") as writer:
+                writer.setparams(params)
+                reader.setpos(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = reader.readframes(min(COPY_FRAMES, remaining))
+                    if not chunk:
+                        break
+                    writer.writeframes(chunk)
+                    remaining -= min(COPY_FRAMES, remaining)
+            segments.append(segment_path)
+
+            if end >= total:
+                break
+            start = max(start + 1, end - overlap)
+    return segments
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def stitch_transcripts(texts, max_overlap_words: int = 40, min_overlap_words: int = 3):
+    """
+    Join segment transcripts in order, dropping the words the overlap made
+    appear at the end of one segment and again at the start of the next.
+    """
+    stitched = ""
+    for text in texts:
+        text = (text or "").strip()
+        if not text:
+            continue
+        if not stitched:
+            stitched = text
+            continue
+        words = text.split()
+        tail = [_normalize_word(w) for w in stitched.split()[-max_overlap_words:]]
+        head = [_normalize_word(w) for w in words[:max_overlap_words]]
+        for size in range(min(len(tail), len(head)), min_overlap_words - 1, -1):
+            if tail[-size:] == head[:size]:
+                if len(words) > size:
+                    stitched = f"{stitched} {' '.join(words[size:])}"
+                break
+        else:
+            stitched = f"{stitched}\n{text}"
+    return stitched
+
+
+def _to_int16_frames(frames: bytes, sampwidth: int, nchannels: int, mono: bool):
+    """
+    Decode PCM frames into an int16-scaled float array of shape (frames, channels).
+    """
+    samples = np.frombuffer(frames, dtype=_SAMPLE_TYPES[sampwidth]).astype(np.float32)
+    if sampwidth == 1:
+        samples = (samples - 128.0) * 256.0
+    elif sampwidth == 4:
+        samples /= 65536.0
+    samples = samples[: len(samples) - len(samples) % nchannels].reshape(-1, nchannels)
+    if mono and nchannels > 1:
+        samples = samples.mean(axis=1, keepdims=True)
+    return samples
+
+
+def prepare_audio(audio_path: str, out_dir: str, sample_rate: int = AUDIO_PAYLOAD_SAMPLE_RATE,
+                  mono: bool = AUDIO_PAYLOAD_MONO) -> str:
+    """
+    Write a 16-bit PCM copy of a WAV file at sample_rate (if lower than the
+    source) and/or in mono, to shrink the transcription payload. Conversion is
+    done COPY_FRAMES at a time with linear interpolation, so memory stays flat.
+    Returns audio_path unchanged when there is nothing to convert or the file
+    is not a PCM WAV.
+    """
+    try:
+        reader = wave.open(audio_path, "rb")
+    except (wave.Error, EOFError):
+        return audio_path
+
+    with reader:
+        params = reader.getparams()
+        target_rate = sample_rate if sample_rate and sample_rate < params.framerate else params.framerate
+        channels = 1 if mono else params.nchannels
+        if params.sampwidth not in _SAMPLE_TYPES or (
+                target_rate == params.framerate and channels == params.nchannels and params.sampwidth == 2):
+            return audio_path
+
+        ratio = params.framerate / target_rate
+        out_path = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(audio_path))[0]}_payload.wav")
+        with wave.open(out_path, "wb") as writer:
+            writer.setnchannels(channels)
+            writer.setsampwidth(2)
+            writer.setframerate(target_rate)
+
+            position = 0      # input frame index of the first frame in the chunk
+            next_output = 0   # index of the next output frame to produce
+            previous = None   # last input frame of the previous chunk, for interpolation across chunks
+            while True:
+                frames = reader.readframes(COPY_FRAMES)
+                if not frames:
+                    break
+                chunk = _to_int16_frames(frames, params.sampwidth, params.nchannels, mono)
+                if ratio != 1:
+                    if previous is not None:
+                        chunk_positions = np.arange(position - 1, position + len(chunk))
+                        values = np.vstack([previous, chunk])
+                    else:
+                        chunk_positions = np.arange(position, position + len(chunk))
+                        values = chunk
+                    last_output = int((position + len(chunk) - 1) // ratio)
+                    targets = np.arange(next_output, last_output + 1) * ratio
+                    previous = chunk[-1:]
+                    position += len(chunk)
+                    next_output = last_output + 1
+                    chunk = np.column_stack([
+                        np.interp(targets, chunk_positions, values[:, channel])
+                        for channel in range(channels)
+                    ])
+                writer.writeframes(np.clip(np.round(chunk), -32768, 32767).astype("<i2").tobytes())
+    return out_path
+
+
+def base64_length(num_bytes: int) -> int:
+    return 4 * ((num_bytes + 2) // 3)
+
+
+def add_payload_hook(hook):
+    """
+    Register hook(measurement) to be called after every encoded audio payload.
+    The measurement holds file, format, source_bytes, payload_bytes and encode_seconds.
+    """
+    with _payload_lock:
+        _payload_hooks.append(hook)
+
+
+def _record_payload(measurement):
+    with _payload_lock:
+        _payload_measurements.append(measurement)
+        hooks = list(_payload_hooks)
+    for hook in hooks:
+        try:
+            hook(measurement)
+        except Exception as e:
+            print(f"Audio payload hook failed: {e}")
+
+
+def iter_base64(audio_path: str, source_path: str = None, chunk_bytes: int = AUDIO_PAYLOAD_CHUNK_BYTES):
+    """
+    Yield the base64 encoding of a file chunk by chunk, so at most one chunk of
+    raw and encoded bytes is held at a time. Once the file is fully read the
+    payload size and encode time are recorded (source_path is the original
+    file, when audio_path is a converted copy).
+    """
+    encoded_bytes = 0
+    encode_seconds = 0.0
+    with open(audio_path, "rb") as audio:
+        while True:
+            raw = audio.read(chunk_bytes)
+            if not raw:
+                break
+            started = time.perf_counter()
+            encoded = base64.b64encode(raw)
+            encode_seconds += time.perf_counter() - started
+            encoded_bytes += len(encoded)
+            yield encoded
+
+    source_path = source_path or audio_path
+    _record_payload({
+        "file": os.path.basename(source_path),
+        "format": os.path.splitext(audio_path)[1][1:],
+        "source_bytes": os.path.getsize(source_path),
+        "payload_bytes": encoded_bytes,
+        "encode_seconds": encode_seconds,
+    })
+
+
+def get_payload_stats():
+    """
+    Totals over the most recent audio payloads.
+    """
+    with _payload_lock:
+        measurements = list(_payload_measurements)
+    return {
+        "payloads": len(measurements),
+        "source_bytes": sum(m["source_bytes"] for m in measurements),
+        "payload_bytes": sum(m["payload_bytes"] for m in measurements),
+        "encode_seconds": sum(m["encode_seconds"] for m in measurements),
+        "recent": measurements[-10:],
+    }
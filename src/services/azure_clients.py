@@ -0,0 +1,101 @@
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# HTTP connection pool sizing shared by every long-lived client
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "16"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "64"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+# key -> client. Azure SDK clients and the OpenAI client are thread-safe, so a
+# single instance per key is shared by every Streamlit session and worker thread.
+_clients = {}
+_lock = threading.Lock()
+# key -> lock held while that key's client is built. Factories may look up other
+# clients (e.g. the token provider needs the credential), so the registry lock
+# is never held while a factory runs.
+_build_locks = {}
+
+
+def get_or_create(key, factory):
+    """
+    Return the registered client for key, building it with factory() on first use.
+    Concurrent first calls for the same key build it once; factory() may itself
+    call get_or_create for other keys.
+    """
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            with _lock:
+                _clients[key] = client
+    return client
+
+
+def get_credential():
+    """
+    One DefaultAzureCredential for the process, so acquired tokens are reused.
+    """
+    return get_or_create("credential", DefaultAzureCredential)
+
+
+def get_token_provider(scope: str):
+    return get_or_create(("token_provider", scope), lambda: get_bearer_token_provider(get_credential(), scope))
+
+
+def get_httpx_client(name: str):
+    """
+    Pooled keep-alive httpx client, used as the OpenAI client's transport.
+    """
+    return get_or_create(("httpx", name), lambda: httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=HTTP_POOL_CONNECTIONS,
+        ),
+        timeout=HTTP_TIMEOUT,
+    ))
+
+
+def _build_azure_transport():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False, connection_timeout=HTTP_TIMEOUT)
+
+
+def get_azure_transport(name: str):
+    """
+    Pooled requests-based transport for an Azure SDK client.
+    """
+    return get_or_create(("transport", name), _build_azure_transport)
+
+
+def close_all():
+    """
+    Close and forget every registered client (e.g. on worker shutdown).
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _build_locks.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"Error closing client: {e}")
@@ -1,16 +1,24 @@
 from azure.cosmos import CosmosClient, PartitionKey
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 import uuid
 import os
 
+from services import azure_clients
+
 # Load environment variables
 load_dotenv()
 
-def upload_prompt(prompt_file, prompt_description):
-    # Create a credential object
-    credential = DefaultAzureCredential()
+def get_cosmos_client():
+    """
+    Shared CosmosClient, created once per process.
+    """
+    COSMOS_DB_ENDPOINT = os.getenv("COSMOS_DB_ENDPOINT")
+    return azure_clients.get_or_create(
+        ("cosmos", COSMOS_DB_ENDPOINT),
+        lambda: CosmosClient(COSMOS_DB_ENDPOINT, credential=azure_clients.get_credential()),
+    )
 
+def upload_prompt(prompt_file, prompt_description):
     prompt_content = prompt_file.read().decode("utf-8")
             
     # Create a unique ID for the document
@@ -25,8 +33,7 @@ def upload_prompt(prompt_file, prompt_description):
     }
     
     # Insert the document into Cosmos DB
-    COSMOS_DB_ENDPOINT = os.getenv("COSMOS_DB_ENDPOINT")
-    cosmos_client = CosmosClient(COSMOS_DB_ENDPOINT, credential=credential)
+    cosmos_client = get_cosmos_client()
     database_name = os.getenv("COSMOS_DB_DATABASE_NAME")
     container_name = os.getenv("COSMOS_DB_CONTAINER_NAME")
     database = cosmos_client.get_database_client(database_name)
@@ -49,14 +56,8 @@ def upload_prompt(prompt_file, prompt_description):
     return f"Uploaded prompt file to Cosmos DB with ID: {document_id}"
 
 def list_prompts():
-    # Create a credential object
-    credential = DefaultAzureCredential()
-    
-    # Get the Cosmos DB endpoint
-    COSMOS_DB_ENDPOINT = os.getenv("COSMOS_DB_ENDPOINT")
-    
-    # Create a Cosmos DB client
-    cosmos_client = CosmosClient(COSMOS_DB_ENDPOINT, credential=credential)
+    # Shared Cosmos DB client
+    cosmos_client = get_cosmos_client()
     
     # Get the database and container
     database_name = os.getenv("COSMOS_DB_DATABASE_NAME")
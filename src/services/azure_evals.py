@@ -1,5 +1,12 @@
-from services import azure_storage
+from services import azure_storage, analysis_snapshot, analysis_schema
+import numpy as np
 import pandas as pd
+import json
+
+# Text labels understood by convert_labels(), after strip() and lower()
+LABEL_LOOKUP = {"yes": True, "true": True, "1": True, "no": False, "false": False, "0": False}
+# Float labels: only 1.0 and 0.0 are booleans
+FLOAT_LOOKUP = {1.0: True, 0.0: False}
 
 def load_and_prepare_data(prompt_txt: str):
     """
@@ -10,32 +17,25 @@ def load_and_prepare_data(prompt_txt: str):
     # 1. Get prompt name (e.g., "sales_quality" from "sales_quality.txt")
     prompt_name = prompt_txt.replace(".txt", "")
     
-    # Read the config from blob (returns a dict like {"Parameter 1": "...", "Parameter 2": "..."})
+    # Read the config from blob (returns a list like ["Parameter 1", "Parameter 2"])
     config_dict = azure_storage.read_prompt_config(prompt_name)
     
-    # We'll treat the keys as ground truth parameter names we expect
-    parameters = list(config_dict.keys())  # e.g. ["Parameter 1", "Parameter 2", "Parameter 3"]
+    # The config is the list of ground truth parameter names we expect
+    parameters = list(config_dict or [])  # e.g. ["Parameter 1", "Parameter 2", "Parameter 3"]
+
+    # 2. Read LLM Analysis + User Eval documents from the persona's snapshot
+    snapshot, _ = analysis_snapshot.load_snapshot(prompt_name, columns=["analysis_json", "ground_truth_json"])
 
-    # 2. List & read LLM Analysis + User Eval files
-    llm_analysis = azure_storage.list_llmanalysis(prompt_name=prompt_name)    
-    user_eval_files = azure_storage.list_evals(prompt_name=prompt_name)
-    
     # Build a dictionary for AI data and user eval data keyed by call_id (filename without .json)
     ai_data_dict = {}
     user_eval_dict = {}
+    for call_id, analysis_json, ground_truth_json in zip(
+        snapshot["call_id"], snapshot["analysis_json"], snapshot["ground_truth_json"]
+    ):
+        ai_data_dict[call_id] = json.loads(analysis_json)
+        if isinstance(ground_truth_json, str):
+            user_eval_dict[call_id] = json.loads(ground_truth_json)
 
-    # --- Parse AI result files ---
-    for file_name in llm_analysis:
-        call_id = file_name.replace(".json", "")
-        file_content = azure_storage.read_llm_analysis(prompt_name, file_name)
-        ai_data_dict[call_id] = file_content
-
-    # --- Parse user eval files ---
-    for file_name in user_eval_files:
-        call_id = file_name.replace(".json", "")
-        file_content = azure_storage.read_eval(prompt_name, file_name) 
-        user_eval_dict[call_id] = file_content
-    
     # 3. Merge data into a single DataFrame
     # We'll ONLY iterate over call_ids that have AI data (so calls without LLM analysis get dropped)
     combined_rows = []
@@ -56,8 +56,8 @@ def load_and_prepare_data(prompt_txt: str):
         # e.g.: Parameter 1 -> "Parameter 1" (GT), "Parameter 1 - Score" (AI), "Parameter 1 - Explanation"
         for p in parameters:
             row[p] = gt.get(p, "")  # ground truth
-            row[f"{p} - Score"] = ai.get(p, {}).get("Score", "")
-            row[f"{p} - Explanation"] = ai.get(p, {}).get("Explanation", "")
+            row[f"{p} - Score"] = ai.get(p, {}).get(analysis_schema.SCORE_KEY, "")
+            row[f"{p} - Explanation"] = ai.get(p, {}).get(analysis_schema.EXPLANATION_KEY, "")
         
         combined_rows.append(row)
     
@@ -106,3 +106,189 @@ def calculate_metrics(df, parameters):
         }
     
     return metrics
+
+
+# -------------------------------------------------------------------------
+# Vectorized evaluation of predictions against ground truth
+# -------------------------------------------------------------------------
+def _convert_text(text: str):
+    """
+    Label for one distinct string; see convert_labels().
+    """
+    word = text.strip().lower()
+    if word in LABEL_LOOKUP:
+        return LABEL_LOOKUP[word]
+    # Other numeric strings are not labels
+    return None
+
+
+def _label_arrays(values: pd.Series):
+    """
+    A column's labels as arrays (numbers, is_bool, present); see convert_labels().
+    numbers holds each integer label, or 1 / 0 for True / False; is_bool marks the
+    boolean labels (True == 1 and hash(True) == hash(1), so they are told apart
+    by this flag); present marks the values that have a label.
+    """
+    if pd.api.types.is_bool_dtype(values.dtype) or pd.api.types.is_integer_dtype(values.dtype):
+        present = values.notna().to_numpy()
+        numbers = values.fillna(0).to_numpy(dtype=np.int64)
+        return numbers, present & pd.api.types.is_bool_dtype(values.dtype), present
+    raw = values.to_numpy(dtype=object)
+    numbers = np.zeros(len(raw), dtype=np.int64)
+    is_bool = np.zeros(len(raw), dtype=bool)
+
+    # Per-value types, compared as integer codes
+    type_codes, types = pd.factorize(values.map(type))
+
+    def of_type(*kinds):
+        return np.isin(type_codes, [i for i, kind in enumerate(types) if kind in kinds])
+
+    bools = of_type(bool, np.bool_)
+    ints = of_type(int, np.int64, np.int32)
+    numbers[bools | ints] = raw[bools | ints].astype(np.int64)
+    is_bool[bools] = True
+    present = bools | ints
+
+    floats = np.flatnonzero(of_type(float, np.float64))
+    float_values = raw[floats].astype(float)
+    for value, label in FLOAT_LOOKUP.items():
+        matched = floats[float_values == value]
+        numbers[matched], is_bool[matched], present[matched] = int(label), True, True
+
+    # Strings are converted once per distinct value
+    texts = np.flatnonzero(of_type(str))
+    codes, distinct = pd.factorize(raw[texts])
+    lookup = [_convert_text(text) for text in distinct]
+    known = np.array([label is not None for label in lookup], dtype=bool)[codes]
+    matched = texts[known]
+    numbers[matched] = np.array([int(bool(label)) for label in lookup], dtype=np.int64)[codes][known]
+    is_bool[matched], present[matched] = True, True
+    return numbers, is_bool, present
+
+
+def convert_labels(values: pd.Series) -> pd.Series:
+    """
+    Normalize a column of labels without a Python call per value, with the
+    same rules as the page's former convert_value():
+    - booleans are kept, integers are kept as class labels
+    - floats 1.0 / 0.0 become True / False, other floats None
+    - "yes"/"true"/"1" and "no"/"false"/"0" (any case) become True / False;
+      strings are converted once per distinct value and mapped back through
+      a lookup table
+    Everything else becomes None. The result is aligned with `values`.
+    Integer columns with missing values should keep an integer dtype (e.g.
+    DataFrame.convert_dtypes()), or their scores are read as floats.
+    """
+    numbers, is_bool, present = _label_arrays(values)
+    labels = np.full(len(values), None, dtype=object)
+    labels[present & ~is_bool] = numbers[present & ~is_bool].astype(object)
+    labels[is_bool] = numbers[is_bool].astype(bool).astype(object)
+    return pd.Series(labels, index=values.index, dtype=object)
+
+
+def _safe_divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def evaluate_parameters(df, parameters, pred_suffix=".score", truth_suffix=".gt"):
+    """
+    Score every parameter's predictions (<param><pred_suffix>) against its
+    ground truth (<param><truth_suffix>), row by row. Rows where either label
+    cannot be converted are ignored.
+
+    Labels are factorized to integer class codes once, and all counts for all
+    parameters come from a few np.bincount calls. As in sklearn, True is the
+    class 1 and False the class 0; each parameter is only scored over its own
+    labels, so its metrics do not depend on the other parameters in df.
+    A parameter is binary when all its labels are booleans (positive label
+    True); otherwise precision, recall and F1 are support-weighted averages
+    over the classes, as sklearn's average="weighted".
+
+    The former page decided binary from the first row only, and numpy
+    booleans failed that check: boolean columns without missing values were
+    scored as weighted multi-class, and columns mixing booleans and integers
+    raised. Both are now scored by the rule above.
+
+    Returns (metrics, confusion, missing):
+    - metrics: DataFrame indexed by parameter with total, matches, accuracy,
+      precision, recall, f1, binary and tp/fp/fn/tn (binary parameters only)
+    - confusion: Series of counts indexed by (parameter, y_true, y_pred)
+    - missing: parameters whose columns are not in df
+    """
+    missing = [p for p in parameters if f"{p}{pred_suffix}" not in df.columns or f"{p}{truth_suffix}" not in df.columns]
+    present = [p for p in parameters if p not in missing]
+    if not present:
+        return pd.DataFrame(), pd.Series(dtype=int), missing
+
+    truth = [_label_arrays(df[f"{p}{truth_suffix}"]) for p in present]
+    preds = [_label_arrays(df[f"{p}{pred_suffix}"]) for p in present]
+    true_numbers, true_bool, true_present = (np.concatenate(arrays) for arrays in zip(*truth))
+    pred_numbers, pred_bool, pred_present = (np.concatenate(arrays) for arrays in zip(*preds))
+    parameter = np.repeat(np.arange(len(present)), len(df))
+    valid = true_present & pred_present
+
+    codes, classes = pd.factorize(np.concatenate([true_numbers[valid], pred_numbers[valid]]))
+    true_codes, pred_codes = codes[: valid.sum()], codes[valid.sum():]
+    parameter = parameter[valid]
+    labels_bool = np.concatenate([true_bool[valid], pred_bool[valid]])
+    n_params, n_classes = len(present), len(classes)
+
+    match = true_codes == pred_codes
+    true_cell = parameter * n_classes + true_codes
+    total = np.bincount(parameter, minlength=n_params)
+    matches = np.bincount(parameter[match], minlength=n_params)
+    support = np.bincount(true_cell, minlength=n_params * n_classes).reshape(n_params, n_classes)
+    predicted = np.bincount(parameter * n_classes + pred_codes, minlength=n_params * n_classes).reshape(n_params, n_classes)
+    true_positive = np.bincount(true_cell[match], minlength=n_params * n_classes).reshape(n_params, n_classes)
+    confusion = np.bincount(true_cell * n_classes + pred_codes, minlength=n_params * n_classes * n_classes)
+
+    precision = _safe_divide(true_positive, predicted)
+    recall = _safe_divide(true_positive, support)
+    f1 = _safe_divide(2 * true_positive, predicted + support)
+
+    # Multi-class: weight each class by its support
+    weights = _safe_divide(support, support.sum(axis=1, keepdims=True))
+    metrics = pd.DataFrame({
+        "total": total,
+        "matches": matches,
+        "accuracy": _safe_divide(matches, total),
+        "precision": (precision * weights).sum(axis=1),
+        "recall": (recall * weights).sum(axis=1),
+        "f1": (f1 * weights).sum(axis=1),
+    }, index=pd.Index(present, name="parameter"))
+
+    # Binary: every label of the parameter is a boolean; score the True class
+    non_bool = np.bincount(np.concatenate([parameter, parameter])[~labels_bool], minlength=n_params)
+    metrics["binary"] = (total > 0) & (non_bool == 0)
+    positive = np.flatnonzero(classes == 1)
+    binary = metrics["binary"].to_numpy()
+    if len(positive):
+        k = positive[0]
+        metrics.loc[binary, "precision"] = precision[binary, k]
+        metrics.loc[binary, "recall"] = recall[binary, k]
+        metrics.loc[binary, "f1"] = f1[binary, k]
+        tp, fp, fn = true_positive[:, k], predicted[:, k] - true_positive[:, k], support[:, k] - true_positive[:, k]
+    else:
+        metrics.loc[binary, ["precision", "recall", "f1"]] = 0.0
+        tp = fp = fn = np.zeros(n_params, dtype=int)
+    for column, counts in (("tp", tp), ("fp", fp), ("fn", fn), ("tn", total - tp - fp - fn)):
+        metrics[column] = pd.Series(counts, index=metrics.index).where(binary)
+
+    cells = np.flatnonzero(confusion)
+    cell_parameter = cells // (n_classes * n_classes)
+
+    def cell_labels(class_codes):
+        # Classes of binary parameters are shown as True / False
+        labels = classes[class_codes].astype(object)
+        as_bool = binary[cell_parameter]
+        labels[as_bool] = classes[class_codes][as_bool].astype(bool).astype(object)
+        return labels
+
+    confusion = pd.Series(confusion[cells], index=pd.MultiIndex.from_arrays([
+        [present[i] for i in cell_parameter],
+        cell_labels((cells // n_classes) % n_classes),
+        cell_labels(cells % n_classes),
+    ], names=["parameter", "y_true", "y_pred"]))
+    return metrics, confusion, missing
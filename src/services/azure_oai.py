@@ -1,14 +1,21 @@
 import os
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import openai
 from openai import AzureOpenAI
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from openai.types.chat import ChatCompletion
 from dotenv import load_dotenv
 import re
 
-import base64
+from services import audio_processing, azure_clients, embedding_cache, oai_scheduler, token_accounting
 
 load_dotenv()
 
-token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")    
+token_provider = azure_clients.get_token_provider("https://cognitiveservices.azure.com/.default")
 
 AZURE_OPENAI_ENDPOINT=os.getenv("AZURE_OPENAI_ENDPOINT")
 if not AZURE_OPENAI_ENDPOINT:
@@ -25,158 +32,460 @@ if (AZURE_OPENAI_EMBEDDING_MODEL == 'text-embedding-ada-002'):
     EMBEDDING_DIM = 1536    # For text-embedding-ada-002
 elif (AZURE_OPENAI_EMBEDDING_MODEL == 'text-embedding-3-large'):
     EMBEDDING_DIM = 3072    # For text-embedding-3-large
+else:
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM")) if os.getenv("EMBEDDING_DIM") else None
+
+# Batched embeddings: inputs per request, estimated tokens per request,
+# requests in flight and an optional requests-per-minute cap (0 = no cap)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "0"))
+
+# Scheduler budgets for chat/audio deployments and for Whisper (0 = no cap).
+# Requests beyond the budgets wait; 429s shrink concurrency and are retried.
+OAI_REQUESTS_PER_MINUTE = int(os.getenv("OAI_REQUESTS_PER_MINUTE", "0"))
+OAI_TOKENS_PER_MINUTE = int(os.getenv("OAI_TOKENS_PER_MINUTE", "0"))
+WHISPER_REQUESTS_PER_MINUTE = int(os.getenv("WHISPER_REQUESTS_PER_MINUTE", "0"))
+OAI_INITIAL_CONCURRENCY = int(os.getenv("OAI_INITIAL_CONCURRENCY", "8"))
+OAI_MAX_CONCURRENCY = int(os.getenv("OAI_MAX_CONCURRENCY", "32"))
+OAI_MAX_RETRIES = int(os.getenv("OAI_MAX_RETRIES", "6"))
+
+# Completion budget reserved per chat call (default max_tokens, OAI_MAX_COMPLETION_TOKENS)
+COMPLETION_TOKEN_RESERVE = token_accounting.OAI_MAX_COMPLETION_TOKENS
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
 
 def get_oai_client():
-    oai_client = AzureOpenAI(
+    """
+    Shared AzureOpenAI client with a pooled HTTP transport, created once per process.
+    """
+    return azure_clients.get_or_create("openai", lambda: AzureOpenAI(
         api_version= AZURE_OPENAI_API_VERSION,
         azure_endpoint= AZURE_OPENAI_ENDPOINT, 
-        azure_ad_token_provider=token_provider
-    )
-    return oai_client
+        azure_ad_token_provider=token_provider,
+        http_client=azure_clients.get_httpx_client("openai"),
+    ))
+
+def get_scheduled_client():
+    """
+    The shared client without SDK-level retries; retries are owned by the scheduler.
+    """
+    return azure_clients.get_or_create("openai_scheduled", lambda: get_oai_client().with_options(max_retries=0))
+
+def get_scheduler(deployment):
+    """
+    One rate-limited, adaptive scheduler per deployment.
+    """
+    with _schedulers_lock:
+        if deployment not in _schedulers:
+            is_whisper = deployment == AZURE_WHISPER_MODEL
+            _schedulers[deployment] = oai_scheduler.Scheduler(
+                deployment,
+                requests_per_minute=WHISPER_REQUESTS_PER_MINUTE if is_whisper else OAI_REQUESTS_PER_MINUTE,
+                tokens_per_minute=0 if is_whisper else OAI_TOKENS_PER_MINUTE,
+                initial_concurrency=OAI_INITIAL_CONCURRENCY,
+                max_concurrency=OAI_MAX_CONCURRENCY,
+                max_retries=OAI_MAX_RETRIES,
+            )
+        return _schedulers[deployment]
+
+def get_throughput():
+    """
+    Live throughput gauge for every deployment used so far.
+    """
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {deployment: scheduler.get_throughput() for deployment, scheduler in schedulers.items()}
+
+def _usage_tokens(completion):
+    usage = getattr(completion, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+def _messages_tokens(messages):
+    return token_accounting.count_messages(messages)
 
+_prompt_files = {}  # path -> (mtime, content)
+
+def _read_prompt_file(path):
+    """
+    Contents of a prompt file, read from disk again only when it was modified.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _prompt_files.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r") as prompt_file:
+        content = prompt_file.read()
+    _prompt_files[path] = (mtime, content)
+    return content
+
+def _read_persona(prompt):
+    return _read_prompt_file(prompt) if prompt.endswith(".txt") else prompt
+
+def _transcript_message(transcript):
+    return {"role": "user", "content": f"Here is the transcript:\n\n {transcript}"}
+
+# Every persona request is [persona message, transcript message]: the persona is an
+# identical prefix across a run, which the service's prompt cache can reuse.
 def build_o1_prompt(prompt_file, transcript):
     
     if prompt_file is None:
         return "No prompt file provided"
-    else:
-        system_prompt = open(prompt_file, "r").read()   
 
-    messages = [
-        {
-        "role": "user",
-        "content": system_prompt
-        },
-        {
-        "role": "user",
-         "content": (f"Here is the transcript:\n\n {transcript}") }
-    ]
-      
-    return messages
+    # o1 models take the persona as a user message
+    return [{"role": "user", "content": _read_prompt_file(prompt_file)}, _transcript_message(transcript)]
 
 def build_prompt(prompt, transcript):
     
     if prompt is None:
         return "No prompt file provided"
-    elif prompt.endswith(".txt"):
-        system_prompt = open(prompt, "r").read()
-    else:
-        system_prompt = prompt  
-
-    messages = [
-        {
-        "role": "system",
-        "content": system_prompt
-        },
-        {
-        "role": "user",
-         "content": (f"Here is the transcript:\n\n {transcript}") }
-    ]
-      
-    return messages
+
+    return [{"role": "system", "content": _read_persona(prompt)}, _transcript_message(transcript)]
+
+def _fit_prompt(prefix, transcript, max_tokens, prefix_tokens=None):
+    """
+    Append the transcript message to the persona prefix, truncating the transcript
+    (OAI_TRUNCATION_STRATEGY) when the prompt would not leave max_tokens of the
+    context window for the completion. prefix_tokens skips re-counting a prefix
+    counted before. Returns (messages, prompt_tokens, truncated_tokens); raises
+    token_accounting.PromptTooLargeError before sending when it cannot fit.
+    """
+    if prefix_tokens is None:
+        prefix_tokens = _messages_tokens(prefix)
+    message = _transcript_message(transcript)
+    prompt_tokens = prefix_tokens + token_accounting.count_message(message)
+    budget = token_accounting.prompt_budget(max_tokens)
+    if prompt_tokens <= budget:
+        return prefix + [message], prompt_tokens, 0
+
+    overhead = prompt_tokens - token_accounting.count_tokens(transcript)
+    transcript, truncated_tokens = token_accounting.truncate_text(transcript, budget - overhead)
+    print(f"Transcript truncated by {truncated_tokens} tokens to fit the {budget}-token prompt budget.")
+    message = _transcript_message(transcript)
+    return prefix + [message], prefix_tokens + token_accounting.count_message(message), truncated_tokens
 
 def call_o1(prompt_file, transcript, deployment):
-    messages = build_o1_prompt(prompt_file=prompt_file, transcript=transcript)  
+    prefix = build_o1_prompt(prompt_file, "")[:1]
+    messages, prompt_tokens, truncated_tokens = _fit_prompt(prefix, transcript, COMPLETION_TOKEN_RESERVE)
 
-    oai_client = get_oai_client()
+    oai_client = get_scheduled_client()
 
-    completion = oai_client.chat.completions.create(
-        model=deployment,   
-        messages=messages,
-    )  
+    completion = get_scheduler(deployment).run(
+        token_accounting.metered(deployment, "call_o1", lambda: oai_client.chat.completions.create(
+            model=deployment,   
+            messages=messages,
+        ), prompt_tokens, truncated_tokens),
+        estimated_tokens=prompt_tokens + COMPLETION_TOKEN_RESERVE,
+        usage_tokens=_usage_tokens,
+    )
 
     return clean_json_string(completion.choices[0].message.content)
 
-def call_llm(prompt, transcript, deployment=AZURE_OPENAI_DEPLOYMENT_NAME, response_format=None):
-
-    messages = build_prompt(prompt=prompt, transcript=transcript)  
+class PersonaRun:
+    """
+    Analyze many transcripts with one persona. The persona is read and its tokens
+    counted once; every request then sends the same persona message first, so the
+    service can serve that prefix from its prompt cache (prompts of 1024+ tokens).
+    Cached prompt tokens reported by the service are tallied in get_stats().
+    """
 
-    oai_client = get_oai_client()
-   
-    if response_format is not None:
-        result = oai_client.beta.chat.completions.parse(model=deployment, 
-                                                            temperature=0.2, 
-                                                            messages=messages, 
-                                                            response_format=response_format)
-        
-        return result.choices[0].message.parsed
-    else:
-        completion = oai_client.chat.completions.create(
-            messages=messages,
-            model=deployment,
-            temperature=0.2,
-            top_p=1,
-            max_tokens=5000,
-            stop=None,
+    def __init__(self, prompt, deployment=AZURE_OPENAI_DEPLOYMENT_NAME, max_tokens=COMPLETION_TOKEN_RESERVE):
+        self.deployment = deployment
+        self.max_tokens = max_tokens
+        self.prefix = build_prompt(prompt, "")[:1]
+        self.prefix_tokens = _messages_tokens(self.prefix)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def messages(self, transcript):
+        """
+        The request messages for a transcript: the persona prefix and the transcript,
+        fitted into the context window. Returns (messages, prompt_tokens, truncated_tokens).
+        """
+        return _fit_prompt(self.prefix, transcript, self.max_tokens, self.prefix_tokens)
+
+    def analyze(self, transcript, response_format=None):
+        """
+        Same result as call_llm(prompt, transcript, ...) for this run's persona.
+        """
+        messages, prompt_tokens, truncated_tokens = self.messages(transcript)
+        deployment, max_tokens = self.deployment, self.max_tokens
+        oai_client = get_scheduled_client()
+
+        if response_format is not None:
+            request = lambda: oai_client.beta.chat.completions.parse(
+                model=deployment,
+                temperature=0.2,
+                max_tokens=max_tokens,
+                messages=messages,
+                response_format=response_format,
+            )
+        else:
+            request = lambda: oai_client.chat.completions.create(
+                messages=messages,
+                model=deployment,
+                temperature=0.2,
+                top_p=1,
+                max_tokens=max_tokens,
+                stop=None,
+            )
+        completion = get_scheduler(deployment).run(
+            token_accounting.metered(deployment, "call_llm", request, prompt_tokens, truncated_tokens),
+            estimated_tokens=prompt_tokens + max_tokens,
+            usage_tokens=_usage_tokens,
         )
 
+        usage = token_accounting.usage_counts(completion)
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += usage["prompt_tokens"] or 0
+            self.cached_tokens += usage["cached_tokens"] or 0
+
+        if response_format is not None:
+            message = completion.choices[0].message
+            if message.parsed is None:
+                raise ValueError(f"No structured output returned: {message.refusal or 'empty response'}")
+            return message.parsed
         return clean_json_string(completion.choices[0].message.content)
 
+    def get_stats(self):
+        """
+        Calls so far, prompt tokens sent and the share served from the prompt cache.
+        """
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "prefix_tokens": self.prefix_tokens,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_hit_rate": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
+
+def call_llm(prompt, transcript, deployment=AZURE_OPENAI_DEPLOYMENT_NAME, response_format=None,
+             max_tokens=COMPLETION_TOKEN_RESERVE):
+    """
+    One-off persona analysis; use PersonaRun to analyze many transcripts with the same persona.
+    """
+    return PersonaRun(prompt, deployment, max_tokens).analyze(transcript, response_format)
+
 def clean_json_string(json_string):
     pattern = r'^```json\s*(.*?)\s*```$'
     cleaned_string = re.sub(pattern, r'\1', json_string, flags=re.DOTALL)
     return cleaned_string.strip()
 
 def transcribe_whisper(audio_file, prompt):
-    oai_client = get_oai_client()
+    oai_client = get_scheduled_client()
    
-    prompt_content =open(prompt, "r").read()
-    result = oai_client.audio.transcriptions.create(
-        file=open(audio_file, "rb"),   
-        prompt=prompt_content,         
-        model=AZURE_WHISPER_MODEL
+    with open(prompt, "r") as prompt_file:
+        prompt_content = prompt_file.read()
+
+    def request():
+        # Re-open the file on every attempt so retries send the whole audio
+        with open(audio_file, "rb") as file:
+            return oai_client.audio.transcriptions.create(
+                file=file,   
+                prompt=prompt_content,         
+                model=AZURE_WHISPER_MODEL
+            )
+
+    return get_scheduler(AZURE_WHISPER_MODEL).run(request)
+
+# Replaced by the streamed base64 audio when the request body is written
+_AUDIO_DATA_PLACEHOLDER = "__AUDIO_DATA__"
+
+def _audio_request_body(body: dict, audio_file: str, source_file: str):
+    """
+    Serialize a chat request whose input_audio data is streamed from audio_file.
+    Returns (content_length, chunk iterator); base64 needs no JSON escaping,
+    so the encoded chunks are written between the surrounding JSON as-is.
+    """
+    prefix, suffix = json.dumps(body).split(_AUDIO_DATA_PLACEHOLDER)
+    prefix, suffix = prefix.encode("utf-8"), suffix.encode("utf-8")
+    length = len(prefix) + audio_processing.base64_length(os.path.getsize(audio_file)) + len(suffix)
+
+    def chunks():
+        yield prefix
+        yield from audio_processing.iter_base64(audio_file, source_file)
+        yield suffix
+    return length, chunks()
+
+def _post_chat_completion(deployment: str, body: dict, audio_file: str, source_file: str):
+    """
+    POST a chat completion with a streamed audio payload over the shared HTTP
+    pool. HTTP failures are raised as the matching openai errors so the
+    scheduler retries them like SDK calls.
+    """
+    length, content = _audio_request_body(body, audio_file, source_file)
+    url = f"{AZURE_OPENAI_ENDPOINT.rstrip('/')}/openai/deployments/{deployment}/chat/completions"
+    http_client = azure_clients.get_httpx_client("openai")
+    request = http_client.build_request(
+        "POST", url,
+        params={"api-version": AZURE_OPENAI_API_VERSION},
+        headers={
+            "Authorization": f"Bearer {token_provider()}",
+            "Content-Type": "application/json",
+            "Content-Length": str(length),
+        },
+        content=content,
     )
-    
-    return result
+    try:
+        response = http_client.send(request)
+    except httpx.TimeoutException:
+        raise openai.APITimeoutError(request=request)
+    except httpx.TransportError as e:
+        raise openai.APIConnectionError(message=str(e), request=request)
+
+    if response.status_code >= 400:
+        error_body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+        message = f"Error code: {response.status_code} - {error_body or response.text}"
+        if response.status_code == 429:
+            raise openai.RateLimitError(message, response=response, body=error_body)
+        if response.status_code >= 500:
+            raise openai.InternalServerError(message, response=response, body=error_body)
+        raise openai.APIStatusError(message, response=response, body=error_body)
+    return ChatCompletion.model_validate(response.json())
 
 def transcribe_gpt4_audio(audio_file):
-    oai_client = get_oai_client()
-   
     print(f"Transcribing with gpt-4o-audio {audio_file}")
-    file = open(audio_file, "rb")
-    encoded_string = base64.b64encode(file.read()).decode('utf-8')
-    file.close()
-    file_extension = os.path.splitext(audio_file)[1][1:]
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                { 
-                    "type": "text",
-                    "text": "Transcribe the audio as is. no explanation needed. If you are able to detect the agent versus the customer, please label them as such. use **Customer:** and **Agent:** to label the speakers."
-                },
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Downsample / downmix first when configured, to shrink the payload
+        payload_file = audio_processing.prepare_audio(audio_file, work_dir)
+        file_extension = os.path.splitext(payload_file)[1][1:]
+        body = {
+            "model": AZURE_AUDIO_MODEL,
+            "modalities": ["text"],
+            "messages": [
                 {
-                    "type": "input_audio",
-                    "input_audio": {
-                        "data": encoded_string,
-                        "format": file_extension
-                    }
-                }
-            ]
-        },
-    ]
+                    "role": "user",
+                    "content": [
+                        { 
+                            "type": "text",
+                            "text": "Transcribe the audio as is. no explanation needed. If you are able to detect the agent versus the customer, please label them as such. use **Customer:** and **Agent:** to label the speakers."
+                        },
+                        {
+                            "type": "input_audio",
+                            "input_audio": {
+                                "data": _AUDIO_DATA_PLACEHOLDER,
+                                "format": file_extension
+                            }
+                        }
+                    ]
+                },
+            ],
+        }
 
-    completion = oai_client.chat.completions.create(
-        model=AZURE_AUDIO_MODEL,
-        modalities=["text"],
-        messages=messages
-    )
+        # The body is rebuilt on every attempt, so retries re-stream the file
+        completion = get_scheduler(AZURE_AUDIO_MODEL).run(
+            lambda: _post_chat_completion(AZURE_AUDIO_MODEL, body, payload_file, audio_file),
+            usage_tokens=_usage_tokens,
+        )
 
     return completion.choices[0].message.content
 
 
 def get_embedding(query_text):
-    oai_emb_client = AzureOpenAI(
-        api_version=AZURE_OPENAI_API_VERSION,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        azure_ad_token_provider=token_provider
-    )
+    cached = embedding_cache.get_many(AZURE_OPENAI_EMBEDDING_MODEL, EMBEDDING_DIM, [query_text])[0]
+    if cached is not None:
+        return cached
+
+    oai_emb_client = get_oai_client()
 
     response = oai_emb_client.embeddings.create(
         model=AZURE_OPENAI_EMBEDDING_MODEL,
         input=[query_text]  # input must be a list
     )
 
-    return response.data[0].embedding
+    embedding = response.data[0].embedding
+    embedding_cache.put_many(AZURE_OPENAI_EMBEDDING_MODEL, EMBEDDING_DIM, [query_text], [embedding])
+    return embedding
+
+def estimate_tokens(text):
+    """
+    Rough token estimate (~4 characters per token) used to size batches.
+    """
+    return len(text) // 4 + 1
+
+
+def pack_embedding_batches(texts, max_items=EMBEDDING_BATCH_SIZE, max_tokens=EMBEDDING_BATCH_TOKENS):
+    """
+    Group input positions into batches bounded by item count and estimated tokens.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+_embedding_rate_lock = threading.Lock()
+_next_embedding_request = 0.0
+
+def _wait_for_embedding_slot():
+    """
+    Space embedding requests evenly when EMBEDDING_REQUESTS_PER_MINUTE is set.
+    """
+    global _next_embedding_request
+    if EMBEDDING_REQUESTS_PER_MINUTE <= 0:
+        return
+    with _embedding_rate_lock:
+        now = time.monotonic()
+        wait = _next_embedding_request - now
+        _next_embedding_request = max(now, _next_embedding_request) + 60.0 / EMBEDDING_REQUESTS_PER_MINUTE
+    if wait > 0:
+        time.sleep(wait)
+
+
+def get_embeddings(texts, max_items=EMBEDDING_BATCH_SIZE, max_tokens=EMBEDDING_BATCH_TOKENS,
+                   max_workers=EMBEDDING_CONCURRENCY):
+    """
+    Embed many texts with as few requests as possible.
+    Inputs are packed into batches, batches run concurrently, and the vectors
+    are returned in the same order as `texts`. Texts already in the embedding
+    cache (and duplicates within the call) are not sent to the API.
+    """
+    # The embeddings API rejects empty strings
+    texts = [text if text else " " for text in texts]
+    vectors = embedding_cache.get_many(AZURE_OPENAI_EMBEDDING_MODEL, EMBEDDING_DIM, texts)
+    pending = {}  # normalized text -> positions still missing a vector
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            pending.setdefault(embedding_cache.normalize_text(texts[i]), []).append(i)
+    if not pending:
+        return vectors
+    to_embed = [texts[positions[0]] for positions in pending.values()]
+
+    oai_emb_client = get_oai_client()
+
+    def embed_batch(batch):
+        _wait_for_embedding_slot()
+        batch_texts = [to_embed[i] for i in batch]
+        response = oai_emb_client.embeddings.create(
+            model=AZURE_OPENAI_EMBEDDING_MODEL,
+            input=batch_texts
+        )
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        embedding_cache.put_many(AZURE_OPENAI_EMBEDDING_MODEL, EMBEDDING_DIM, batch_texts, embeddings)
+        return batch, embeddings
+
+    positions = list(pending.values())
+    batches = pack_embedding_batches(to_embed, max_items, max_tokens)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        for batch, embeddings in executor.map(embed_batch, batches):
+            for i, embedding in zip(batch, embeddings):
+                for position in positions[i]:
+                    vectors[position] = embedding
+    return vectors
 
 def chat_with_oai(messages, deployment=AZURE_OPENAI_DEPLOYMENT_NAME):
 
@@ -205,36 +514,24 @@ def chat_with_oai(messages, deployment=AZURE_OPENAI_DEPLOYMENT_NAME):
         if content:
             yield content
 
-def get_insights(summaries):
-
-    system_prompt = """
-    you will be provided with different call summaries, your task is to analyze all the summaries, and return key insights.
-
-    What are the main topics? Issues? Insights and recommendations
-
+def chat_completion(messages, deployment=AZURE_OPENAI_DEPLOYMENT_NAME, max_tokens=COMPLETION_TOKEN_RESERVE):
     """
-    oai_client = get_oai_client()
-    
-    messages = [
-        {
-            "role": "system",
-            "content": system_prompt
-        }
-    ] + [
-        {
-            "role": "user",
-            "content": f"call: {call} \n\n"
-        } for call in summaries
-    ]
-      
+    Plain-text chat completion through the deployment's scheduler.
+    """
+    oai_client = get_scheduled_client()
+    prompt_tokens = _messages_tokens(messages)
 
-    completion = oai_client.chat.completions.create(
-        messages=messages,
-        model=AZURE_OPENAI_DEPLOYMENT_NAME,   
-        temperature=0.2,
-        top_p=1,
-        max_tokens=5000,
-        stop=None,
-    )  
+    completion = get_scheduler(deployment).run(
+        token_accounting.metered(deployment, "chat_completion", lambda: oai_client.chat.completions.create(
+            messages=messages,
+            model=deployment,
+            temperature=0.2,
+            top_p=1,
+            max_tokens=max_tokens,
+            stop=None,
+        ), prompt_tokens),
+        estimated_tokens=prompt_tokens + max_tokens,
+        usage_tokens=_usage_tokens,
+    )
 
     return completion.choices[0].message.content
@@ -1,11 +1,15 @@
 import os
-from services import azure_oai
+from services import azure_oai, azure_clients, azure_storage, analysis_frame
 import json
+import time
+import base64
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-from azure.identity import DefaultAzureCredential
 
 import re
 
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
@@ -25,58 +29,37 @@ from azure.search.documents.indexes.models import (
 
 load_dotenv()
 
-azure_credentials = DefaultAzureCredential()
+azure_credentials = azure_clients.get_credential()
 
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 if not AZURE_SEARCH_ENDPOINT:
     raise ValueError("Please provide a valid Azure Search endpoint.")
 
+# Indexing pipeline: documents per upload batch, batches in flight, and retries
+# for documents the service rejected with a transient status code
+SEARCH_UPLOAD_BATCH_SIZE = int(os.getenv("SEARCH_UPLOAD_BATCH_SIZE", "100"))
+SEARCH_UPLOAD_CONCURRENCY = int(os.getenv("SEARCH_UPLOAD_CONCURRENCY", "4"))
+SEARCH_UPLOAD_MAX_RETRIES = int(os.getenv("SEARCH_UPLOAD_MAX_RETRIES", "3"))
+RETRYABLE_STATUS_CODES = {409, 422, 429, 500, 502, 503, 504}
+
 def get_search_index_client():
-    search_index_client = SearchIndexClient(
+    return azure_clients.get_or_create("search_index", lambda: SearchIndexClient(
         endpoint=AZURE_SEARCH_ENDPOINT, 
-        credential=azure_credentials
-    )
-    return search_index_client
+        credential=azure_credentials,
+        transport=azure_clients.get_azure_transport("search"),
+    ))
 
 def get_search_client(index_name):
-    search_client = SearchClient(
+    return azure_clients.get_or_create(("search", index_name), lambda: SearchClient(
         endpoint=AZURE_SEARCH_ENDPOINT, 
         index_name=index_name,
         credential=azure_credentials,
-    )
-    return search_client
+        transport=azure_clients.get_azure_transport("search"),
+    ))
 
 # ------------------------------------------------------------------------------
 # 2) Helpers to Flatten JSON and Infer Fields
 # ------------------------------------------------------------------------------
-def flatten_json(nested_json, parent_key="", sep="."):
-    """
-    Flatten JSON if there's only a single level of nesting.
-    Example:
-       {
-         "sentiment": "great",
-         "score": 2,
-         "explanation": {
-              "reason": "agent was helpful",
-              "feedback": "awesome"
-          }
-       }
-    -> {
-         "sentiment": "great",
-         "score": 2,
-         "explanation.reason": "agent was helpful",
-         "explanation.feedback": "awesome"
-       }
-    """
-    items = []
-    for k, v in nested_json.items():
-        new_key = parent_key + sep + k if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_json(v, new_key, sep=sep).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
-
 def normalize_field_name(name: str) -> str:
     # Replace any character that is not a letter, digit, or underscore with an underscore.
     normalized = re.sub(r'[^A-Za-z0-9_]', '_', name)
@@ -108,10 +91,15 @@ def build_dynamic_fields_from_json(flattened_json):
     to be used in the index definition.
     """
     fields = []
+    names = set()
     # We will create a "dynamic" definition for each field we find.
     # We'll treat strings as `SearchableField` and numeric/bool as `SimpleField`.
     for k, v in flattened_json.items():
         normalized_key = normalize_field_name(k)
+        # Keys that normalize to the same name share one field
+        if normalized_key in names:
+            continue
+        names.add(normalized_key)
         field_type = infer_field_type(v)
         # If it's a string type, we can make it a 'SearchableField'
         if field_type == SearchFieldDataType.String:
@@ -125,18 +113,52 @@ def build_dynamic_fields_from_json(flattened_json):
 # ------------------------------------------------------------------------------
 # 3) Create or Update the Index Dynamically
 # ------------------------------------------------------------------------------
-def create_or_update_index(index_name: str, sample_document: dict):
+def _union_of_fields(documents):
     """
-    Create or update the index definition, pulling field names/types from a sample doc.
+    Flattened key -> sample value over all documents: every key any document
+    has, typed by its first non-null value.
     """
-    # Flatten the sample document (in case there's one-level nesting).
-    flattened_sample = flatten_json(sample_document)
+    union = {}
+    for document in documents:
+        for k, v in analysis_frame.flatten_json(document).items():
+            if union.get(k) is None:
+                union[k] = v
+    return union
 
-    # Build dynamic fields
-    dynamic_fields = build_dynamic_fields_from_json(flattened_sample)
+
+def create_or_update_index(index_name: str, documents):
+    """
+    Create the index, or add to it, with the fields of every document in
+    documents (a list of analysis JSON docs). An existing index keeps all its
+    fields and settings; only fields it does not have yet are added, since
+    fields cannot be removed or changed in place.
+    """
+    # Build dynamic fields from the union of the documents' flattened keys
+    dynamic_fields = build_dynamic_fields_from_json(_union_of_fields(documents))
+
+    search_index_client = get_search_index_client()
+    try:
+        existing = search_index_client.get_index(index_name)
+    except Exception:
+        existing = None
+    if existing is not None:
+        known = {field.name for field in existing.fields}
+        new_fields = [field for field in dynamic_fields if field.name not in known]
+        if not new_fields:
+            return f"Index '{index_name}' already has every field.", True
+        existing.fields = list(existing.fields) + new_fields
+        try:
+            print(f"Adding {len(new_fields)} field(s) to index '{index_name}'...")
+            result = search_index_client.create_or_update_index(existing)
+            return f"Index '{result.name}' updated.", True
+        except Exception as e:
+            print(f"Failed to update the index: {str(e)}")
+            return f"Failed to update the index: {str(e)}", False
 
     # Always define a "key" field. We'll name it "id" here.
     key_field = SimpleField(name="id", type="Edm.String", key=True)
+    # The call the document was built from; its key is derived from it.
+    call_id_field = SimpleField(name="call_id", type="Edm.String", filterable=True)
 
     # Define the embedding vector field
     vector_field = SearchField(
@@ -151,8 +173,9 @@ def create_or_update_index(index_name: str, sample_document: dict):
     # for semantic search and/or normal text queries
     content_field = SearchableField(name="content", type="Edm.String")
 
-    # Final list of fields
-    fields = [key_field] + dynamic_fields + [content_field, vector_field]
+    # Final list of fields (analysis keys named like a fixed field are not added twice)
+    fixed = {"id", "call_id", "content", "contentVector"}
+    fields = [key_field, call_id_field] + [f for f in dynamic_fields if f.name not in fixed] + [content_field, vector_field]
 
     # Vector search config
     vector_search = VectorSearch(
@@ -186,16 +209,154 @@ def create_or_update_index(index_name: str, sample_document: dict):
     )
     
        
-    # Create or update index
+    # Create index
     try:
-        search_index_client = get_search_index_client()
-        print(f"Creating or updating index '{index_name}'...")
+        print(f"Creating index '{index_name}'...")
         result = search_index_client.create_or_update_index(index)
-        return f"Index '{result.name}' created or updated.", True
+        return f"Index '{result.name}' created.", True
     except Exception as e:
         print(f"Failed to create/update the index: {str(e)}")
         return f"Failed to create/update the index: {str(e)}", False
 
+# ------------------------------------------------------------------------------
+# 4) Build documents and stream them into the index
+# ------------------------------------------------------------------------------
+def document_key(call_id: str) -> str:
+    """
+    Stable index key for a call. Keys only allow letters, digits, '_', '-' and '=',
+    so the call id is URL-safe base64 encoded.
+    """
+    return base64.urlsafe_b64encode(call_id.encode("utf-8")).decode("ascii")
+
+
+def build_search_document(doc, doc_id, call_id=None):
+    """
+    Flatten one analysis JSON into an index document (without its vector).
+    """
+    flattened = analysis_frame.flatten_json(doc)
+
+    # We'll build a 'content' string from all string fields
+    text_parts = []
+    for k, v in flattened.items():
+        if isinstance(v, str):
+            text_parts.append(v)
+    combined_text = " ".join(text_parts) if text_parts else ""
+
+    # Prepare final doc
+    final_doc = {
+        "id": doc_id,
+        "call_id": call_id,
+        "content": combined_text,
+    }
+    # Add flattened fields using normalized keys
+    for k, v in flattened.items():
+        normalized_key = normalize_field_name(k)
+        # If the value is a list, join it into a string
+        if isinstance(v, list):
+            final_doc[normalized_key] = " ".join(map(str, v))
+        else:
+            final_doc[normalized_key] = v
+    return final_doc
+
+
+def _iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _is_transient(error):
+    """
+    Whether a failed upload request is worth sending again: throttling, server
+    errors, and connection failures or timeouts.
+    """
+    if isinstance(error, HttpResponseError) and error.status_code is not None:
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (ServiceRequestError, ServiceResponseError, TimeoutError))
+
+
+def _embed_and_upload_batch(search_client, batch):
+    """
+    Embed one batch, upload it, and re-send only the documents that failed
+    with a retryable status. Returns (indexed, failed_keys, retried, errors).
+    """
+    embeddings = azure_oai.get_embeddings([doc["content"] for doc in batch])
+    for doc, embedding_vector in zip(batch, embeddings):
+        doc["contentVector"] = embedding_vector
+
+    indexed, retried = 0, 0
+    failed_keys = []
+    errors = []
+    pending = {doc["id"]: doc for doc in batch}
+    for attempt in range(SEARCH_UPLOAD_MAX_RETRIES + 1):
+        retryable = {}
+        try:
+            results = search_client.upload_documents(documents=list(pending.values()))
+        except Exception as e:
+            errors.append(str(e))
+            if not _is_transient(e):
+                # Bad request, auth, payload too large, ...: sending it again cannot help
+                failed_keys.extend(pending)
+                break
+            # The whole request was throttled or timed out: every document is retryable
+            retryable = pending
+        else:
+            for result in results:
+                if result.succeeded:
+                    indexed += 1
+                elif result.status_code in RETRYABLE_STATUS_CODES:
+                    retryable[result.key] = pending[result.key]
+                else:
+                    failed_keys.append(result.key)
+                    errors.append(f"{result.key}: {result.error_message}")
+
+        if not retryable:
+            break
+        if attempt == SEARCH_UPLOAD_MAX_RETRIES:
+            failed_keys.extend(retryable)
+            break
+        retried += len(retryable)
+        pending = retryable
+        time.sleep(2 ** attempt)
+
+    return indexed, failed_keys, retried, errors
+
+
+def index_documents(index_name, documents, batch_size=SEARCH_UPLOAD_BATCH_SIZE,
+                    max_in_flight=SEARCH_UPLOAD_CONCURRENCY):
+    """
+    Stream documents (an iterable of index documents without vectors) into the index.
+    Documents are embedded and uploaded in fixed-size batches with at most
+    max_in_flight batches in memory at a time.
+    Returns {"indexed", "failed", "retried", "failed_keys", "errors"}.
+    """
+    search_client = get_search_client(index_name)
+    stats = {"indexed": 0, "failed": 0, "retried": 0, "failed_keys": [], "errors": []}
+
+    def collect(done):
+        for future in done:
+            indexed, failed_keys, retried, errors = future.result()
+            stats["indexed"] += indexed
+            stats["failed"] += len(failed_keys)
+            stats["failed_keys"].extend(failed_keys)
+            stats["retried"] += retried
+            stats["errors"].extend(errors)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = set()
+        for batch in _iter_batches(documents, batch_size):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(_embed_and_upload_batch, search_client, batch))
+        collect(wait(in_flight).done)
+
+    return stats
+
+
 # ------------------------------------------------------------------------------
 # 4) Load JSON Docs and Upsert
 # ------------------------------------------------------------------------------
@@ -203,64 +364,102 @@ def load_json_into_azure_search(index_name, json_docs):
     """
     Takes a list of JSON documents. For each:
       1) Flatten the JSON.
-      2) Build an embedding manually via get_embedding().
-      3) Upsert to Azure Search with 'contentVector'.
+      2) Build embeddings per upload batch via batched get_embeddings().
+      3) Upsert to Azure Search with 'contentVector', batch by batch.
     """
     if not json_docs:
         return "No documents to process.", False
 
-    # 6a) Create/Update the index with the first doc as a template
-    sample_doc = json_docs[0]
-    message, result = create_or_update_index(index_name, sample_doc)
+    # 6a) Create/Update the index with the fields of all docs
+    message, result = create_or_update_index(index_name, json_docs)
     if not result:
         return message, False
 
-    # 6b) Create a SearchClient
-    search_client = get_search_client(index_name)
-
-    # 6c) Convert each doc to final structure for upserting
-    actions = []
-    for i, doc in enumerate(json_docs):
-        flattened = flatten_json(doc)
-        doc_id = f"doc-{i}"
-
-        # We'll build a 'content' string from all string fields
-        text_parts = []
-        for k, v in flattened.items():
-            if isinstance(v, str):
-                text_parts.append(v)
-        combined_text = " ".join(text_parts) if text_parts else ""
-
-        # Manually get embeddings
-        embedding_vector = azure_oai.get_embedding(combined_text)
-
-        # Prepare final doc
-        final_doc = {
-            "id": doc_id,
-            "content": combined_text,
-            "contentVector": embedding_vector
-        }
-        # Add flattened fields
-        # Add flattened fields using normalized keys
-        for k, v in flattened.items():
-            normalized_key = normalize_field_name(k)
-            # If the value is a list, join it into a string
-            if isinstance(v, list):
-                final_doc[normalized_key] = " ".join(map(str, v))
-            else:
-                final_doc[normalized_key] = v
-
-
-        actions.append(final_doc)
-
-    # 6d) Upsert in bulk
+    # 6b) Stream documents through the embed + upload pipeline
+    documents = (build_search_document(doc, f"doc-{i}") for i, doc in enumerate(json_docs))
     try:
-        results = search_client.upload_documents(documents=actions)
-        print(f"Upserted {len(actions)} documents into index '{index_name}'.")
-        return "All document indexed", True
+        stats = index_documents(index_name, documents)
     except Exception as e:
         return f"Failed to index documents: {e}", False
 
+    summary = f"Indexed {stats['indexed']}, failed {stats['failed']}, retried {stats['retried']} documents"
+    print(f"{summary} in index '{index_name}'.")
+    if stats["failed"]:
+        return f"{summary}. First errors: {stats['errors'][:3]}", False
+    return summary, True
+
+def delete_documents(index_name, keys, batch_size=SEARCH_UPLOAD_BATCH_SIZE):
+    """
+    Remove documents by key. Returns the number of documents deleted.
+    """
+    search_client = get_search_client(index_name)
+    deleted = 0
+    for batch in _iter_batches(keys, batch_size):
+        results = search_client.delete_documents(documents=[{"id": key} for key in batch])
+        deleted += sum(1 for result in results if result.succeeded)
+    return deleted
+
+
+def sync_llm_analysis_index(index_name, prompt_name):
+    """
+    Incrementally bring an index in line with the persona's analysis blobs.
+    A manifest of {file_name: etag} records what the index holds: only new or
+    changed analyses are embedded and upserted, and deleted calls are removed.
+    """
+    versions = azure_storage.get_llmanalysis_versions(prompt_name)
+    exists = index_exists(index_name)
+    manifest = azure_storage.read_index_manifest(index_name) if exists else {}
+    if exists and not manifest:
+        # Index built before manifests existed (positional doc-<i> keys): rebuild from scratch.
+        get_search_index_client().delete_index(index_name)
+
+    changed = [f for f, etag in versions.items() if manifest.get(f) != etag]
+    removed = [f for f in manifest if f not in versions]
+    if not changed and not removed:
+        return "Index is already up to date.", True
+
+    docs = {}
+    read_errors = []
+    for file_name, data, error in azure_storage.read_llm_analyses(prompt_name, changed):
+        if error is None and not isinstance(data, dict):
+            error = "analysis is not a JSON object"
+        if error is not None:
+            read_errors.append(f"{file_name}: {error}")
+        else:
+            docs[file_name] = data
+
+    stats = {"indexed": 0, "failed": 0, "retried": 0, "failed_keys": [], "errors": []}
+    if docs:
+        message, result = create_or_update_index(index_name, list(docs.values()))
+        if not result:
+            return message, False
+        documents = (
+            build_search_document(data, document_key(os.path.splitext(f)[0]), os.path.splitext(f)[0])
+            for f, data in docs.items()
+        )
+        stats = index_documents(index_name, documents)
+        failed_keys = set(stats["failed_keys"])
+        for f in docs:
+            if document_key(os.path.splitext(f)[0]) not in failed_keys:
+                manifest[f] = versions[f]
+
+    deleted = 0
+    if removed:
+        deleted = delete_documents(index_name, [document_key(os.path.splitext(f)[0]) for f in removed])
+        for f in removed:
+            manifest.pop(f, None)
+
+    azure_storage.save_index_manifest(index_name, manifest)
+
+    summary = (f"Indexed {stats['indexed']}, failed {stats['failed'] + len(read_errors)}, "
+               f"retried {stats['retried']}, removed {deleted} documents")
+    print(f"{summary} in index '{index_name}'.")
+    errors = read_errors + stats["errors"]
+    if errors:
+        return f"{summary}. First errors: {errors[:3]}", False
+    return summary, True
+
+
 def search_query(index_name, query):
     """
     Search Azure Search index with a query string.
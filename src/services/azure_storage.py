@@ -1,11 +1,17 @@
 import os
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from dotenv import load_dotenv
-from azure.identity import DefaultAzureCredential
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
 from azure.storage.blob import BlobServiceClient
 from azure.storage.queue import QueueClient
 
+from services import audio_cache, azure_clients
+
 load_dotenv()
 
 # Environment / configuration
@@ -20,12 +26,34 @@ EVAL_FOLDER = os.getenv("EVAL_FOLDER", "evals")
 PROMPT_FOLDER = os.getenv("PROMPT_FOLDER", "prompts")
 LLM_ANALYSIS_FOLDER = os.getenv("LLM_ANALYSIS_FOLDER", "llmanalysis")
 STORAGE_QUEUE_NAME = os.getenv("STORAGE_QUEUE_NAME", "integration-queue")
+TRANSCRIPTION_QUEUE_NAME = os.getenv("TRANSCRIPTION_QUEUE_NAME", "transcription-jobs")
+INDEX_MANIFEST_FOLDER = os.getenv("INDEX_MANIFEST_FOLDER", "search_manifests")
+# How long (seconds) a prefix listing is trusted before it is revalidated
+BLOB_INDEX_TTL = float(os.getenv("BLOB_INDEX_TTL", "30"))
+# How long (seconds) a cached config/prompt blob is served before it is revalidated
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", "5"))
+# Number of blobs fetched in parallel by the bulk readers
+BLOB_READ_CONCURRENCY = int(os.getenv("BLOB_READ_CONCURRENCY", "16"))
+# Large blobs are transferred in blocks/chunks of this size, several at a time,
+# so memory use stays flat regardless of file size.
+BLOB_MAX_CONCURRENCY = int(os.getenv("BLOB_MAX_CONCURRENCY", "4"))
+BLOB_BLOCK_SIZE = int(os.getenv("BLOB_BLOCK_SIZE", str(4 * 1024 * 1024)))
+BLOB_MAX_SINGLE_PUT_SIZE = int(os.getenv("BLOB_MAX_SINGLE_PUT_SIZE", str(8 * 1024 * 1024)))
+BLOB_CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_SIZE", str(4 * 1024 * 1024)))
 
 # Build URL to your blob storage & create credential + service client
 blob_account_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net"
 queue_account_url = f"https://{STORAGE_ACCOUNT_NAME}.queue.core.windows.net"
-credential = DefaultAzureCredential()
-blob_service_client = BlobServiceClient(account_url=blob_account_url, credential=credential)
+credential = azure_clients.get_credential()
+blob_service_client = BlobServiceClient(
+    account_url=blob_account_url,
+    credential=credential,
+    transport=azure_clients.get_azure_transport("blob"),
+    max_block_size=BLOB_BLOCK_SIZE,
+    max_single_put_size=BLOB_MAX_SINGLE_PUT_SIZE,
+    max_chunk_get_size=BLOB_CHUNK_SIZE,
+    max_single_get_size=BLOB_CHUNK_SIZE,
+)
 
 
 def ensure_container_exists(container_name: str = DEFAULT_CONTAINER):
@@ -61,22 +89,144 @@ def list_blobs(prefix: str = "", container_name: str = DEFAULT_CONTAINER):
     return [blob.name.split("/")[-1] for blob in blob_list]
 
 
-def upload_blob(data, blob_name: str, prefix: str = "", container_name: str = DEFAULT_CONTAINER):
+# ----------------------------------------------------------------------------
+# In-process blob inventory
+# ----------------------------------------------------------------------------
+# One listing per (container, prefix) fills the index with name -> properties.
+# Lookups are answered from memory; after BLOB_INDEX_TTL the prefix is listed
+# again and only entries whose last_modified changed are replaced. Uploads and
+# deletes done through this module update the index in place.
+_blob_index = {}
+_blob_index_lock = threading.Lock()
+
+
+def _blob_entry(blob):
+    return {
+        "etag": blob.etag,
+        "size": blob.size,
+        "last_modified": blob.last_modified,
+        "metadata": blob.metadata or {},
+    }
+
+
+def _refresh_blob_index(container_name: str, prefix: str):
+    """
+    List a prefix once and merge the result into the inventory index.
+    """
+    ensure_container_exists(container_name)
+    container_client = blob_service_client.get_container_client(container_name)
+    key = (container_name, prefix)
+    with _blob_index_lock:
+        previous = _blob_index.get(key, {}).get("blobs", {})
+
+    blobs = {}
+    for blob in container_client.list_blobs(name_starts_with=prefix, include=["metadata"]):
+        entry = previous.get(blob.name)
+        if entry is None or entry["last_modified"] != blob.last_modified:
+            entry = _blob_entry(blob)
+        blobs[blob.name] = entry
+
+    with _blob_index_lock:
+        _blob_index[key] = {"blobs": blobs, "refreshed_at": time.monotonic()}
+    return blobs
+
+
+def _indexed_blobs(container_name: str, prefix: str, refresh: bool = False):
+    """
+    Return the live index dict for a prefix, listing it first if missing or stale.
+    Callers must hold _blob_index_lock while reading the returned dict.
+    """
+    key = (container_name, prefix)
+    with _blob_index_lock:
+        cached = _blob_index.get(key)
+        fresh = cached is not None and time.monotonic() - cached["refreshed_at"] < BLOB_INDEX_TTL
+    if fresh and not refresh:
+        return cached["blobs"]
+    return _refresh_blob_index(container_name, prefix)
+
+
+def get_blob_index(prefix: str = "", container_name: str = DEFAULT_CONTAINER, refresh: bool = False):
+    """
+    Return {full_blob_name: {"etag", "size", "last_modified"}} for a prefix.
+    The prefix is listed at most once per BLOB_INDEX_TTL unless refresh=True.
+    """
+    blobs = _indexed_blobs(container_name, prefix, refresh)
+    with _blob_index_lock:
+        return dict(blobs)
+
+
+def invalidate_blob_index(prefix: str = None, container_name: str = DEFAULT_CONTAINER):
+    """
+    Drop the cached listing for a prefix (or for every prefix if none is given).
+    """
+    with _blob_index_lock:
+        if prefix is None:
+            _blob_index.clear()
+        else:
+            _blob_index.pop((container_name, prefix), None)
+
+
+def _update_blob_index(container_name: str, blob_path: str, entry=None):
+    """
+    Record an upload (entry) or a delete (entry=None) in every indexed prefix covering blob_path.
+    """
+    with _blob_index_lock:
+        for (indexed_container, indexed_prefix), cached in _blob_index.items():
+            if indexed_container != container_name or not blob_path.startswith(indexed_prefix):
+                continue
+            if entry is None:
+                cached["blobs"].pop(blob_path, None)
+            else:
+                cached["blobs"][blob_path] = entry
+
+
+def list_indexed_blobs(prefix: str = "", container_name: str = DEFAULT_CONTAINER):
+    """
+    Same result as list_blobs(), answered from the inventory index.
+    """
+    blobs = _indexed_blobs(container_name, prefix)
+    with _blob_index_lock:
+        return [name.split("/")[-1] for name in blobs]
+
+
+def blob_exists(blob_name: str, prefix: str = "", container_name: str = DEFAULT_CONTAINER):
+    """
+    O(1) existence check for prefix/blob_name against the inventory index.
+    """
+    path = f"{prefix}/{blob_name}" if prefix else blob_name
+    blobs = _indexed_blobs(container_name, prefix)
+    with _blob_index_lock:
+        return path in blobs
+
+
+def upload_blob(data, blob_name: str, prefix: str = "", container_name: str = DEFAULT_CONTAINER,
+                max_concurrency: int = BLOB_MAX_CONCURRENCY, metadata: dict = None):
     """
     Upload the given data (file-like or bytes/string) to a blob name within a container/prefix.
-    Overwrites if it exists.
+    Overwrites if it exists. File-like data larger than BLOB_MAX_SINGLE_PUT_SIZE is
+    streamed as BLOB_BLOCK_SIZE blocks, max_concurrency at a time.
     """
     if data is None:
         return "No data to upload."
     client = get_blob_client(blob_name, prefix, container_name)
-    client.upload_blob(data, overwrite=True)
+    response = client.upload_blob(data, overwrite=True, max_concurrency=max_concurrency, metadata=metadata)
+    _invalidate_cached_blob(client.blob_name)
+    _update_blob_index(container_name, client.blob_name, {
+        "etag": response.get("etag"),
+        "size": len(data) if isinstance(data, (bytes, str)) else None,
+        "last_modified": response.get("last_modified"),
+        "metadata": metadata or {},
+    })
     return f"Uploaded file to: {prefix}/{blob_name}" if prefix else f"Uploaded file to: {blob_name}"
 
 
-def download_blob_to_local_file(blob_name: str, prefix: str = "", local_path: str = None, overwrite: bool = False):
+def download_blob_to_local_file(blob_name: str, prefix: str = "", local_path: str = None, overwrite: bool = False,
+                                max_concurrency: int = BLOB_MAX_CONCURRENCY, etag: str = None):
     """
     Download a blob to a local file path. If local_path is not provided,
     it defaults to using the same file name as the blob_name in the current directory.
+    The blob is written to disk chunk by chunk and never held in memory as a whole.
+    With etag, the download fails if the blob no longer has that version.
     """
     if not local_path:
         local_path = blob_name  # Use blob_name as the default local file name
@@ -84,7 +234,7 @@ def download_blob_to_local_file(blob_name: str, prefix: str = "", local_path: st
     directory = os.path.dirname(local_path)
 
     # Create the directory if it doesn't exist
-    if not os.path.exists(directory):
+    if directory and not os.path.exists(directory):
         os.makedirs(directory)
     
     if not overwrite and os.path.exists(local_path):
@@ -94,31 +244,139 @@ def download_blob_to_local_file(blob_name: str, prefix: str = "", local_path: st
     # combine local working dir with local_path
     local_path = os.path.join(os.getcwd(), local_path)
     with open(local_path, "wb") as file_obj:
-        download_stream = client.download_blob()
-        file_obj.write(download_stream.readall())
+        if etag:
+            download_stream = client.download_blob(
+                max_concurrency=max_concurrency, etag=etag, match_condition=MatchConditions.IfNotModified
+            )
+        else:
+            download_stream = client.download_blob(max_concurrency=max_concurrency)
+        download_stream.readinto(file_obj)
 
     return local_path
 
 
+def _read_blob_text(blob_name: str, prefix: str = ""):
+    client = get_blob_client(blob_name, prefix)
+    download_stream = client.download_blob(max_concurrency=BLOB_MAX_CONCURRENCY, encoding="utf-8")
+    return download_stream.readall()
+
+
+def read_blob_bytes(blob_name: str, prefix: str = ""):
+    """
+    Read blob content as bytes, or None if it does not exist.
+    """
+    client = get_blob_client(blob_name, prefix)
+    try:
+        return client.download_blob(max_concurrency=BLOB_MAX_CONCURRENCY).readall()
+    except ResourceNotFoundError:
+        return None
+
+
+def stream_blob(blob_name: str, prefix: str = ""):
+    """
+    Yield a blob's content as bytes chunks of at most BLOB_CHUNK_SIZE.
+    """
+    client = get_blob_client(blob_name, prefix)
+    for chunk in client.download_blob().chunks():
+        yield chunk
+
+
 def read_blob(blob_name: str, prefix: str = ""):
     """
     Read blob content as text (UTF-8).
     """
     try:
-        client = get_blob_client(blob_name, prefix)
-        download_stream = client.download_blob()
-        return download_stream.readall().decode("utf-8")
+        return _read_blob_text(blob_name, prefix)
     except Exception as e:
         print(f"Error reading blob: {e}")
         return None
 
 
+# ----------------------------------------------------------------------------
+# Resident cache for small, hot text blobs (app config, prompts, prompt configs)
+# ----------------------------------------------------------------------------
+
+# blob path -> {"content", "etag", "checked_at"}; content None records a missing blob
+_text_cache = {}
+_text_cache_lock = threading.Lock()
+_text_cache_stats = {"hits": 0, "revalidated": 0, "downloads": 0}
+
+
+def read_cached_blob(blob_name: str, prefix: str = ""):
+    """
+    Read a small text blob through the resident cache. Within CONFIG_CACHE_TTL
+    the cached copy is returned without any request; after that a conditional
+    GET (If-None-Match) revalidates it, which costs one round trip and no body
+    when the blob is unchanged. Returns None if the blob does not exist.
+    """
+    path = f"{prefix}/{blob_name}" if prefix else blob_name
+    with _text_cache_lock:
+        entry = _text_cache.get(path)
+        if entry and time.monotonic() - entry["checked_at"] < CONFIG_CACHE_TTL:
+            _text_cache_stats["hits"] += 1
+            return entry["content"]
+
+    client = get_blob_client(blob_name, prefix)
+    try:
+        if entry and entry["etag"]:
+            download_stream = client.download_blob(
+                encoding="utf-8", etag=entry["etag"], match_condition=MatchConditions.IfModified
+            )
+        else:
+            download_stream = client.download_blob(encoding="utf-8")
+        entry = {"content": download_stream.readall(), "etag": download_stream.properties.etag}
+        counter = "downloads"
+    except ResourceNotModifiedError:
+        entry = {"content": entry["content"], "etag": entry["etag"]}
+        counter = "revalidated"
+    except ResourceNotFoundError:
+        entry = {"content": None, "etag": None}
+        counter = "downloads"
+
+    entry["checked_at"] = time.monotonic()
+    with _text_cache_lock:
+        _text_cache[path] = entry
+        _text_cache_stats[counter] += 1
+    return entry["content"]
+
+
+def _invalidate_cached_blob(blob_path: str):
+    with _text_cache_lock:
+        _text_cache.pop(blob_path, None)
+
+
+def get_text_cache_stats():
+    with _text_cache_lock:
+        return {**_text_cache_stats, "items": len(_text_cache)}
+
+
+def read_blobs(blob_names, prefix: str = "", max_workers: int = BLOB_READ_CONCURRENCY):
+    """
+    Read many blobs as text with bounded concurrency.
+    Yields (blob_name, content, error) as each download finishes; a failed
+    blob yields content=None and the exception instead of aborting the batch.
+    """
+    blob_names = list(blob_names)
+    if not blob_names:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(blob_names)))) as executor:
+        futures = {executor.submit(_read_blob_text, name, prefix): name for name in blob_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                yield name, future.result(), None
+            except Exception as e:
+                yield name, None, e
+
+
 def delete_blob(blob_name: str, prefix: str = ""):
     """
     Delete a blob from the container/prefix.
     """
     client = get_blob_client(blob_name, prefix)
     client.delete_blob()
+    _invalidate_cached_blob(client.blob_name)
+    _update_blob_index(DEFAULT_CONTAINER, client.blob_name)
     return f"Deleted blob: {prefix}/{blob_name}" if prefix else f"Deleted blob: {blob_name}"
 
 
@@ -134,7 +392,7 @@ def update_blob(blob_name: str, updated_content, prefix: str = ""):
 # ----------------------------------------------------------------------------
 
 def list_audios():
-    return list_blobs(AUDIO_FOLDER)
+    return list_indexed_blobs(AUDIO_FOLDER)
 
 
 def list_evals(prompt_name):
@@ -143,13 +401,13 @@ def list_evals(prompt_name):
     """
     prompt_no_ext = prompt_name.split('.')[0]
     prefix = f"{EVAL_FOLDER}/{prompt_no_ext}"
-    return list_blobs(prefix)
+    return list_indexed_blobs(prefix)
 
 def list_transcriptions():
-    return list_blobs(TRANSCRIPTION_FOLDER)
+    return list_indexed_blobs(TRANSCRIPTION_FOLDER)
 
 def list_prompts():
-    all_prompts = list_blobs(PROMPT_FOLDER)
+    all_prompts = list_indexed_blobs(PROMPT_FOLDER)
     # Filter out config files
     return [p for p in all_prompts if "__config" not in p]
 
@@ -162,8 +420,32 @@ def upload_audio_to_blob(file):
 def upload_prompt_to_blob(file):
     return upload_blob(file, file.name, PROMPT_FOLDER)
     
-def download_audio_to_local_file(blob_name):
-    return download_blob_to_local_file(blob_name, AUDIO_FOLDER, "./tmp/" + blob_name)
+def get_blob_etag(blob_name: str, prefix: str = ""):
+    """
+    Return the blob's etag, from the inventory index when possible.
+    """
+    path = f"{prefix}/{blob_name}" if prefix else blob_name
+    blobs = _indexed_blobs(DEFAULT_CONTAINER, prefix)
+    with _blob_index_lock:
+        entry = blobs.get(path)
+    if entry and entry["etag"]:
+        return entry["etag"]
+    return get_blob_client(blob_name, prefix).get_blob_properties().etag
+
+def acquire_audio(blob_name):
+    """
+    Return an audio blob from the etag-keyed audio cache as an
+    audio_cache.CachedAudio: its .path stays on disk until .release() (or use
+    it as a context manager). The etag is read from the service, not the
+    inventory index, so a blob replaced since the last listing is never
+    served from an older cache entry.
+    """
+    etag = get_blob_client(blob_name, AUDIO_FOLDER).get_blob_properties().etag
+    return audio_cache.acquire(
+        blob_name,
+        etag,
+        lambda tmp_path: download_blob_to_local_file(blob_name, AUDIO_FOLDER, tmp_path, overwrite=True, etag=etag),
+    )
 
 def delete_audio(blob_name):
     return delete_blob(blob_name, AUDIO_FOLDER)
@@ -175,7 +457,11 @@ def delete_transcription(blob_name):
     return delete_blob(blob_name, TRANSCRIPTION_FOLDER)
 
 def read_prompt(blob_name):
-    return read_blob(blob_name, PROMPT_FOLDER)
+    try:
+        return read_cached_blob(blob_name, PROMPT_FOLDER)
+    except Exception as e:
+        print(f"Error reading blob: {e}")
+        return None
 
 def update_prompt(blob_name, updated_content):
     return update_blob(blob_name, updated_content, PROMPT_FOLDER)
@@ -194,10 +480,16 @@ def transcription_already_exists(blob_name: str):
     Check if a transcription for `blob_name` (as .txt) already exists.
     """
     transcription_file_name = blob_name + ".txt"
-    return transcription_file_name in list_blobs(TRANSCRIPTION_FOLDER)
+    return blob_exists(transcription_file_name, TRANSCRIPTION_FOLDER)
 
 
 def get_calls_to_transcribe():
+    """
+    Split the audio backlog into calls still missing a transcription.
+    Costs one listing of AUDIO_FOLDER and one of TRANSCRIPTION_FOLDER, however many calls exist.
+    """
+    _indexed_blobs(DEFAULT_CONTAINER, AUDIO_FOLDER, refresh=True)
+    _indexed_blobs(DEFAULT_CONTAINER, TRANSCRIPTION_FOLDER, refresh=True)
     calls = list_audios()
     total_calls = len(calls)
     total_transcribed = 0
@@ -230,7 +522,7 @@ def read_prompt_config(blob_name):
     """
     config_blob_name = blob_name.split('.')[0] + "__config.txt"
     try:
-        content = read_blob(config_blob_name, PROMPT_FOLDER)
+        content = read_cached_blob(config_blob_name, PROMPT_FOLDER)
         return content.split(",")
     except Exception:
         return None
@@ -241,7 +533,7 @@ def read_config():
     """
     config_blob_name = "app_config.json"
     try:
-        content = read_blob(config_blob_name, None)
+        content = read_cached_blob(config_blob_name)
         return json.loads(content)
     except Exception:
         return None
@@ -263,7 +555,29 @@ def list_llmanalysis(prompt_name):
     """
     prompt_no_ext = prompt_name.split('.')[0]
     prefix = f"{LLM_ANALYSIS_FOLDER}/{prompt_no_ext}"
-    return list_blobs(prefix)
+    return list_indexed_blobs(prefix)
+
+
+def get_llmanalysis_versions(prompt_name, refresh: bool = True):
+    """
+    Return {file_name: etag} for every analysis directly under /LLM_ANALYSIS_FOLDER/<prompt_no_ext>/,
+    from a fresh listing, or with refresh=False from the blob index (see get_blob_index).
+    """
+    prompt_no_ext = prompt_name.split('.')[0]
+    prefix = f"{LLM_ANALYSIS_FOLDER}/{prompt_no_ext}/"
+    blobs = get_blob_index(prefix, refresh=refresh)
+    return {name[len(prefix):]: entry["etag"] for name, entry in blobs.items() if "/" not in name[len(prefix):]}
+
+
+def get_eval_versions(prompt_name, refresh: bool = True):
+    """
+    Return {file_name: etag} for every eval directly under /EVAL_FOLDER/<prompt_no_ext>/,
+    from a fresh listing, or with refresh=False from the blob index (see get_blob_index).
+    """
+    prompt_no_ext = prompt_name.split('.')[0]
+    prefix = f"{EVAL_FOLDER}/{prompt_no_ext}/"
+    blobs = get_blob_index(prefix, refresh=refresh)
+    return {name[len(prefix):]: entry["etag"] for name, entry in blobs.items() if "/" not in name[len(prefix):]}
 
 
 def read_llm_analysis(prompt_name: str, file_name: str) -> dict:
@@ -290,9 +604,40 @@ def read_eval(prompt_name: str, file_name: str) -> dict:
     except:
         return {}
 
-def upload_llm_analysis_to_blob(name, prompt, analysis):
+def _read_json_blobs(prefix, file_names, max_workers):
+    for file_name, content, error in read_blobs(file_names, prefix, max_workers):
+        if error is None:
+            try:
+                yield file_name, json.loads(content), None
+                continue
+            except ValueError as e:
+                error = e
+        yield file_name, {}, error
+
+
+def read_llm_analyses(prompt_name: str, file_names, max_workers: int = BLOB_READ_CONCURRENCY):
+    """
+    Bulk version of read_llm_analysis().
+    Yields (file_name, analysis_dict, error) in completion order; failed or
+    malformed blobs yield an empty dict together with the error.
+    """
+    prompt_no_ext = prompt_name.split('.')[0]
+    prefix = f"{LLM_ANALYSIS_FOLDER}/{prompt_no_ext}"
+    return _read_json_blobs(prefix, file_names, max_workers)
+
+def read_evals(prompt_name: str, file_names, max_workers: int = BLOB_READ_CONCURRENCY):
+    """
+    Bulk version of read_eval(). Yields (file_name, eval_dict, error).
+    """
+    prompt_no_ext = prompt_name.split('.')[0]
+    prefix = f"{EVAL_FOLDER}/{prompt_no_ext}"
+    return _read_json_blobs(prefix, file_names, max_workers)
+
+def upload_llm_analysis_to_blob(name, prompt, analysis, metadata=None):
     """
     For storing analysis in JSON under /LLM_ANALYSIS_FOLDER/<prompt_name>/<name_no_ext>.json
+    Optional metadata (e.g. the transcript etag and prompt hash it was built from)
+    is stored as blob metadata.
     """
     prompt_name_no_ext = prompt.split('.')[0]
     call_id = name.split('.')[0]
@@ -302,7 +647,7 @@ def upload_llm_analysis_to_blob(name, prompt, analysis):
     try:
         # Convert `analysis` to JSON if it's a Python dict
         data_to_upload = analysis if isinstance(analysis, str) else json.dumps(analysis)
-        return upload_blob(data_to_upload, analysis_path, full_prefix)
+        return upload_blob(data_to_upload, analysis_path, full_prefix, metadata=metadata)
     except Exception as e:
         return f"An error occurred while uploading LLM analysis: {e}"
 
@@ -323,6 +668,22 @@ def upload_eval_to_blob(name, prompt, evaluation):
         return f"An error occurred while uploading eval: {e}"
     
 
+def read_index_manifest(index_name: str) -> dict:
+    """
+    Load the {file_name: etag} manifest of what is currently in a search index.
+    """
+    content = read_blob(f"{index_name}.json", INDEX_MANIFEST_FOLDER)
+    if not content:
+        return {}
+    try:
+        return json.loads(content)
+    except ValueError:
+        return {}
+
+def save_index_manifest(index_name: str, manifest: dict):
+    return upload_blob(json.dumps(manifest), f"{index_name}.json", INDEX_MANIFEST_FOLDER)
+
+
 def get_uri(blob_name: str, prefix: str = "", container_name: str = DEFAULT_CONTAINER):
     """
     Get the URI for a blob in a container.
@@ -331,11 +692,24 @@ def get_uri(blob_name: str, prefix: str = "", container_name: str = DEFAULT_CONT
     return client.url
 
 
+# Queues already created (or found) by this process
+_ensured_queues = set()
+
+
+def _build_queue_client(queue_name: str):
+    return QueueClient(
+        account_url=queue_account_url,
+        credential=credential,
+        queue_name=queue_name,
+        transport=azure_clients.get_azure_transport("queue"),
+    )
+
+
 def ensure_queue_exists(queue_name: str = STORAGE_QUEUE_NAME):
     """
     Ensure the specified queue exists. Creates it if it does not.
     """
-    queue_client = QueueClient(account_url=queue_account_url, credential=credential, queue_name=queue_name)
+    queue_client = azure_clients.get_or_create(("queue", queue_name), lambda: _build_queue_client(queue_name))
     try:
         queue_client.create_queue()
     except Exception as e:
@@ -343,13 +717,16 @@ def ensure_queue_exists(queue_name: str = STORAGE_QUEUE_NAME):
             pass
         else:
             raise e
+    _ensured_queues.add(queue_name)
 
 def get_queue_client(queue_name: str = STORAGE_QUEUE_NAME):
     """
-    Return the QueueClient for the given queue name, ensuring it exists.
+    Return the shared QueueClient for the given queue name, ensuring it exists
+    the first time it is requested.
     """
-    ensure_queue_exists(queue_name)
-    return QueueClient(account_url=queue_account_url, credential=credential, queue_name=queue_name)
+    if queue_name not in _ensured_queues:
+        ensure_queue_exists(queue_name)
+    return azure_clients.get_or_create(("queue", queue_name), lambda: _build_queue_client(queue_name))
 
 def send_message_to_queue(message: str, queue_name: str = STORAGE_QUEUE_NAME):
     """
@@ -358,3 +735,17 @@ def send_message_to_queue(message: str, queue_name: str = STORAGE_QUEUE_NAME):
     queue_client = get_queue_client(queue_name)
     response = queue_client.send_message(message)
     return f"Sent message to queue '{queue_name}' with message id: {response.id}"
+
+def get_queue_length(queue_name: str = STORAGE_QUEUE_NAME):
+    """
+    Approximate number of messages waiting in the queue.
+    """
+    properties = get_queue_client(queue_name).get_queue_properties()
+    return properties.approximate_message_count
+
+def enqueue_transcription_job(audio_name: str):
+    """
+    Queue an audio blob for the transcription worker.
+    """
+    message = json.dumps({"audio": audio_name.replace(" ", "_")})
+    return send_message_to_queue(message, TRANSCRIPTION_QUEUE_NAME)
@@ -2,12 +2,27 @@
 from services import azure_oai
 from dotenv import load_dotenv
 from services import azure_storage
+from services import audio_processing
+from services import azure_clients
+from services.transcription_pipeline import Pipeline
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
 import os
 
 load_dotenv()
 
+# Worker threads per pipeline stage and the queue size in front of each stage
+TRANSCRIPTION_DOWNLOAD_WORKERS = int(os.getenv("TRANSCRIPTION_DOWNLOAD_WORKERS", "2"))
+TRANSCRIPTION_AUDIO_WORKERS = int(os.getenv("TRANSCRIPTION_AUDIO_WORKERS", "4"))
+TRANSCRIPTION_SPEAKER_WORKERS = int(os.getenv("TRANSCRIPTION_SPEAKER_WORKERS", "4"))
+TRANSCRIPTION_STAGE_QUEUE_SIZE = int(os.getenv("TRANSCRIPTION_STAGE_QUEUE_SIZE", "8"))
+
 def get_transcription_model():
-    """Attempt to get config from azure_storage; return None on failure."""
+    """
+    Attempt to get config from azure_storage; return None on failure.
+    read_config is served from the resident blob cache, so this is cheap enough to
+    call per file and picks up changes saved on the Configuration page within seconds.
+    """
     try:
         config = azure_storage.read_config()  # Should return a dict with keys like 'Transcription', 'LLM', etc.
         if config and "Transcription" in config:
@@ -15,8 +30,6 @@ def get_transcription_model():
     except Exception:
         return  os.getenv("AZURE_AUDIO_MODEL")
 
-transcription_model = get_transcription_model()
-   
 def parse_speakers_with_gpt4(transcribed_text: str) -> str:
     try:
         new_transcription = azure_oai.call_llm('./misc/clean_transcription.txt', transcribed_text)
@@ -25,34 +38,105 @@ def parse_speakers_with_gpt4(transcribed_text: str) -> str:
         print(f"Error cleaning transcription with 4o: {e}")
         return ""
 
-def transcribe_audio(audio_path: str):
+# transcribe_audio reports failures as text starting with one of these
+TRANSCRIPTION_ERROR_PREFIXES = ("Skipping due to", "Error transcribing")
+
+def is_transcription_error(transcription: str) -> bool:
+    return not transcription or transcription.startswith(TRANSCRIPTION_ERROR_PREFIXES)
+
+class TranscriptionError(Exception):
+    """Raised by a stage; the message is what transcribe_audio returns."""
+
+def transcribe_file(local_file: str, model: str) -> str:
+    """
+    Transcribe one local audio file with the given model, without speaker parsing.
+    Returns an empty string when the service returned no text.
+    """
+    if model == "whisper":
+        result = azure_oai.transcribe_whisper(local_file, prompt='./misc/whisper_prompt.txt')
+        return result.text
+    return azure_oai.transcribe_gpt4_audio(local_file)
+
+def transcribe_segments(local_file: str, model: str) -> str:
+    """
+    Split long recordings at silences and transcribe the segments concurrently,
+    then stitch the texts back in order. Short or non-WAV files are sent whole.
+    """
+    if not audio_processing.needs_segmentation(local_file):
+        return transcribe_file(local_file, model)
+
+    with tempfile.TemporaryDirectory() as segment_dir:
+        segments = audio_processing.split_wav(local_file, segment_dir)
+        with ThreadPoolExecutor(max_workers=audio_processing.AUDIO_SEGMENT_CONCURRENCY) as executor:
+            texts = list(executor.map(lambda segment: transcribe_file(segment, model), segments))
+    if any(len(text) == 0 for text in texts):
+        return ""
+    return audio_processing.stitch_transcripts(texts)
+
+def download_stage(job: dict) -> dict:
+    #use azure_storage to download the blob from file_path to local storage and pass that to azure_oai
+    # The cached file stays leased (safe from eviction) while the job waits for transcription
+    job["audio_lease"] = azure_storage.acquire_audio(job["audio"])
+    job["local_file"] = job["audio_lease"].path
+    return job
+
+def transcription_stage(job: dict) -> dict:
     # Step 1: Transcribe using Whisper or GPT-4-AUDIO
     try:
-        #use azure_storage to download the blob from file_path to local storage and pass that to azure_oai
-        transcription = ""
-        audio_path = audio_path.replace(" ", "_")
-        local_file = azure_storage.download_audio_to_local_file(audio_path)
-        if transcription_model == "whisper":
-            result = azure_oai.transcribe_whisper(local_file, prompt='./misc/whisper_prompt.txt')
-            if len(result.text) == 0:
-                return "Skipping due to transcription error."
-            else:
-                transcription = result.text
-
-             # Step 2: Parse and label speakers with Azure OpenAI GPT-4
-            parsed_conversation = parse_speakers_with_gpt4(transcription)
-            if len(parsed_conversation) == 0:
-                return "Skipping due to parsing error."
-            
-            return parsed_conversation
-        else:
-            result = azure_oai.transcribe_gpt4_audio(local_file)
-            if len(result) == 0:
-                return "Skipping due to transcription error."
-            else:
-                return result
-          
+        job["model"] = get_transcription_model()
+        job["transcription"] = transcribe_segments(job["local_file"], job["model"])
+    finally:
+        job.pop("audio_lease").release()
+    if len(job["transcription"]) == 0:
+        raise TranscriptionError("Skipping due to transcription error.")
+    return job
+
+def speaker_stage(job: dict) -> str:
+    # Step 2: Parse and label speakers with Azure OpenAI GPT-4 (gpt-4o-audio labels them itself)
+    if job["model"] != "whisper":
+        return job["transcription"]
+    parsed_conversation = parse_speakers_with_gpt4(job["transcription"])
+    if len(parsed_conversation) == 0:
+        raise TranscriptionError("Skipping due to parsing error.")
+    return parsed_conversation
+
+TRANSCRIPTION_STAGES = (download_stage, transcription_stage, speaker_stage)
+
+def get_pipeline() -> Pipeline:
+    """
+    Shared staged pipeline: downloads, transcriptions and speaker labeling run in
+    separate pools, so one file can be labeled while the next is transcribed.
+    """
+    return azure_clients.get_or_create("transcription_pipeline", lambda: Pipeline([
+        ("download", download_stage, TRANSCRIPTION_DOWNLOAD_WORKERS),
+        ("transcription", transcription_stage, TRANSCRIPTION_AUDIO_WORKERS),
+        ("speakers", speaker_stage, TRANSCRIPTION_SPEAKER_WORKERS),
+    ], queue_size=TRANSCRIPTION_STAGE_QUEUE_SIZE))
+
+def _transcribe(audio_path: str, run) -> str:
+    audio_path = audio_path.replace(" ", "_")
+    try:
+        return run({"audio": audio_path})
+    except TranscriptionError as e:
+        return str(e)
     except Exception as e:
         print(f"Error transcribing {audio_path}: {e}")
         return f"Error transcribing {audio_path}: {e}"
-   
+
+def _run_stages(job: dict):
+    for stage in TRANSCRIPTION_STAGES:
+        job = stage(job)
+    return job
+
+def transcribe_audio(audio_path: str):
+    """
+    Transcribe one file in the calling thread.
+    """
+    return _transcribe(audio_path, _run_stages)
+
+def transcribe_audio_pipelined(audio_path: str):
+    """
+    Transcribe one file through the shared pipeline; blocks until it is done.
+    Concurrent callers overlap across stages.
+    """
+    return _transcribe(audio_path, get_pipeline().run)
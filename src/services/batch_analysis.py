@@ -0,0 +1,269 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from services import azure_clients, azure_oai, azure_storage, analysis_schema, analysis_snapshot, persona_analysis
+
+load_dotenv()
+
+# Global-Batch deployment the requests are sent to (the chat deployment when unset or empty)
+AZURE_OPENAI_BATCH_DEPLOYMENT = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT") or azure_oai.AZURE_OPENAI_DEPLOYMENT_NAME
+# Request files and run manifests are written under <BATCH_DIR>/<persona>-<timestamp>/
+BATCH_DIR = os.getenv("BATCH_DIR", "./cache/batches")
+# One request file (and batch job) holds at most this many requests / bytes (service limits: 100k, 200 MB)
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(190 * 1024 * 1024)))
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+# Analyses written back to storage in parallel when results are collected
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "16"))
+# Point the batch client at an OpenAI-compatible endpoint instead of Azure OpenAI (e.g. a local mock)
+BATCH_API_BASE_URL = os.getenv("BATCH_API_BASE_URL", "")
+BATCH_API_KEY = os.getenv("BATCH_API_KEY", "mock")
+
+BATCH_ENDPOINT = "/chat/completions"
+# Batch statuses after which nothing changes any more
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+MANIFEST_FILE = "manifest.json"
+
+
+def get_batch_client():
+    """
+    Client for files/batches calls: the shared Azure OpenAI client, or a plain
+    OpenAI client for BATCH_API_BASE_URL when it is set.
+    """
+    if BATCH_API_BASE_URL:
+        return azure_clients.get_or_create("openai_batch", lambda: OpenAI(base_url=BATCH_API_BASE_URL, api_key=BATCH_API_KEY))
+    return azure_oai.get_oai_client()
+
+
+def read_manifest(run_dir: str) -> dict:
+    with open(os.path.join(run_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(run_dir: str, manifest: dict):
+    path = os.path.join(run_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_request_files(persona_prompt: str, prompt_content: str, to_analyze, run_dir: str = None,
+                        deployment: str = AZURE_OPENAI_BATCH_DEPLOYMENT):
+    """
+    Write one chat completion request per transcript to JSONL request files,
+    using the same persona prefix, truncation and KPI schema as a live run.
+    to_analyze is [(transcription_file_name, transcript_etag), ...] as returned
+    by persona_analysis.plan_analysis. Returns the run directory; its manifest
+    maps each request's custom_id to the call and the metadata to store.
+    """
+    persona = persona_prompt.split(".")[0]
+    run_dir = run_dir or os.path.join(BATCH_DIR, f"{persona}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    os.makedirs(run_dir, exist_ok=True)
+
+    persona_run = azure_oai.PersonaRun(prompt_content, deployment)
+    kpis = analysis_schema.read_kpis(persona_prompt)
+    response_format = analysis_schema.response_format(analysis_schema.build_analysis_model(kpis)) if kpis else None
+    content_hash = persona_analysis.prompt_hash(prompt_content, kpis)
+    etags = dict(to_analyze)
+
+    manifest = {
+        "persona": persona_prompt,
+        "deployment": deployment,
+        "kpis": kpis,
+        "created_at": datetime.now().isoformat(),
+        "files": [],
+        "calls": {},
+        "failed": {},
+    }
+    out, requests, size = None, 0, 0
+    # Transcripts are written in completion order; custom_id ties each result back to its call
+    for index, (blob_name, transcript, error) in enumerate(
+        azure_storage.read_blobs([name for name, _ in to_analyze], azure_storage.TRANSCRIPTION_FOLDER)
+    ):
+        if error is not None:
+            manifest["failed"][blob_name] = f"Could not read transcript: {error}"
+            continue
+        messages, _, _ = persona_run.messages(transcript)
+        body = {"model": deployment, "messages": messages, "temperature": 0.2, "max_tokens": persona_run.max_tokens}
+        if response_format is not None:
+            body["response_format"] = response_format
+        custom_id = f"call-{index}"
+        line = (json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}) + "\n").encode("utf-8")
+
+        if out is None or requests >= BATCH_MAX_REQUESTS or size + len(line) > BATCH_MAX_BYTES:
+            if out is not None:
+                out.close()
+            path = os.path.join(run_dir, f"requests-{len(manifest['files']):03d}.jsonl")
+            manifest["files"].append({"path": path, "requests": 0})
+            out, requests, size = open(path, "wb"), 0, 0
+        out.write(line)
+        requests += 1
+        size += len(line)
+        manifest["files"][-1]["requests"] = requests
+        manifest["calls"][custom_id] = {
+            "blob_name": blob_name,
+            "metadata": persona_analysis.analysis_metadata(etags[blob_name], content_hash),
+        }
+    if out is not None:
+        out.close()
+
+    save_manifest(run_dir, manifest)
+    return run_dir
+
+
+def submit(run_dir: str, client=None):
+    """
+    Upload each request file and create its batch job. Files that already have
+    a batch (from an interrupted submit) are skipped.
+    """
+    client = client or get_batch_client()
+    manifest = read_manifest(run_dir)
+    for entry in manifest["files"]:
+        if entry.get("batch_id"):
+            continue
+        if not entry.get("file_id"):
+            with open(entry["path"], "rb") as f:
+                entry["file_id"] = client.files.create(file=f, purpose="batch").id
+            save_manifest(run_dir, manifest)
+        batch = client.batches.create(
+            input_file_id=entry["file_id"],
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        entry["batch_id"] = batch.id
+        entry["status"] = batch.status
+        save_manifest(run_dir, manifest)
+    return manifest
+
+
+def wait_for_batches(run_dir: str, client=None, poll_seconds: float = BATCH_POLL_SECONDS, stop_event=None):
+    """
+    Poll the run's batches until every one reached a terminal status (or
+    stop_event is set). Statuses and output file ids are kept in the manifest.
+    """
+    client = client or get_batch_client()
+    manifest = read_manifest(run_dir)
+    while True:
+        for entry in manifest["files"]:
+            if entry.get("status") in TERMINAL_STATUSES:
+                continue
+            batch = client.batches.retrieve(entry["batch_id"])
+            entry["status"] = batch.status
+            entry["output_file_id"] = batch.output_file_id
+            entry["error_file_id"] = batch.error_file_id
+            counts = batch.request_counts
+            if counts is not None:
+                entry["request_counts"] = {"total": counts.total, "completed": counts.completed, "failed": counts.failed}
+        save_manifest(run_dir, manifest)
+
+        pending = [entry for entry in manifest["files"] if entry.get("status") not in TERMINAL_STATUSES]
+        if not pending or (stop_event is not None and stop_event.is_set()):
+            return manifest
+        print("Batches: " + "; ".join(
+            f"{entry['batch_id']} {entry['status']} {entry.get('request_counts', {}).get('completed', 0)}/{entry['requests']}"
+            for entry in manifest["files"]
+        ))
+        if stop_event is not None:
+            stop_event.wait(poll_seconds)
+        else:
+            time.sleep(poll_seconds)
+
+
+def _read_jsonl(client, file_id):
+    if not file_id:
+        return []
+    return [json.loads(line) for line in client.files.content(file_id).text.splitlines() if line.strip()]
+
+
+def _parse_result(line, model):
+    """
+    The analysis from one output line; raises with the reason otherwise.
+    """
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        raise ValueError(f"Request failed: {line.get('error') or response.get('body')}")
+    message = response["body"]["choices"][0]["message"]
+    if message.get("refusal"):
+        raise ValueError(f"No structured output returned: {message['refusal']}")
+    if model is not None:
+        return analysis_schema.to_record(model.model_validate_json(message["content"]))
+    return azure_oai.clean_json_string(message["content"])
+
+
+def collect_results(run_dir: str, client=None):
+    """
+    Download the output of every finished batch not collected yet and write
+    each analysis to /LLM_ANALYSIS_FOLDER/<persona>/<call>.json, as a live run
+    does. Requests that failed or returned invalid output are recorded in the
+    manifest's "failed". Returns {"completed", "failed"} for this collection.
+    """
+    client = client or get_batch_client()
+    manifest = read_manifest(run_dir)
+    model = analysis_schema.build_analysis_model(manifest["kpis"]) if manifest["kpis"] else None
+    counts = {"completed": 0, "failed": 0}
+
+    def store(line):
+        call = manifest["calls"].get(line.get("custom_id"))
+        if call is None:
+            return None, "unknown custom_id"
+        try:
+            analysis = _parse_result(line, model)
+            persona_analysis.store_analysis(call["blob_name"], manifest["persona"], analysis, call["metadata"], manifest["kpis"])
+            return call["blob_name"], None
+        except Exception as e:
+            return call["blob_name"], str(e)
+
+    for entry in manifest["files"]:
+        if entry.get("status") not in TERMINAL_STATUSES or entry.get("collected"):
+            continue
+        lines = _read_jsonl(client, entry.get("output_file_id")) + _read_jsonl(client, entry.get("error_file_id"))
+        with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_CONCURRENCY) as executor:
+            for blob_name, error in executor.map(store, lines):
+                if error is None:
+                    counts["completed"] += 1
+                else:
+                    counts["failed"] += 1
+                    manifest["failed"][blob_name or "unknown"] = error
+        if entry["status"] != "completed":
+            manifest["failed"][entry["path"]] = f"Batch {entry['batch_id']} ended as {entry['status']}"
+        entry["collected"] = True
+        save_manifest(run_dir, manifest)
+
+    if counts["completed"]:
+        analysis_snapshot.refresh_snapshot(manifest["persona"])
+    return counts
+
+
+def run_batch_analysis(persona_prompt: str, only_stale: bool = True, client=None, run_dir: str = None,
+                       poll_seconds: float = BATCH_POLL_SECONDS, stop_event=None):
+    """
+    Offline persona analysis through the Batch API: plan the calls to analyze,
+    write the request files, submit them, wait for the batches and store the
+    results. Pass client to use another endpoint; an existing run_dir with a
+    manifest is resumed instead of planned again.
+    """
+    if run_dir and os.path.exists(os.path.join(run_dir, MANIFEST_FILE)):
+        manifest = read_manifest(run_dir)
+    else:
+        prompt_content = azure_storage.read_prompt(persona_prompt)
+        to_analyze, up_to_date = persona_analysis.plan_analysis(
+            persona_prompt, prompt_content, only_stale, analysis_schema.read_kpis(persona_prompt)
+        )
+        print(f"{len(to_analyze)} calls to analyze, {up_to_date} up to date.")
+        if not to_analyze:
+            return {"completed": 0, "failed": 0}
+        run_dir = write_request_files(persona_prompt, prompt_content, to_analyze, run_dir)
+        manifest = read_manifest(run_dir)
+    print(f"Batch run in {run_dir}: {sum(entry['requests'] for entry in manifest['files'])} requests "
+          f"in {len(manifest['files'])} file(s).")
+
+    submit(run_dir, client)
+    wait_for_batches(run_dir, client, poll_seconds, stop_event)
+    return collect_results(run_dir, client)
@@ -0,0 +1,133 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQLite file holding float32 vectors, and the size of the in-memory LRU tier
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+
+# SQLite limits the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+_memory = OrderedDict()  # key -> vector (list of floats), least recently used first
+_lock = threading.Lock()
+_connection = None
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse whitespace so cosmetic differences do not miss the cache.
+    """
+    return " ".join((text or "").split())
+
+
+def cache_key(model: str, dim, text: str) -> str:
+    payload = f"{model}\0{dim}\0{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _get_connection():
+    """
+    Open the SQLite store on first use. Must be called with _lock held.
+    """
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(EMBEDDING_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER, vector BLOB NOT NULL)"
+        )
+        _connection.commit()
+    return _connection
+
+
+def _remember(key, vector):
+    """
+    Insert into the in-memory LRU tier. Must be called with _lock held.
+    """
+    _memory[key] = vector
+    _memory.move_to_end(key)
+    while len(_memory) > EMBEDDING_CACHE_MEMORY_ITEMS:
+        _memory.popitem(last=False)
+
+
+def get_many(model: str, dim, texts):
+    """
+    Look up cached vectors. Returns a list aligned with texts, None for misses.
+    """
+    keys = [cache_key(model, dim, text) for text in texts]
+    unique_keys = list(dict.fromkeys(keys))
+    found = {}
+    with _lock:
+        for key in unique_keys:
+            if key in _memory:
+                _memory.move_to_end(key)
+                found[key] = _memory[key]
+        in_memory = set(found)
+        missing = [key for key in unique_keys if key not in found]
+
+        if missing:
+            connection = _get_connection()
+            for start in range(0, len(missing), _SQL_CHUNK):
+                chunk = missing[start:start + _SQL_CHUNK]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    _remember(key, vector)
+
+        for key in keys:
+            if key in in_memory:
+                _stats["memory_hits"] += 1
+            elif key in found:
+                _stats["disk_hits"] += 1
+            else:
+                _stats["misses"] += 1
+    return [found.get(key) for key in keys]
+
+
+def put_many(model: str, dim, texts, vectors):
+    """
+    Store vectors for texts in both tiers.
+    """
+    rows = []
+    with _lock:
+        for text, vector in zip(texts, vectors):
+            key = cache_key(model, dim, text)
+            _remember(key, list(vector))
+            rows.append((key, model, dim, np.asarray(vector, dtype=np.float32).tobytes()))
+        connection = _get_connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)", rows
+        )
+        connection.commit()
+        _stats["writes"] += len(rows)
+
+
+def get_stats():
+    """
+    Hit/miss counters and the hit rate across both tiers.
+    """
+    with _lock:
+        lookups = _stats["memory_hits"] + _stats["disk_hits"] + _stats["misses"]
+        hits = _stats["memory_hits"] + _stats["disk_hits"]
+        return {
+            **_stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_items": len(_memory),
+        }
@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from services import azure_oai
+
+load_dotenv()
+
+# Partial summaries are cached as <INSIGHTS_CACHE_DIR>/<sha256>.json
+INSIGHTS_CACHE_DIR = os.getenv("INSIGHTS_CACHE_DIR", "./cache/insights")
+# Estimated prompt tokens per map chunk; a chunk is cut before it grows past this
+INSIGHTS_CHUNK_TOKENS = int(os.getenv("INSIGHTS_CHUNK_TOKENS", "8000"))
+# A chunk also ends after any value whose hash is divisible by this, so on
+# average chunks hold this many values and boundaries depend only on content
+INSIGHTS_CHUNK_DIVISOR = int(os.getenv("INSIGHTS_CHUNK_DIVISOR", "25"))
+INSIGHTS_CONCURRENCY = int(os.getenv("INSIGHTS_CONCURRENCY", "8"))
+INSIGHTS_MAX_TOKENS = int(os.getenv("INSIGHTS_MAX_TOKENS", "1500"))
+
+# Bump when the prompts change so cached summaries are not reused
+PROMPT_VERSION = "1"
+
+INSIGHTS_PROMPT = """
+    you will be provided with different call summaries, your task is to analyze all the summaries, and return key insights.
+
+    What are the main topics? Issues? Insights and recommendations
+
+    """
+
+MAP_PROMPT = """
+    you will be provided with a batch of call summaries. Summarize the batch for a later analyst:
+    list the main topics, issues, notable insights and recommendations, with rough counts of how often each appears.
+    Be concise and keep only what is supported by the calls.
+    """
+
+REDUCE_PROMPT = """
+    you will be provided with partial analyses, each covering a different batch of calls. Combine them
+    into one analysis of all the calls and return key insights.
+
+    What are the main topics? Issues? Insights and recommendations
+
+    """
+
+
+# Marks where an oversized partial summary was cut
+PARTIAL_TRUNCATION_MARKER = "\n[... partial analysis truncated ...]"
+
+
+def _value_hash(value: str) -> int:
+    return int.from_bytes(hashlib.sha256(value.encode("utf-8")).digest()[:8], "big")
+
+
+def chunk_values(values, max_tokens: int = INSIGHTS_CHUNK_TOKENS, divisor: int = INSIGHTS_CHUNK_DIVISOR):
+    """
+    Split values into content-defined chunks: a chunk ends after a value whose
+    hash is divisible by `divisor`, or before the token budget would be exceeded.
+    Inserting or changing one value only changes the chunk it falls in, so the
+    other chunks keep their hashes and cached summaries.
+    With divisor=None chunks are cut by the token budget only.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for value in values:
+        tokens = azure_oai.estimate_tokens(value)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(value)
+        current_tokens += tokens
+        if divisor and _value_hash(value) % divisor == 0:
+            chunks.append(current)
+            current, current_tokens = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _cache_key(system_prompt: str, items) -> str:
+    payload = json.dumps([PROMPT_VERSION, azure_oai.AZURE_OPENAI_DEPLOYMENT_NAME, system_prompt, list(items)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _read_cache(key: str):
+    try:
+        with open(os.path.join(INSIGHTS_CACHE_DIR, f"{key}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["summary"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_cache(key: str, summary: str):
+    os.makedirs(INSIGHTS_CACHE_DIR, exist_ok=True)
+    path = os.path.join(INSIGHTS_CACHE_DIR, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary}, f)
+    os.replace(tmp_path, path)
+
+
+def _summarize(system_prompt: str, items, label: str):
+    """
+    Summarize one chunk, served from the cache when the same chunk was seen before.
+    Returns (summary, cached).
+    """
+    key = _cache_key(system_prompt, items)
+    summary = _read_cache(key)
+    if summary is not None:
+        return summary, True
+    messages = [{"role": "system", "content": system_prompt}] + [
+        {"role": "user", "content": f"{label}: {item} \n\n"} for item in items
+    ]
+    summary = azure_oai.chat_completion(messages, max_tokens=INSIGHTS_MAX_TOKENS)
+    _write_cache(key, summary)
+    return summary, False
+
+
+def _summarize_all(system_prompt: str, chunks, label: str, stats: dict):
+    """
+    Summarize chunks in parallel, in order; the scheduler paces the requests.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(INSIGHTS_CONCURRENCY, len(chunks)))) as executor:
+        results = list(executor.map(lambda chunk: _summarize(system_prompt, chunk, label), chunks))
+    for _, cached in results:
+        stats["cached" if cached else "computed"] += 1
+    return [summary for summary, _ in results]
+
+
+def _fit_partial(partial: str, max_tokens: int, stats: dict) -> str:
+    """
+    Cut a partial summary to max_tokens (estimated like chunk_values does), marking the cut.
+    """
+    if azure_oai.estimate_tokens(partial) <= max_tokens:
+        return partial
+    stats["truncated"] += 1
+    print(f"Partial analysis of {azure_oai.estimate_tokens(partial)} tokens truncated to {max_tokens}.")
+    return partial[: (max_tokens - 1) * 4 - len(PARTIAL_TRUNCATION_MARKER)] + PARTIAL_TRUNCATION_MARKER
+
+
+def get_insights(values, return_stats: bool = False):
+    """
+    Key insights over any number of text values, map-reduce style: values are
+    split into token-budgeted, content-defined chunks that are summarized in
+    parallel, then the partial summaries are combined (in further rounds while
+    they do not fit one prompt). Every step is cached by content hash, so adding
+    a call recomputes one chunk plus the reduce.
+    With return_stats, returns (insights, {"chunks", "cached", "computed", "truncated"}).
+    """
+    values = [str(value) for value in values]
+    stats = {"chunks": 0, "cached": 0, "computed": 0, "truncated": 0}
+    if not values:
+        return ("", stats) if return_stats else ""
+
+    chunks = chunk_values(values, INSIGHTS_CHUNK_TOKENS)
+    stats["chunks"] = len(chunks)
+    if len(chunks) == 1:
+        # Small enough for one prompt: same request as before, no map step
+        insights = _summarize_all(INSIGHTS_PROMPT, chunks, "call", stats)[0]
+        return (insights, stats) if return_stats else insights
+
+    # Reduce token-bounded groups of partials until one analysis is left. A partial
+    # takes at most half a group's budget, so every group but the last holds at
+    # least two and each round shrinks
+    partials = _summarize_all(MAP_PROMPT, chunks, "call", stats)
+    while True:
+        partials = [_fit_partial(partial, INSIGHTS_CHUNK_TOKENS // 2, stats) for partial in partials]
+        groups = chunk_values(partials, INSIGHTS_CHUNK_TOKENS, divisor=None)
+        partials = _summarize_all(REDUCE_PROMPT, groups, "analysis", stats)
+        if len(partials) == 1:
+            break
+    insights = partials[0]
+    return (insights, stats) if return_stats else insights
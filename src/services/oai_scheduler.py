@@ -0,0 +1,201 @@
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import openai
+
+# Errors worth retrying; anything else is raised to the caller straight away
+TRANSIENT_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """
+    Refills `rate_per_minute` units per minute up to `capacity`. The bucket never
+    goes into debt: a request larger than the capacity waits for a full bucket
+    and is charged the capacity, so it cannot stall other callers for longer
+    than one refill. A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """
+        Wait for `amount` units (at most the capacity) and take them. Returns the
+        units charged, to settle with refund() once the real usage is known.
+        """
+        if self.rate <= 0:
+            return amount
+        charged = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= charged:
+                    self.available -= charged
+                    return charged
+                wait = (charged - self.available) / self.rate
+            time.sleep(wait)
+
+    def refund(self, amount):
+        """
+        Give back (or, if negative, take) units once the real usage is known,
+        keeping the bucket between empty and full.
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            self._refill()
+            self.available = max(0.0, min(self.capacity, self.available + amount))
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of successful
+    requests and is multiplied by `decrease` on every throttled request. Other
+    failures leave it unchanged.
+    """
+
+    def __init__(self, initial, minimum, maximum, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= max(self.minimum, int(self.limit)):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False, succeeded=True):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+
+def retry_after_seconds(error):
+    """
+    Delay requested by the service in a 429 response, if any.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+class Scheduler:
+    """
+    Runs Azure OpenAI calls for one deployment within its request and token
+    budgets, adapting concurrency to throttling and retrying transient failures
+    with exponential backoff (honoring retry-after on 429s).
+    """
+
+    def __init__(self, name, requests_per_minute=0, tokens_per_minute=0, initial_concurrency=8,
+                 min_concurrency=1, max_concurrency=32, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.completed = deque()  # (timestamp, tokens) of the last minute of successful calls
+        self.counters = {"requests": 0, "throttled": 0, "retries": 0, "failures": 0}
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def run(self, fn, estimated_tokens=0, usage_tokens=None):
+        """
+        Call fn() under the scheduler. `estimated_tokens` is reserved up front;
+        usage_tokens(result) returns the real count so the reservation can be settled.
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire(1)
+            reserved = self.tokens.acquire(estimated_tokens)
+            self.concurrency.acquire()
+            throttled = succeeded = False
+            try:
+                result = fn()
+            except openai.RateLimitError as e:
+                throttled = True
+                last_error = e
+                delay = retry_after_seconds(e)
+                delay = self._backoff(attempt) if delay is None else delay
+                with self.lock:
+                    self.counters["throttled"] += 1
+            except TRANSIENT_ERRORS as e:
+                last_error = e
+                delay = self._backoff(attempt)
+            else:
+                succeeded = True
+                used = usage_tokens(result) if usage_tokens else None
+                if used is not None:
+                    self.tokens.refund(reserved - used)
+                else:
+                    used = estimated_tokens
+                with self.lock:
+                    self.counters["requests"] += 1
+                    self.completed.append((time.monotonic(), used))
+                return result
+            finally:
+                self.concurrency.release(throttled=throttled, succeeded=succeeded)
+
+            if attempt < self.max_retries:
+                with self.lock:
+                    self.counters["retries"] += 1
+                time.sleep(delay)
+
+        with self.lock:
+            self.counters["failures"] += 1
+        raise last_error
+
+    def get_throughput(self):
+        """
+        Live gauge: completed requests and tokens over the last minute, plus
+        the current concurrency limit and counters.
+        """
+        now = time.monotonic()
+        with self.lock:
+            while self.completed and now - self.completed[0][0] > 60:
+                self.completed.popleft()
+            return {
+                "requests_per_minute": len(self.completed),
+                "tokens_per_minute": sum(tokens for _, tokens in self.completed),
+                "concurrency_limit": int(self.concurrency.limit),
+                "in_flight": self.concurrency.in_flight,
+                **self.counters,
+            }
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from services import azure_storage, analysis_schema
+
+load_dotenv()
+
+# Run checkpoints live under /ANALYSIS_RUNS_FOLDER/<prompt_no_ext>.json
+ANALYSIS_RUNS_FOLDER = os.getenv("ANALYSIS_RUNS_FOLDER", "analysis_runs")
+# Completed calls between two checkpoint writes
+ANALYSIS_CHECKPOINT_EVERY = int(os.getenv("ANALYSIS_CHECKPOINT_EVERY", "10"))
+
+
+def prompt_hash(prompt_content: str, kpis=()) -> str:
+    """
+    Hash of what an analysis is built from: the persona prompt and, when the
+    persona has KPIs, the analysis schema generated from them.
+    """
+    schema = analysis_schema.schema_json(kpis)
+    content = f"{prompt_content or ''}\0{schema}" if schema else (prompt_content or "")
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+def analysis_metadata(transcript_etag: str, prompt_content_hash: str) -> dict:
+    """
+    Blob metadata stored with each analysis, recording what it was built from.
+    """
+    return {"transcript_etag": (transcript_etag or "").strip('"'), "prompt_hash": prompt_content_hash}
+
+
+def store_analysis(blob_name: str, persona_prompt: str, analysis, metadata: dict = None, kpis=()):
+    """
+    Validate an analysis against the persona's KPIs (see analysis_schema.validate_record),
+    write it to /LLM_ANALYSIS_FOLDER/<persona>/<call>.json, tagged with what it was
+    built from, and notify the integration queue.
+    """
+    analysis = analysis_schema.validate_record(analysis, kpis)
+    azure_storage.upload_llm_analysis_to_blob(blob_name, persona_prompt, analysis, metadata)
+
+    persona = persona_prompt.split(".")[0]
+    azure_storage.send_message_to_queue(
+        json.dumps({
+            "blob_uri": azure_storage.get_uri(blob_name, persona),
+            "persona": persona,
+            "date": datetime.now().isoformat()
+        })
+    )
+
+
+def plan_analysis(prompt_name: str, prompt_content: str, only_stale: bool = True, kpis=(), only_files=None):
+    """
+    Decide which transcriptions need (re-)analysis for a persona.
+    A call is up to date when its analysis metadata matches the transcript's
+    current etag and the hash of the persona prompt and KPIs.
+    only_files limits the plan to those transcription file names, e.g. the
+    pending calls of an interrupted run (see resume_files).
+    Returns ([(transcription_file_name, transcript_etag), ...], up_to_date_count).
+    """
+    prompt_no_ext = prompt_name.split('.')[0]
+    analysis_prefix = f"{azure_storage.LLM_ANALYSIS_FOLDER}/{prompt_no_ext}/"
+    transcripts = azure_storage.get_blob_index(azure_storage.TRANSCRIPTION_FOLDER, refresh=True)
+    analyses = azure_storage.get_blob_index(analysis_prefix, refresh=True)
+    current_hash = prompt_hash(prompt_content, kpis)
+
+    only_files = None if only_files is None else set(only_files)
+
+    to_analyze = []
+    up_to_date = 0
+    for path, entry in sorted(transcripts.items()):
+        file_name = path.split("/")[-1]
+        if only_files is not None and file_name not in only_files:
+            continue
+        expected = analysis_metadata(entry["etag"], current_hash)
+        analysis = analyses.get(f"{analysis_prefix}{file_name.split('.')[0]}.json")
+        metadata = (analysis.get("metadata") or {}) if analysis else {}
+        if only_stale and all(metadata.get(key) == value for key, value in expected.items()):
+            up_to_date += 1
+        else:
+            to_analyze.append((file_name, entry["etag"]))
+    return to_analyze, up_to_date
+
+
+def read_checkpoint(prompt_name: str):
+    """
+    Return the last saved run state for a persona, or None.
+    """
+    content = azure_storage.read_blob(f"{prompt_name.split('.')[0]}.json", ANALYSIS_RUNS_FOLDER)
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def save_checkpoint(prompt_name: str, prompt_content: str, pending, completed: int, failed, status: str = "running",
+                    kpis=()):
+    """
+    Persist the run state so an interrupted run can be resumed from its pending
+    calls and reported.
+    """
+    checkpoint = {
+        "prompt_hash": prompt_hash(prompt_content, kpis),
+        "pending": sorted(pending),
+        "completed": completed,
+        "failed": sorted(failed),
+        "status": status,
+        "updated_at": datetime.now().isoformat(),
+    }
+    return azure_storage.upload_blob(json.dumps(checkpoint), f"{prompt_name.split('.')[0]}.json", ANALYSIS_RUNS_FOLDER)
+
+
+def is_interrupted(checkpoint, prompt_content: str, kpis=()) -> bool:
+    """
+    True when a previous run with the same prompt and KPIs stopped before finishing.
+    """
+    return bool(
+        checkpoint
+        and checkpoint.get("status") == "running"
+        and checkpoint.get("prompt_hash") == prompt_hash(prompt_content, kpis)
+        and checkpoint.get("pending")
+    )
+
+
+def resume_files(checkpoint, prompt_content: str, kpis=()):
+    """
+    The calls an interrupted run had left (to pass to plan_analysis as only_files),
+    or None when there is nothing to resume.
+    """
+    if not is_interrupted(checkpoint, prompt_content, kpis):
+        return None
+    return list(checkpoint["pending"])
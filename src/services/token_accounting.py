@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to the ~4 characters per token estimate
+    tiktoken = None
+
+load_dotenv()
+
+# Tokenizer used to count prompts locally (o200k_base for gpt-4o / o1 models)
+OAI_TOKENIZER_ENCODING = os.getenv("OAI_TOKENIZER_ENCODING", "o200k_base")
+# tiktoken downloads the encoding on first use and keeps it here; with the file in
+# place (e.g. baked into the image) no network access is needed
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", "./cache/tiktoken")
+os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_CACHE_DIR
+# Seconds to wait for the encoding to load before counting with the estimate instead
+OAI_TOKENIZER_LOAD_TIMEOUT = float(os.getenv("OAI_TOKENIZER_LOAD_TIMEOUT", "10"))
+# Context window of the chat deployment and the completion budget per call;
+# prompts are fitted into OAI_CONTEXT_TOKENS - OAI_MAX_COMPLETION_TOKENS
+OAI_CONTEXT_TOKENS = int(os.getenv("OAI_CONTEXT_TOKENS", "128000"))
+OAI_MAX_COMPLETION_TOKENS = int(os.getenv("OAI_MAX_COMPLETION_TOKENS", "5000"))
+# What to do with a transcript that does not fit:
+# head_tail (keep the start and the end), head, tail, or error (fail before sending)
+OAI_TRUNCATION_STRATEGY = os.getenv("OAI_TRUNCATION_STRATEGY", "head_tail")
+# Per-call usage is appended here as JSON lines (empty = in memory only)
+TOKEN_METRICS_FILE = os.getenv("TOKEN_METRICS_FILE", "")
+
+TRUNCATION_STRATEGIES = ("head_tail", "head", "tail", "error")
+TRUNCATION_MARKER = "\n\n[... transcript truncated ...]\n\n"
+
+# Chat format overhead per message and for priming the reply
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_OVERHEAD_TOKENS = 3
+
+_encoding = None  # None while not loaded, False when unavailable
+_encoding_loader = None
+_encoding_deadline = 0.0
+_encoding_lock = threading.Lock()
+
+_metrics_hooks = []
+_recent_calls = deque(maxlen=1000)
+_totals = {}  # deployment -> running totals
+_metrics_lock = threading.Lock()
+
+
+class PromptTooLargeError(ValueError):
+    """
+    Raised before sending when a prompt cannot be fitted into the context window.
+    """
+
+
+def _load_encoding():
+    global _encoding
+    try:
+        encoding = tiktoken.get_encoding(OAI_TOKENIZER_ENCODING)
+    except Exception as e:
+        print(f"Tokenizer {OAI_TOKENIZER_ENCODING} unavailable, estimating tokens: {e}")
+        encoding = False
+    with _encoding_lock:
+        _encoding = encoding
+
+
+def _get_encoding():
+    """
+    The tiktoken encoding; None when tiktoken or the encoding is unavailable.
+    The encoding is loaded once in the background: callers wait for it up to
+    OAI_TOKENIZER_LOAD_TIMEOUT after the first call, then estimate until it is
+    loaded instead of blocking on a slow or unreachable download.
+    """
+    global _encoding_loader, _encoding_deadline
+    if tiktoken is None:
+        return None
+    with _encoding_lock:
+        if _encoding is not None:
+            return _encoding or None
+        if _encoding_loader is None:
+            _encoding_deadline = time.monotonic() + OAI_TOKENIZER_LOAD_TIMEOUT
+            _encoding_loader = threading.Thread(target=_load_encoding, name="tiktoken-load", daemon=True)
+            _encoding_loader.start()
+        loader = _encoding_loader
+    loader.join(max(0.0, _encoding_deadline - time.monotonic()))
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in text, counted with tiktoken when installed, else estimated.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message(message) -> int:
+    content = message["content"]
+    return MESSAGE_OVERHEAD_TOKENS + count_tokens(content if isinstance(content, str) else str(content))
+
+
+def count_messages(messages) -> int:
+    """
+    Prompt tokens of a chat request, including the per-message overhead.
+    """
+    return REPLY_OVERHEAD_TOKENS + sum(count_message(message) for message in messages)
+
+
+def prompt_budget(max_completion_tokens: int = OAI_MAX_COMPLETION_TOKENS) -> int:
+    return OAI_CONTEXT_TOKENS - max_completion_tokens
+
+
+def truncate_text(text: str, max_tokens: int, strategy: str = OAI_TRUNCATION_STRATEGY):
+    """
+    Fit text into max_tokens. Returns (text, dropped_tokens); text is returned
+    unchanged when it already fits. Raises PromptTooLargeError for the "error"
+    strategy or when nothing of the text fits.
+    """
+    if strategy not in TRUNCATION_STRATEGIES:
+        raise ValueError(f"Unknown truncation strategy '{strategy}', expected one of {TRUNCATION_STRATEGIES}.")
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text, 0
+    keep = max_tokens - (count_tokens(TRUNCATION_MARKER) if strategy == "head_tail" else 0)
+    if strategy == "error" or keep <= 0:
+        raise PromptTooLargeError(f"Prompt needs {tokens} tokens, only {max_tokens} are available.")
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        pieces = encoding.encode(text, disallowed_special=())
+        head = lambda n: encoding.decode(pieces[:n])
+        tail = lambda n: encoding.decode(pieces[len(pieces) - n:]) if n else ""
+    else:
+        # Estimated tokens: keep ~4 characters per token, one short to stay under the budget
+        head = lambda n: text[: max(0, n - 1) * 4]
+        tail = lambda n: text[len(text) - max(0, n - 1) * 4:] if n > 1 else ""
+
+    if strategy == "head":
+        fitted = head(keep)
+    elif strategy == "tail":
+        fitted = tail(keep)
+    else:
+        fitted = head(keep - keep // 2) + TRUNCATION_MARKER + tail(keep // 2)
+    return fitted, tokens - keep
+
+
+def add_metrics_hook(hook):
+    """
+    Register hook(record) to be called after every metered call.
+    """
+    with _metrics_lock:
+        _metrics_hooks.append(hook)
+
+
+def _write_record(record):
+    try:
+        with open(TOKEN_METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write token metrics to {TOKEN_METRICS_FILE}: {e}")
+
+
+def usage_counts(completion):
+    """
+    Token counts from a completion's usage; cached_tokens is the part of the
+    prompt served from the service's prompt cache. Missing fields are None.
+    """
+    usage = getattr(completion, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "cached_tokens": getattr(details, "cached_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+    }
+
+
+def record_usage(deployment: str, operation: str, completion, latency_seconds: float,
+                 estimated_prompt_tokens: int = None, truncated_tokens: int = 0):
+    """
+    Record the token usage and latency of one completed request to the
+    in-memory history, the JSONL file (if configured) and the hooks.
+    """
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "deployment": deployment,
+        "operation": operation,
+        **usage_counts(completion),
+        "estimated_prompt_tokens": estimated_prompt_tokens,
+        "truncated_tokens": truncated_tokens,
+        "latency_seconds": round(latency_seconds, 3),
+    }
+    with _metrics_lock:
+        _recent_calls.append((time.monotonic(), record))
+        totals = _totals.setdefault(deployment, {
+            "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+            "truncated_calls": 0, "latency_seconds": 0.0,
+        })
+        totals["calls"] += 1
+        totals["prompt_tokens"] += record["prompt_tokens"] or 0
+        totals["cached_tokens"] += record["cached_tokens"] or 0
+        totals["completion_tokens"] += record["completion_tokens"] or 0
+        totals["total_tokens"] += record["total_tokens"] or 0
+        totals["truncated_calls"] += 1 if truncated_tokens else 0
+        totals["latency_seconds"] += latency_seconds
+        if TOKEN_METRICS_FILE:
+            _write_record(record)
+        hooks = list(_metrics_hooks)
+    for hook in hooks:
+        try:
+            hook(record)
+        except Exception as e:
+            print(f"Token metrics hook failed: {e}")
+    return record
+
+
+def metered(deployment: str, operation: str, request, estimated_prompt_tokens: int = None, truncated_tokens: int = 0):
+    """
+    Wrap a request function so each successful attempt records its usage and latency.
+    """
+    def run():
+        started = time.monotonic()
+        completion = request()
+        record_usage(deployment, operation, completion, time.monotonic() - started,
+                     estimated_prompt_tokens, truncated_tokens)
+        return completion
+    return run
+
+
+def get_token_stats():
+    """
+    Per deployment: running totals since start, the share of prompt tokens served
+    from the prompt cache, average latency and the tokens used over the last
+    minute (to compare against the TPM quota).
+    """
+    now = time.monotonic()
+    with _metrics_lock:
+        totals = {deployment: dict(values) for deployment, values in _totals.items()}
+        recent = [record for at, record in _recent_calls if now - at <= 60]
+    for deployment, values in totals.items():
+        values["avg_latency_seconds"] = values.pop("latency_seconds") / values["calls"]
+        values["cache_hit_rate"] = values["cached_tokens"] / values["prompt_tokens"] if values["prompt_tokens"] else 0.0
+        values["tokens_last_minute"] = sum(
+            record["total_tokens"] or 0 for record in recent if record["deployment"] == deployment
+        )
+    return totals
@@ -0,0 +1,133 @@
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# Put on a stage queue to stop one of its workers
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of the pipeline: `workers` threads take items from a bounded queue,
+    apply fn and hand the result to the next stage. A full queue blocks the
+    stage before it, so a slow stage throttles its producers instead of
+    buffering unbounded work.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=8):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next = None
+        self.threads = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.completed = deque()  # timestamps of the last minute of processed items
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            future, value = item
+            with self.lock:
+                self.in_flight += 1
+            started = time.monotonic()
+            try:
+                result = self.fn(value)
+            except Exception as e:
+                with self.lock:
+                    self.in_flight -= 1
+                    self.failed += 1
+                    self.busy_seconds += time.monotonic() - started
+                future.set_exception(e)
+                continue
+
+            with self.lock:
+                self.in_flight -= 1
+                self.processed += 1
+                self.busy_seconds += time.monotonic() - started
+                self.completed.append(time.monotonic())
+            if self.next is None:
+                future.set_result(result)
+            else:
+                self.next.queue.put((future, result))
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.completed and now - self.completed[0] > 60:
+                self.completed.popleft()
+            finished = self.processed + self.failed
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue.qsize(),
+                "in_flight": self.in_flight,
+                "processed": self.processed,
+                "failed": self.failed,
+                "items_per_minute": len(self.completed),
+                "avg_seconds": self.busy_seconds / finished if finished else 0.0,
+            }
+
+
+class Pipeline:
+    """
+    Chain of stages with their own worker pools and queues, so different files
+    can be in different stages at the same time.
+    stages is a list of (name, fn, workers); each fn receives the previous
+    stage's result and the last result completes the future from submit().
+    """
+
+    def __init__(self, stages, queue_size=8):
+        self.stages = [Stage(name, fn, workers, queue_size) for name, fn, workers in stages]
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.next = following
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, value) -> Future:
+        """
+        Queue value for the first stage; blocks while that stage's queue is full.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.stages[0].queue.put((future, value))
+        return future
+
+    def run(self, value):
+        return self.submit(value).result()
+
+    def get_stats(self):
+        """
+        Per-stage throughput and queue depth, in pipeline order.
+        """
+        return {stage.name: stage.get_stats() for stage in self.stages}
+
+    def bottleneck(self):
+        """
+        Name of the stage with the most queued and running work.
+        """
+        stats = self.get_stats()
+        return max(stats, key=lambda name: (stats[name]["queue_depth"] + stats[name]["in_flight"]) / stats[name]["workers"])
+
+    def close(self):
+        """
+        Let every queued item finish, then stop the workers.
+        """
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            for thread in stage.threads:
+                thread.join()
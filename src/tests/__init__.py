@@ -0,0 +1,19 @@
+"""
+Tests and benchmarks for the services package. No Azure resource is contacted:
+clients are pointed at local fakes or stubs.
+
+Install the test requirements: pip install -r requirements-dev.txt
+Run the tests from src/ with: python -m pytest tests
+Run a benchmark with:         python -m tests.bench_<name>
+"""
+import os
+
+# The services read these at import time; placeholder values are enough for the fakes.
+for _key, _value in {
+    "AZURE_OPENAI_ENDPOINT": "https://localhost.invalid",
+    "AZURE_OPENAI_DEPLOYMENT_NAME": "gpt-test",
+    "AZURE_WHISPER_MODEL": "whisper-test",
+    "STORAGE_ACCOUNT_NAME": "teststorage",
+    "AZURE_SEARCH_ENDPOINT": "https://localhost.invalid",
+}.items():
+    os.environ.setdefault(_key, _value)
@@ -0,0 +1,95 @@
+"""
+Summary-page column classification and counting at 1k, 10k and 100k analysis
+records: the former per-key Python loops (aggregate_data, is_numeric,
+can_be_boolean, coerce_to_boolean) versus analysis_frame, both from raw
+records and from a snapshot-like frame with typed columns.
+
+Run from src/ with: python -m tests.bench_analysis_frame [sizes...]
+"""
+import sys
+import time
+import random
+from collections import defaultdict
+
+import numpy as np
+
+from services import analysis_frame
+
+
+def make_records(count, seed=0):
+    rng = random.Random(seed)
+    return [{
+        "summary": f"Call {i} about billing",
+        "risk": {"score": rng.randint(1, 5), "explanation": "..."},
+        "upsell": {"score": rng.choice(["Yes", "No", "yes"]), "explanation": "..."},
+        "resolved": rng.random() < 0.6,
+    } for i in range(count)]
+
+
+def _old_flatten(nested_json, parent_key="", sep="."):
+    items = []
+    for k, v in nested_json.items():
+        new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        if isinstance(v, dict):
+            items.extend(_old_flatten(v, new_key, sep=sep).items())
+        else:
+            items.append((new_key, v))
+    return dict(items)
+
+
+def old_summary(records):
+    """
+    The Summary page before analysis_frame: dict of lists, then per-value checks.
+    """
+    aggregated = defaultdict(list)
+    for record in records:
+        for key, val in _old_flatten(record).items():
+            aggregated[key].append(val)
+    results = {}
+    for key, values in aggregated.items():
+        numeric = [v for v in values if isinstance(v, (int, float))]
+        bools = [v for v in values if isinstance(v, bool) or (isinstance(v, str) and v.strip().lower() in ["yes", "no"])]
+        if len(numeric) == len(values):
+            results[key] = np.unique(np.array(numeric, dtype=int), return_counts=True)
+        elif len(bools) == len(values):
+            coerced = [v if isinstance(v, bool) else v.strip().lower() == "yes" for v in bools]
+            results[key] = sum(coerced)
+    return results
+
+
+def new_summary(frame):
+    results = {}
+    for key, kind in analysis_frame.infer_kinds(frame).items():
+        if kind == analysis_frame.NUMERIC:
+            results[key] = analysis_frame.value_counts(frame[key])
+        elif kind == analysis_frame.BOOLEAN:
+            results[key] = int(analysis_frame.coerce_boolean(frame[key]).sum())
+    return results
+
+
+def _seconds(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(sizes=(1_000, 10_000, 100_000)):
+    print(f"{'records':>8} {'old loops':>10} {'normalize+classify':>19} {'classify only':>14} {'speedup':>8}")
+    results = []
+    for size in sizes:
+        records = make_records(size)
+        # The snapshot stores decoded columns with real dtypes (infer_objects)
+        snapshot = analysis_frame.normalize_records(records).infer_objects()
+        old = _seconds(lambda: old_summary(records))
+        full = _seconds(lambda: new_summary(analysis_frame.normalize_records(records)))
+        classify = _seconds(lambda: new_summary(snapshot))
+        results.append((size, old, full, classify))
+        print(f"{size:>8} {old * 1000:>8.1f}ms {full * 1000:>17.1f}ms {classify * 1000:>12.1f}ms {old / classify:>7.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main(tuple(int(size) for size in sys.argv[1:]) or (1_000, 10_000, 100_000))
@@ -0,0 +1,76 @@
+"""
+Per-call latency of a fresh HTTP client per request (how clients were built before
+the registry) versus the registry's shared, pooled clients, against a local
+keep-alive HTTP stub.
+
+Run from src/ with: python -m tests.bench_clients [requests]
+"""
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+
+import tests  # noqa: F401  (placeholder settings)
+from services import azure_clients
+
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections open
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _per_call_ms(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count * 1000
+
+
+def main(count=300):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    def fresh_httpx():
+        with httpx.Client() as client:
+            client.get(url)
+
+    def fresh_requests():
+        with requests.Session() as session:
+            session.get(url)
+
+    shared_httpx = azure_clients.get_httpx_client("bench")
+    shared_session = azure_clients.get_azure_transport("bench").session
+
+    results = {
+        "httpx, new client per call": _per_call_ms(fresh_httpx, count),
+        "httpx, registry client": _per_call_ms(lambda: shared_httpx.get(url), count),
+        "requests, new session per call": _per_call_ms(fresh_requests, count),
+        "requests, registry transport": _per_call_ms(lambda: shared_session.get(url), count),
+    }
+    for name, ms in results.items():
+        print(f"{name:34s} {ms:7.3f} ms/call")
+    print(f"httpx speedup:    {results['httpx, new client per call'] / results['httpx, registry client']:.1f}x")
+    print(f"requests speedup: {results['requests, new session per call'] / results['requests, registry transport']:.1f}x")
+
+    server.shutdown()
+    azure_clients.close_all()
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,23 @@
+from services import analysis_frame
+from tests.bench_analysis_frame import make_records, old_summary, new_summary
+
+
+def test_counts_match_former_summary_loops():
+    records = make_records(2000)
+    old = old_summary(records)
+    new = new_summary(analysis_frame.normalize_records(records))
+
+    values, counts = old["risk.score"]
+    assert new["risk.score"]["Value"].tolist() == values.tolist()
+    assert new["risk.score"]["Count"].tolist() == counts.tolist()
+    assert new["upsell.score"] == old["upsell.score"]
+    # Plain booleans were counted as 0/1 numbers; they are now a boolean column
+    assert new["resolved"] == old["resolved"][1][1]
+    assert "summary" not in new
+
+
+def test_missing_keys_keep_rows_aligned():
+    frame = analysis_frame.normalize_records([{"a": {"score": 1}}, {"b": "yes"}, {"a": {"score": 3}, "b": "No"}])
+    assert frame["a.score"].tolist()[::2] == [1, 3]
+    assert frame["b"].tolist()[1:] == ["yes", "No"]
+    assert analysis_frame.infer_kinds(frame) == {"a.score": analysis_frame.NUMERIC, "b": analysis_frame.BOOLEAN}
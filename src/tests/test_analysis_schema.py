@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from services import azure_storage, analysis_schema, persona_analysis
+
+
+def _parse(kpis, analysis):
+    model = analysis_schema.build_analysis_model(kpis)
+    return analysis_schema.to_record(model.model_validate_json(json.dumps(analysis)))
+
+
+def test_additional_fields_keep_their_structure():
+    record = _parse(["risk"], {
+        "summary": "s",
+        "risk": {"score": 2, "explanation": "e"},
+        "additional_fields": [
+            {"name": "products", "value": json.dumps([{"name": "fiber", "monthly": 30.5}])},
+            {"name": "callback", "value": "true"},
+            {"name": "note", "value": "free text, not JSON"},
+        ],
+    })
+    assert record["products"] == [{"name": "fiber", "monthly": 30.5}]
+    assert record["callback"] is True
+    assert record["note"] == "free text, not JSON"
+    assert record["risk"] == {"score": 2, "explanation": "e"}
+
+
+def test_strict_schema_requires_every_kpi():
+    schema = analysis_schema.response_format(analysis_schema.build_analysis_model(["risk", "Upsell"]))["json_schema"]
+    assert schema["strict"] is True
+    assert {"summary", "risk", "Upsell", "additional_fields"} <= set(schema["schema"]["required"])
+
+
+def test_hash_changes_with_kpis():
+    prompt = "You are an analyst."
+    assert persona_analysis.prompt_hash(prompt) == persona_analysis.prompt_hash(prompt, [])
+    assert persona_analysis.prompt_hash(prompt, ["risk"]) != persona_analysis.prompt_hash(prompt)
+    assert persona_analysis.prompt_hash(prompt, ["risk"]) != persona_analysis.prompt_hash(prompt, ["risk", "upsell"])
+
+
+def test_analyses_from_other_kpis_are_stale(monkeypatch):
+    prompt = "You are an analyst."
+    old_hash = persona_analysis.prompt_hash(prompt, ["risk"])
+    indexes = {
+        azure_storage.TRANSCRIPTION_FOLDER: {f"{azure_storage.TRANSCRIPTION_FOLDER}/c1.txt": {"etag": '"e1"'}},
+        f"{azure_storage.LLM_ANALYSIS_FOLDER}/churn/": {
+            f"{azure_storage.LLM_ANALYSIS_FOLDER}/churn/c1.json": {"metadata": persona_analysis.analysis_metadata('"e1"', old_hash)},
+        },
+    }
+    monkeypatch.setattr(azure_storage, "get_blob_index", lambda prefix, refresh=False: indexes[prefix])
+
+    assert persona_analysis.plan_analysis("churn.txt", prompt, True, ["risk"]) == ([], 1)
+    assert persona_analysis.plan_analysis("churn.txt", prompt, True, ["risk", "upsell"]) == ([("c1.txt", '"e1"')], 0)
+
+
+def test_store_validates_kpis(monkeypatch):
+    stored = []
+    monkeypatch.setattr(azure_storage, "upload_llm_analysis_to_blob", lambda *args: stored.append(args))
+    monkeypatch.setattr(azure_storage, "send_message_to_queue", lambda message: None)
+    monkeypatch.setattr(azure_storage, "get_uri", lambda blob_name, persona: blob_name)
+
+    with pytest.raises(analysis_schema.AnalysisValidationError):
+        persona_analysis.store_analysis("c1.txt", "churn.txt", '{"summary": "s"}', None, ["risk"])
+    assert stored == []
+
+    persona_analysis.store_analysis("c1.txt", "churn.txt", '{"summary": "s", "risk": {"Score": 3}}', None, ["risk"])
+    assert stored[0][2] == {"summary": "s", "risk": {"score": 3}}
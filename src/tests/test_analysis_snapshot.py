@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from services import azure_storage, analysis_snapshot
+
+ANALYSES = f"{azure_storage.LLM_ANALYSIS_FOLDER}/churn/"
+EVALS = f"{azure_storage.EVAL_FOLDER}/churn/"
+SNAPSHOTS = analysis_snapshot.ANALYSIS_SNAPSHOT_FOLDER
+
+
+class _Storage:
+    """
+    Blobs in memory behind the azure_storage helpers the snapshot uses. The blob
+    index serves the last listing of a prefix until it is listed again, like
+    get_blob_index within BLOB_INDEX_TTL.
+    """
+    def __init__(self):
+        self.blobs = {}  # path -> (etag, bytes)
+        self.listed = {}
+        self.listings = []
+        self.reads = 0
+
+    def put(self, path, data):
+        etag = f'"{len(self.blobs)}-{hash(data)}"'
+        self.blobs[path] = (etag, data if isinstance(data, bytes) else data.encode())
+
+    def get_blob_index(self, prefix="", refresh=False):
+        if refresh or prefix not in self.listed:
+            self.listings.append(prefix)
+            self.listed[prefix] = {
+                path: {"etag": etag} for path, (etag, _) in self.blobs.items() if path.startswith(prefix)
+            }
+        return dict(self.listed[prefix])
+
+    def read_docs(self, prefix):
+        def read(prompt_name, files):
+            for file in files:
+                self.reads += 1
+                yield file, json.loads(self.blobs[f"{prefix}{file}"][1]), None
+        return read
+
+    def upload_blob(self, data, blob_name, prefix=""):
+        self.put(f"{prefix}/{blob_name}", data)
+        # An upload is recorded in the index of every listed prefix covering it
+        for listed_prefix, index in self.listed.items():
+            if f"{prefix}/{blob_name}".startswith(listed_prefix):
+                index[f"{prefix}/{blob_name}"] = {"etag": self.blobs[f"{prefix}/{blob_name}"][0]}
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = _Storage()
+    monkeypatch.setattr(azure_storage, "get_blob_index", storage.get_blob_index)
+    monkeypatch.setattr(azure_storage, "read_llm_analyses", storage.read_docs(ANALYSES))
+    monkeypatch.setattr(azure_storage, "read_evals", storage.read_docs(EVALS))
+    monkeypatch.setattr(azure_storage, "upload_blob", storage.upload_blob)
+    monkeypatch.setattr(azure_storage, "read_blob_bytes",
+                        lambda name, prefix="": storage.blobs.get(f"{prefix}/{name}", (None, None))[1])
+    monkeypatch.setattr(azure_storage, "get_blob_etag", lambda name, prefix="": storage.blobs[f"{prefix}/{name}"][0])
+    monkeypatch.setattr(analysis_snapshot, "_snapshots", {})
+    storage.put(f"{ANALYSES}c1.json", json.dumps({"summary": "first", "risk": {"score": 4, "explanation": "e"}}))
+    storage.put(f"{EVALS}c1.json", json.dumps({"risk": 3}))
+    return storage
+
+
+def test_page_loads_do_not_relist(storage):
+    snapshot, errors = analysis_snapshot.load_snapshot("churn.txt", prefixes=(analysis_snapshot.ANALYSIS_PREFIX,))
+    assert errors == [] and snapshot["analysis.risk.score"].tolist() == [4]
+    storage.listings.clear()
+    reads = storage.reads
+
+    for _ in range(5):
+        snapshot, _ = analysis_snapshot.load_snapshot("churn.txt", prefixes=(analysis_snapshot.ANALYSIS_PREFIX,))
+    assert storage.listings == []
+    assert storage.reads == reads
+    assert snapshot["call_id"].tolist() == ["c1"]
+
+
+def test_writers_refresh_with_fresh_listings(storage):
+    analysis_snapshot.load_snapshot("churn.txt")
+    # Written by another process: pages see it once the index is listed again
+    storage.put(f"{ANALYSES}c2.json", json.dumps({"summary": "second"}))
+    assert analysis_snapshot.load_snapshot("churn.txt")[0]["call_id"].tolist() == ["c1"]
+
+    storage.listings.clear()
+    table, _ = analysis_snapshot.refresh_snapshot("churn.txt")
+    assert sorted(storage.listings) == [EVALS, ANALYSES]
+    assert table.column("call_id").to_pylist() == ["c1", "c2"]
+    assert analysis_snapshot.load_snapshot("churn.txt")[0]["call_id"].tolist() == ["c1", "c2"]
+
+
+def test_ground_truth_and_analysis_are_decoded(storage):
+    snapshot, _ = analysis_snapshot.load_snapshot(
+        "churn.txt", prefixes=(analysis_snapshot.ANALYSIS_PREFIX, analysis_snapshot.GROUND_TRUTH_PREFIX)
+    )
+    row = snapshot.iloc[0]
+    assert row["analysis.summary"] == "first"
+    assert row["analysis.risk.explanation"] == "e"
+    assert row["gt.risk"] == 3
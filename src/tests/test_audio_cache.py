@@ -0,0 +1,87 @@
+import os
+import time
+from collections import OrderedDict
+
+import pytest
+
+from services import audio_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_cache, "AUDIO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(audio_cache, "AUDIO_CACHE_MAX_BYTES", 250)
+    monkeypatch.setattr(audio_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(audio_cache, "_loaded", False)
+    monkeypatch.setattr(audio_cache, "_stats", {"hits": 0, "misses": 0, "evictions": 0})
+    return tmp_path
+
+
+def _writer(size, calls=None):
+    def download(tmp_path):
+        if calls is not None:
+            calls.append(tmp_path)
+        with open(tmp_path, "wb") as f:
+            f.write(b"x" * size)
+    return download
+
+
+def _acquire(name, etag="1", calls=None):
+    return audio_cache.acquire(name, etag, _writer(100, calls))
+
+
+def test_hit_after_miss_and_new_etag_is_a_new_entry():
+    calls = []
+    with _acquire("a.wav", calls=calls) as first:
+        pass
+    with _acquire("a.wav", calls=calls) as second:
+        assert second == first
+    with _acquire("a.wav", etag="2", calls=calls) as third:
+        assert third != first
+    assert len(calls) == 2
+    assert audio_cache.get_stats()["hits"] == 1
+
+
+def test_leased_files_are_not_evicted():
+    held = _acquire("a.wav")
+    for name in ("b.wav", "c.wav", "d.wav"):
+        _acquire(name).release()
+    # Over budget, but the leased file survives; unleased ones go first
+    assert os.path.exists(held.path)
+    held.release()
+    _acquire("e.wav").release()
+    assert not os.path.exists(held.path)
+
+
+def test_lease_from_another_process_pins_the_file(cache_dir):
+    with _acquire("a.wav") as path:
+        pass
+    # Another process sharing the directory holds a lease on it
+    name = os.path.basename(path)
+    (cache_dir / f"{name}.other{audio_cache.LEASE_SUFFIX}").touch()
+    for other in ("b.wav", "c.wav", "d.wav"):
+        _acquire(other).release()
+    assert os.path.exists(path)
+
+
+def test_stale_lease_does_not_pin(cache_dir, monkeypatch):
+    monkeypatch.setattr(audio_cache, "AUDIO_CACHE_LEASE_MAX_SECONDS", 60)
+    with _acquire("a.wav") as path:
+        pass
+    lease = cache_dir / f"{os.path.basename(path)}.crashed{audio_cache.LEASE_SUFFIX}"
+    lease.touch()
+    old = time.time() - 120
+    os.utime(lease, (old, old))
+    for other in ("b.wav", "c.wav", "d.wav"):
+        _acquire(other).release()
+    assert not os.path.exists(path)
+    assert not lease.exists()
+
+
+def test_failed_download_leaves_no_files(cache_dir):
+    def download(tmp_path):
+        raise IOError("network")
+
+    with pytest.raises(IOError):
+        audio_cache.acquire("a.wav", "1", download)
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,125 @@
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from services import audio_processing
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "samples", "audios")
+SAMPLE = os.path.join(SAMPLES_DIR, "finance_2.wav")
+
+
+def _frames(path):
+    with wave.open(path, "rb") as reader:
+        return reader.getparams(), reader.readframes(reader.getnframes())
+
+
+def _write_wav(path, samples, rate, sampwidth=2):
+    """
+    Write int16-scaled samples of shape (frames, channels) as PCM.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    with wave.open(path, "wb") as writer:
+        writer.setnchannels(samples.shape[1])
+        writer.setsampwidth(sampwidth)
+        writer.setframerate(rate)
+        if sampwidth == 2:
+            writer.writeframes(np.round(samples).astype("<i2").tobytes())
+        else:
+            writer.writeframes((np.round(samples / 256.0) + 128).astype(np.uint8).tobytes())
+    return path
+
+
+@pytest.mark.skipif(not os.path.exists(SAMPLE), reason="sample audio not available")
+def test_split_sample_round_trips(tmp_path):
+    params, original = _frames(SAMPLE)
+    segments = audio_processing.split_wav(SAMPLE, str(tmp_path), max_seconds=20, overlap_seconds=1, search_seconds=5)
+    assert len(segments) > 3
+
+    overlap_bytes = params.framerate * params.sampwidth * params.nchannels
+    rebuilt = b""
+    for i, segment in enumerate(segments):
+        segment_params, frames = _frames(segment)
+        assert segment_params[:3] == params[:3]
+        assert segment_params.nframes <= 20 * params.framerate
+        # Dropping the shared second from every segment but the first gives back the original
+        rebuilt += frames if i == 0 else frames[overlap_bytes:]
+    assert rebuilt == original
+
+
+def test_split_cuts_in_silence(tmp_path):
+    rate = 8000
+    t = np.arange(rate * 10) / rate
+    signal = 8000 * np.sin(2 * np.pi * 440 * t)
+    # Silent gaps at 3.5-3.7 s and 7.2-7.4 s
+    for start in (3.5, 7.2):
+        signal[int(start * rate):int((start + 0.2) * rate)] = 0
+    path = _write_wav(str(tmp_path / "tone.wav"), signal, rate)
+
+    segments = audio_processing.split_wav(path, str(tmp_path), max_seconds=4, overlap_seconds=0, search_seconds=1)
+    lengths = [_frames(segment)[0].nframes / rate for segment in segments]
+    assert len(segments) == 3
+    assert 3.5 <= lengths[0] <= 3.7
+    assert 7.2 <= lengths[0] + lengths[1] <= 7.4
+    assert sum(lengths) == pytest.approx(10)
+
+
+def test_stitch_drops_repeated_overlap():
+    texts = [
+        "Thanks for calling, how can I help you today?",
+        "help you today? I would like to cancel my plan.",
+        "",
+        "Cancel my plan. Sure, let me check your account.",
+        "Something unrelated follows.",
+    ]
+    assert audio_processing.stitch_transcripts(texts) == (
+        "Thanks for calling, how can I help you today? I would like to cancel my plan. "
+        "Sure, let me check your account.\nSomething unrelated follows."
+    )
+
+
+def test_prepare_audio_resamples_across_chunks(tmp_path, monkeypatch):
+    # Small chunks, so interpolation has to carry over many chunk boundaries
+    monkeypatch.setattr(audio_processing, "COPY_FRAMES", 1000)
+    rate = 44100
+    t = np.arange(rate * 2) / rate
+    left, right = 10000 * np.sin(2 * np.pi * 300 * t), 6000 * np.sin(2 * np.pi * 500 * t)
+    path = _write_wav(str(tmp_path / "stereo.wav"), np.column_stack([left, right]), rate)
+
+    out = audio_processing.prepare_audio(path, str(tmp_path), sample_rate=16000, mono=True)
+    params, frames = _frames(out)
+    assert (params.nchannels, params.sampwidth, params.framerate) == (1, 2, 16000)
+    assert abs(params.nframes - 2 * 16000) <= 1
+
+    # Same result as interpolating the whole (quantized) mono signal at once
+    _, source = _frames(path)
+    mono = np.frombuffer(source, dtype="<i2").astype(np.float64).reshape(-1, 2).mean(axis=1)
+    expected = np.interp(np.arange(params.nframes) * rate / 16000, np.arange(len(mono)), mono)
+    actual = np.frombuffer(frames, dtype="<i2").astype(np.float64)
+    assert np.abs(actual - expected).max() <= 1
+
+
+def test_prepare_audio_widens_8_bit_and_keeps_16_bit(tmp_path):
+    rate = 8000
+    signal = 20000 * np.sin(2 * np.pi * 200 * np.arange(rate) / rate)
+    path_8 = _write_wav(str(tmp_path / "narrow.wav"), signal, rate, sampwidth=1)
+    out = audio_processing.prepare_audio(path_8, str(tmp_path), sample_rate=0, mono=False)
+    params, frames = _frames(out)
+    assert (params.sampwidth, params.framerate, params.nframes) == (2, rate, rate)
+    assert np.abs(np.frombuffer(frames, dtype="<i2") - signal).max() <= 256
+
+    path_16 = _write_wav(str(tmp_path / "plain.wav"), signal, rate)
+    assert audio_processing.prepare_audio(path_16, str(tmp_path), sample_rate=0, mono=True) == path_16
+
+
+def test_needs_segmentation(tmp_path, monkeypatch):
+    path = _write_wav(str(tmp_path / "short.wav"), np.zeros(8000 * 3), 8000)
+    assert not audio_processing.needs_segmentation(path)
+    monkeypatch.setattr(audio_processing, "AUDIO_SEGMENT_MAX_SECONDS", 2)
+    assert audio_processing.needs_segmentation(path)
+    mp3 = tmp_path / "call.mp3"
+    mp3.write_bytes(b"ID3 not a wav")
+    assert not audio_processing.needs_segmentation(str(mp3))
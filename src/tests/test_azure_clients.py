@@ -0,0 +1,57 @@
+import os
+import sys
+import subprocess
+import threading
+import time
+
+from services import azure_clients
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_with_timeout(fn, timeout=5):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "get_or_create did not return (deadlock)"
+    return result["value"]
+
+
+def test_factory_can_look_up_other_clients():
+    inner = _run_with_timeout(lambda: azure_clients.get_or_create(
+        ("test", "outer"), lambda: ("outer", azure_clients.get_or_create(("test", "inner"), object))
+    ))
+    assert inner[1] is azure_clients.get_or_create(("test", "inner"), object)
+
+
+def test_concurrent_first_calls_build_once():
+    built = []
+
+    def factory():
+        time.sleep(0.05)
+        built.append(1)
+        return object()
+
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(azure_clients.get_or_create(("test", "once"), factory)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(built) == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_import_order_does_not_deadlock():
+    # azure_oai builds a token provider (which needs the credential) before
+    # anything else has created the credential
+    for module in ("services.azure_oai", "services.insights", "services.batch_analysis"):
+        completed = subprocess.run(
+            [sys.executable, "-c", f"import tests, {module}"],
+            cwd=SRC_DIR, timeout=60, capture_output=True, text=True,
+        )
+        assert completed.returncode == 0, completed.stderr
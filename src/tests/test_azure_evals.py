@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import azure_evals
+
+# scikit-learn is a test requirement (requirements-dev.txt): it is the reference
+from sklearn import metrics as metrics_module
+
+
+def _baseline_convert(x):
+    # The Advanced page's convert_value() before evaluate_parameters()
+    if isinstance(x, (bool, int)):
+        return x
+    if isinstance(x, float):
+        return {1.0: True, 0.0: False}.get(x)
+    if isinstance(x, str):
+        s = x.strip().lower()
+        if s in ("yes", "true", "no", "false"):
+            return s in ("yes", "true")
+        try:
+            return {1: True, 0: False}.get(int(s))
+        except ValueError:
+            return None
+    return None
+
+
+def _sklearn_scores(y_true, y_pred, binary):
+    if binary:
+        kwargs = {"average": "binary", "pos_label": True, "zero_division": 0}
+    else:
+        kwargs = {"average": "weighted", "zero_division": 0}
+    return {
+        "accuracy": metrics_module.accuracy_score(y_true, y_pred),
+        "precision": metrics_module.precision_score(y_true, y_pred, **kwargs),
+        "recall": metrics_module.recall_score(y_true, y_pred, **kwargs),
+        "f1": metrics_module.f1_score(y_true, y_pred, **kwargs),
+    }
+
+
+def _baseline_metrics(df, param):
+    # Per-value conversion and sklearn scoring, with evaluate_parameters()' rules:
+    # binary when every label is a boolean, True is the class 1
+    y_true = df[f"{param}.gt"].apply(_baseline_convert)
+    y_pred = df[f"{param}.score"].apply(_baseline_convert)
+    valid = y_true.notnull() & y_pred.notnull()
+    y_true, y_pred = y_true[valid], y_pred[valid]
+    is_bool = lambda values: values.map(lambda v: isinstance(v, (bool, np.bool_))).all()
+    if is_bool(y_true) and is_bool(y_pred):
+        return _sklearn_scores(y_true.astype(bool), y_pred.astype(bool), binary=True)
+    return _sklearn_scores(y_true.astype(int), y_pred.astype(int), binary=False)
+
+
+def _former_page_metrics(df, param):
+    # What the Advanced page computed before evaluate_parameters()
+    y_true = df[f"{param}.gt"].apply(_baseline_convert)
+    y_pred = df[f"{param}.score"].apply(_baseline_convert)
+    valid = y_true.notnull() & y_pred.notnull()
+    y_true, y_pred = y_true[valid], y_pred[valid]
+    binary = isinstance(y_true.iloc[0], bool) and isinstance(y_pred.iloc[0], bool)
+    return _sklearn_scores(y_true, y_pred, binary)
+
+
+def _assert_matches_baseline(df, parameters):
+    metrics, _, missing = azure_evals.evaluate_parameters(df, parameters)
+    assert missing == []
+    for param in parameters:
+        expected = _baseline_metrics(df, param)
+        for name, value in expected.items():
+            assert metrics.loc[param, name] == pytest.approx(value), (param, name)
+
+
+def _frame(n, seed=0):
+    # Object columns of plain Python values, as parsed from the analysis JSON
+    rng = np.random.default_rng(seed)
+    truth = rng.random(n) < 0.4
+    pred = np.where(rng.random(n) < 0.8, truth, ~truth)
+    scores = rng.integers(1, 6, n)
+    return pd.DataFrame({
+        "A.gt": scores.tolist(),
+        "A.score": np.where(rng.random(n) < 0.7, scores, rng.integers(1, 6, n)).tolist(),
+        "B.gt": truth.tolist(),
+        "B.score": pred.tolist(),
+        "C.gt": np.where(truth, "Yes", "no").tolist(),
+        "C.score": np.where(pred, " TRUE", "0").tolist(),
+    }, dtype=object)
+
+
+def test_boolean_parameter_does_not_depend_on_other_parameters():
+    df = pd.DataFrame({
+        "A.gt": [1, 2, 0, 1, 3, 0],
+        "A.score": [1, 2, 1, 0, 3, 0],
+        "B.gt": [True, False, True, False, True, True],
+        "B.score": [True, True, True, True, False, True],
+    }, dtype=object)
+    alone, _, _ = azure_evals.evaluate_parameters(df, ["B"])
+    together, confusion, _ = azure_evals.evaluate_parameters(df, ["A", "B"])
+    assert together.loc["B"].equals(alone.loc["B"])
+    assert bool(together.loc["B", "binary"]) and not bool(together.loc["A", "binary"])
+    assert set(confusion.loc["A"].index.get_level_values("y_true")) == {0, 1, 2, 3}
+    _assert_matches_baseline(df, ["A", "B"])
+
+
+def test_labels_convert_as_before():
+    values = pd.Series([True, 1, 2, 1.0, 0.0, 2.0, "yes", " No ", "1", "0", "2", "maybe", None, [1]], dtype=object)
+    converted = azure_evals.convert_labels(values).tolist()
+    expected = [_baseline_convert(value) for value in values]
+    assert converted == expected
+    assert [type(value) for value in converted] == [type(value) for value in expected]
+
+
+def test_matches_sklearn_on_random_frame():
+    df = _frame(5000)
+    df.loc[::17, "B.score"] = None
+    df.loc[::13, "C.gt"] = "2"
+    _assert_matches_baseline(df, ["A", "B", "C"])
+
+
+def test_faster_than_per_value_conversion_and_sklearn():
+    df = _frame(100_000, seed=1)
+    parameters = ["A", "B", "C"]
+
+    started = time.perf_counter()
+    for param in parameters:
+        _baseline_metrics(df, param)
+    baseline_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    azure_evals.evaluate_parameters(df, parameters)
+    seconds = time.perf_counter() - started
+
+    _assert_matches_baseline(df, parameters)
+    assert seconds < baseline_seconds / 2, (seconds, baseline_seconds)
+
+
+def test_booleans_and_integers_score_as_the_same_classes():
+    df = pd.DataFrame({
+        "M.gt": [True, 1, 0, False, True, 2],
+        "M.score": [1, True, False, 1, 0, 2],
+    }, dtype=object)
+    metrics, confusion, _ = azure_evals.evaluate_parameters(df, ["M"])
+    # The former page could not score a column mixing booleans and integers
+    with pytest.raises(ValueError):
+        _former_page_metrics(df, "M")
+    # True is the class 1 and False the class 0, as before
+    assert metrics.loc["M", "matches"] == 4
+    assert not bool(metrics.loc["M", "binary"])
+    assert metrics.loc["M", "precision"] == pytest.approx(4 / 6)
+    assert metrics.loc["M", "recall"] == pytest.approx(4 / 6)
+    assert set(confusion.loc["M"].index.get_level_values("y_true")) == {0, 1, 2}
+    _assert_matches_baseline(df, ["M"])
+
+
+def test_boolean_columns_are_always_binary():
+    df = pd.DataFrame({
+        "B.gt": [True, True, False, False, True],
+        "B.score": [True, False, True, False, True],
+    })
+    metrics, _, _ = azure_evals.evaluate_parameters(df, ["B"])
+    # The former page read a numpy boolean in the first row and scored the
+    # column as weighted multi-class
+    assert _former_page_metrics(df, "B")["precision"] == pytest.approx(0.6)
+    # It is now scored on the True class
+    assert bool(metrics.loc["B", "binary"])
+    assert metrics.loc["B", "precision"] == pytest.approx(2 / 3)
+    assert metrics.loc["B", "recall"] == pytest.approx(2 / 3)
+    assert metrics.loc["B", ["tp", "fp", "fn", "tn"]].tolist() == [2, 1, 1, 1]
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import (
+    ClientAuthenticationError, HttpResponseError, ServiceRequestTimeoutError, ServiceResponseError,
+)
+
+from services import azure_search
+
+
+class _FakeIndexClient:
+    """
+    Holds one index definition in memory, like the service: updates may add
+    fields but fail when an existing field is dropped.
+    """
+    def __init__(self):
+        self.index = None
+        self.updates = 0
+
+    def get_index(self, name):
+        if self.index is None:
+            raise LookupError(name)
+        return SimpleNamespace(name=self.index.name, fields=list(self.index.fields))
+
+    def create_or_update_index(self, index):
+        if self.index is not None:
+            dropped = {f.name for f in self.index.fields} - {f.name for f in index.fields}
+            if dropped:
+                raise ValueError(f"Fields cannot be removed: {sorted(dropped)}")
+        self.index = index
+        self.updates += 1
+        return index
+
+
+@pytest.fixture
+def index_client(monkeypatch):
+    client = _FakeIndexClient()
+    monkeypatch.setattr(azure_search, "get_search_index_client", lambda: client)
+    return client
+
+
+def _names(index):
+    return {field.name for field in index.fields}
+
+
+def test_new_index_has_the_fields_of_every_document(index_client):
+    docs = [
+        {"summary": "a", "risk": {"score": 3, "explanation": "e"}},
+        {"summary": "b", "upsell": {"score": True, "explanation": "e"}, "note": None},
+        {"summary": "c", "note": "later"},
+    ]
+    message, ok = azure_search.create_or_update_index("calls", docs)
+    assert ok, message
+    names = _names(index_client.index)
+    assert {"risk_score", "upsell_score", "note", "id", "call_id", "content", "contentVector"} <= names
+    types = {field.name: field.type for field in index_client.index.fields}
+    assert types["note"] == "Edm.String"
+    assert types["upsell_score"] == "Edm.Boolean"
+
+
+def test_existing_index_only_gains_fields(index_client):
+    assert azure_search.create_or_update_index("calls", [{"summary": "a", "risk": {"score": 3}}])[1]
+    before = _names(index_client.index)
+
+    # A later sync whose documents lack fields the index has must not drop them
+    message, ok = azure_search.create_or_update_index("calls", [{"summary": "b", "churn": {"score": 1}}])
+    assert ok, message
+    assert _names(index_client.index) == before | {"churn_score"}
+
+    updates = index_client.updates
+    assert azure_search.create_or_update_index("calls", [{"summary": "c"}])[1]
+    assert index_client.updates == updates
+
+
+class _FakeSearchClient:
+    """
+    Raises the queued errors on successive upload requests, then accepts every document.
+    """
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.requests = 0
+
+    def upload_documents(self, documents):
+        self.requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [SimpleNamespace(key=doc["id"], succeeded=True, status_code=201) for doc in documents]
+
+
+@pytest.fixture
+def no_waits(monkeypatch):
+    monkeypatch.setattr(azure_search.azure_oai, "get_embeddings", lambda texts: [[0.0]] * len(texts))
+    monkeypatch.setattr(azure_search.time, "sleep", lambda seconds: None)
+
+
+def _batch():
+    return [{"id": "a", "content": "x"}, {"id": "b", "content": "y"}]
+
+
+@pytest.mark.parametrize("error", [
+    HttpResponseError(response=SimpleNamespace(status_code=429, reason="Too Many Requests", headers={})),
+    HttpResponseError(response=SimpleNamespace(status_code=503, reason="Service Unavailable", headers={})),
+    ServiceResponseError("connection reset"),
+    ServiceRequestTimeoutError("timed out"),
+])
+def test_transient_request_errors_are_retried(no_waits, error):
+    client = _FakeSearchClient(error)
+    indexed, failed_keys, retried, errors = azure_search._embed_and_upload_batch(client, _batch())
+    assert (indexed, failed_keys, retried, client.requests) == (2, [], 2, 2)
+    assert len(errors) == 1
+
+
+@pytest.mark.parametrize("error", [
+    HttpResponseError(response=SimpleNamespace(status_code=400, reason="Bad Request", headers={})),
+    HttpResponseError(response=SimpleNamespace(status_code=413, reason="Request Entity Too Large", headers={})),
+    ClientAuthenticationError("forbidden"),
+    ValueError("not serializable"),
+])
+def test_other_request_errors_fail_without_retrying(no_waits, error):
+    client = _FakeSearchClient(error)
+    indexed, failed_keys, retried, errors = azure_search._embed_and_upload_batch(client, _batch())
+    assert (indexed, failed_keys, retried, client.requests) == (0, ["a", "b"], 0, 1)
+    assert len(errors) == 1
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from services import azure_storage
+
+
+class _FakeContainer:
+    """
+    In-memory container that counts list_blobs calls.
+    """
+    def __init__(self):
+        self.blobs = {}
+        self.list_calls = 0
+
+    def add(self, path):
+        self.blobs[path] = SimpleNamespace(
+            name=path, etag=f'"{path}"', size=10, metadata={}, last_modified=datetime(2025, 1, 1, tzinfo=timezone.utc),
+        )
+
+    def get_container_properties(self):
+        return {}
+
+    def list_blobs(self, name_starts_with="", include=None):
+        self.list_calls += 1
+        return [blob for name, blob in sorted(self.blobs.items()) if name.startswith(name_starts_with)]
+
+
+@pytest.fixture
+def container(monkeypatch):
+    fake = _FakeContainer()
+    monkeypatch.setattr(azure_storage, "blob_service_client", SimpleNamespace(get_container_client=lambda name: fake))
+    azure_storage.invalidate_blob_index()
+    yield fake
+    azure_storage.invalidate_blob_index()
+
+
+def _fill(container, calls, transcribed):
+    for i in range(calls):
+        container.add(f"{azure_storage.AUDIO_FOLDER}/call{i}.wav")
+        if i < transcribed:
+            container.add(f"{azure_storage.TRANSCRIPTION_FOLDER}/call{i}.txt")
+
+
+@pytest.mark.parametrize("calls", [10, 100, 1000])
+def test_backlog_costs_two_listings_however_many_calls(container, calls):
+    _fill(container, calls, calls // 2)
+    pending, transcribed, total = azure_storage.get_calls_to_transcribe()
+    assert (len(pending), transcribed, total) == (calls - calls // 2, calls // 2, calls)
+    assert container.list_calls == 2
+
+
+def test_lookups_are_served_from_the_index(container):
+    _fill(container, 50, 10)
+    azure_storage.get_calls_to_transcribe()
+    calls = container.list_calls
+    for i in range(50):
+        assert azure_storage.transcription_already_exists(f"call{i}") == (i < 10)
+    assert len(azure_storage.list_audios()) == 50
+    assert container.list_calls == calls
+
+
+def test_index_is_listed_again_after_its_ttl(container, monkeypatch):
+    _fill(container, 5, 0)
+    azure_storage.list_audios()
+    container.add(f"{azure_storage.AUDIO_FOLDER}/late.wav")
+    assert "late.wav" not in azure_storage.list_audios()
+    monkeypatch.setattr(azure_storage, "BLOB_INDEX_TTL", 0)
+    assert "late.wav" in azure_storage.list_audios()
+    assert container.list_calls == 2
@@ -0,0 +1,60 @@
+import os
+import time
+from collections import OrderedDict
+
+import pytest
+
+from services import audio_cache, azure_storage, azure_transcription
+from services.transcription_pipeline import Pipeline
+
+
+@pytest.fixture
+def small_cache(tmp_path, monkeypatch):
+    """
+    An audio cache with room for a single file, filled by a fake download.
+    """
+    monkeypatch.setattr(audio_cache, "AUDIO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(audio_cache, "AUDIO_CACHE_MAX_BYTES", 100)
+    monkeypatch.setattr(audio_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(audio_cache, "_loaded", False)
+
+    def acquire_audio(blob_name):
+        def download(tmp_path):
+            with open(tmp_path, "w") as f:
+                f.write(blob_name.ljust(100))
+        return audio_cache.acquire(blob_name, "1", download)
+
+    monkeypatch.setattr(azure_storage, "acquire_audio", acquire_audio)
+    monkeypatch.setattr(azure_transcription, "get_transcription_model", lambda: "gpt-4o-audio")
+    return tmp_path
+
+
+def test_queued_audio_is_not_evicted(small_cache, monkeypatch):
+    def transcribe(local_file, model):
+        # Slow transcriptions, so later downloads fill the cache meanwhile
+        time.sleep(0.05)
+        with open(local_file) as f:
+            return f.read().strip()
+
+    monkeypatch.setattr(azure_transcription, "transcribe_segments", transcribe)
+    pipeline = Pipeline([
+        ("download", azure_transcription.download_stage, 4),
+        ("transcription", azure_transcription.transcription_stage, 1),
+        ("speakers", azure_transcription.speaker_stage, 1),
+    ], queue_size=8)
+    try:
+        futures = {name: pipeline.submit({"audio": name}) for name in (f"call{i}.wav" for i in range(8))}
+        assert {name: future.result(timeout=30) for name, future in futures.items()} == {name: name for name in futures}
+    finally:
+        pipeline.close()
+    # Every lease was released once its file was transcribed
+    assert not [name for name in os.listdir(small_cache) if name.endswith(audio_cache.LEASE_SUFFIX)]
+
+
+def test_lease_is_released_when_transcription_fails(small_cache, monkeypatch):
+    def fail(local_file, model):
+        raise RuntimeError("service down")
+
+    monkeypatch.setattr(azure_transcription, "transcribe_segments", fail)
+    assert azure_transcription.transcribe_audio("call.wav").startswith("Error transcribing")
+    assert not [name for name in os.listdir(small_cache) if name.endswith(audio_cache.LEASE_SUFFIX)]
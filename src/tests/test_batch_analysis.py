@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import json
+import subprocess
+import threading
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services import azure_clients, azure_oai, azure_storage, analysis_snapshot, batch_analysis
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _MockBatchAPI(BaseHTTPRequestHandler):
+    """
+    The OpenAI files/batches endpoints the worker uses. Every batch completes on
+    its second poll; transcripts containing "bad" get a non-JSON answer.
+    """
+    disable_nagle_algorithm = True
+    files = {}
+    batches = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _add_file(self, content):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = content
+        return file_id
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.endswith("/files"):
+            message = BytesParser(policy=default).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + data
+            )
+            part = next(p for p in message.iter_parts() if p.get_param("name", header="content-disposition") == "file")
+            content = part.get_content()
+            file_id = self._add_file(content if isinstance(content, bytes) else content.encode())
+            return self._reply({"id": file_id, "object": "file", "bytes": len(self.files[file_id]), "created_at": 0,
+                                "filename": "requests.jsonl", "purpose": "batch", "status": "processed"})
+
+        request = json.loads(data)
+        output = []
+        for line in self.files[request["input_file_id"]].decode().splitlines():
+            call = json.loads(line)
+            transcript = call["body"]["messages"][-1]["content"]
+            content = "not json" if "bad" in transcript else json.dumps({
+                "summary": "s",
+                "risk": {"score": 4, "explanation": "e"},
+                "additional_fields": [
+                    {"name": "handling", "value": "\"ok\""},
+                    {"name": "callback", "value": json.dumps({"requested": True, "slots": ["am", "pm"]})},
+                ],
+            })
+            output.append(json.dumps({"custom_id": call["custom_id"], "response": {
+                "status_code": 200, "body": {"choices": [{"message": {"content": content, "refusal": None}}]},
+            }}))
+        batch = {"id": f"batch-{len(self.batches)}", "object": "batch", "endpoint": request["endpoint"],
+                 "input_file_id": request["input_file_id"], "completion_window": "24h", "created_at": 0,
+                 "status": "validating", "requests": len(output)}
+        self.batches[batch["id"]] = dict(batch, polls=0, output=self._add_file("\n".join(output).encode()))
+        return self._reply({k: v for k, v in batch.items() if k != "requests"})
+
+    def do_GET(self):
+        content = re.search(r"/files/([^/]+)/content", self.path)
+        if content:
+            return self._reply(self.files[content.group(1)])
+        batch = self.batches[self.path.rsplit("/", 1)[1]]
+        batch["polls"] += 1
+        done = batch["polls"] >= 2
+        return self._reply({
+            **{k: v for k, v in batch.items() if k not in ("polls", "output", "requests")},
+            "status": "completed" if done else "in_progress",
+            "output_file_id": batch["output"] if done else None,
+            "request_counts": {"total": batch["requests"], "completed": batch["requests"] if done else 0, "failed": 0},
+        })
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockBatchAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(batch_analysis, "BATCH_API_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    azure_clients.close_all()
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """
+    Transcripts to analyze and the analyses stored, instead of the storage account.
+    """
+    transcripts = {"c1.txt": "hello", "c2.txt": "bad call", "c3.txt": "third", "c4.txt": None}
+    stored = {}
+
+    def read_blobs(names, folder):
+        for name in names:
+            if transcripts[name] is None:
+                yield name, None, IOError("gone")
+            else:
+                yield name, transcripts[name], None
+
+    monkeypatch.setattr(azure_storage, "read_blobs", read_blobs)
+    monkeypatch.setattr(azure_storage, "read_prompt_config", lambda prompt: ["risk"])
+    monkeypatch.setattr(azure_storage, "upload_llm_analysis_to_blob",
+                        lambda blob_name, prompt, analysis, metadata=None: stored.setdefault(blob_name, (analysis, metadata)))
+    monkeypatch.setattr(azure_storage, "send_message_to_queue", lambda message: None)
+    monkeypatch.setattr(azure_storage, "get_uri", lambda blob_name, persona: f"uri/{persona}/{blob_name}")
+    monkeypatch.setattr(analysis_snapshot, "refresh_snapshot", lambda persona: None)
+    return transcripts, stored
+
+
+def test_batch_run_against_mock_endpoint(mock_api, storage, tmp_path, monkeypatch):
+    transcripts, stored = storage
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_REQUESTS", 2)
+    run_dir = batch_analysis.write_request_files(
+        "churn.txt", "You are an analyst.", [(name, f"etag-{name}") for name in transcripts], str(tmp_path / "run")
+    )
+    manifest = batch_analysis.read_manifest(run_dir)
+    assert [entry["requests"] for entry in manifest["files"]] == [2, 1]
+    assert list(manifest["failed"]) == ["c4.txt"]
+    with open(manifest["files"][0]["path"], encoding="utf-8") as f:
+        body = json.loads(f.readline())["body"]
+    assert body["model"] == azure_oai.AZURE_OPENAI_DEPLOYMENT_NAME
+    assert "risk" in body["response_format"]["json_schema"]["schema"]["required"]
+
+    client = batch_analysis.get_batch_client()
+    batch_analysis.submit(run_dir, client)
+    batch_analysis.wait_for_batches(run_dir, client, poll_seconds=0.01)
+    assert batch_analysis.collect_results(run_dir, client) == {"completed": 2, "failed": 1}
+    # Collected batches are not stored twice
+    assert batch_analysis.collect_results(run_dir, client) == {"completed": 0, "failed": 0}
+
+    assert sorted(stored) == ["c1.txt", "c3.txt"]
+    analysis, metadata = stored["c1.txt"]
+    assert analysis["risk"] == {"score": 4, "explanation": "e"}
+    assert analysis["handling"] == "ok"
+    assert analysis["callback"] == {"requested": True, "slots": ["am", "pm"]}
+    assert metadata["transcript_etag"] == "etag-c1.txt"
+    assert set(batch_analysis.read_manifest(run_dir)["failed"]) == {"c2.txt", "c4.txt"}
+
+
+def test_empty_batch_deployment_falls_back_to_chat_deployment():
+    completed = subprocess.run(
+        [sys.executable, "-c", "import tests; from services import batch_analysis as b; print(b.AZURE_OPENAI_BATCH_DEPLOYMENT)"],
+        cwd=SRC_DIR, timeout=60, capture_output=True, text=True,
+        env={**os.environ, "AZURE_OPENAI_BATCH_DEPLOYMENT": ""},
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"]
+
+
+def test_worker_starts():
+    completed = subprocess.run(
+        [sys.executable, "batch_analysis_worker.py"], cwd=SRC_DIR, timeout=60, capture_output=True, text=True,
+    )
+    assert completed.returncode == 1
+    assert "Run with: python batch_analysis_worker.py" in completed.stdout
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from services import azure_oai, embedding_cache
+
+
+def _vector(text):
+    # A distinct, reproducible vector per normalized text
+    text = embedding_cache.normalize_text(text)
+    return [float(len(text)), float(sum(map(ord, text)) % 997), 0.5]
+
+
+class _FakeEmbeddings:
+    """
+    The embeddings endpoint: records every request and answers its items in
+    reverse order, each tagged with its input index like the service.
+    """
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def create(self, model, input):
+        assert all(text for text in input), "the API rejects empty strings"
+        with self.lock:
+            self.requests.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=_vector(text)) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data[::-1])
+
+    def inputs(self):
+        return [text for request in self.requests for text in request]
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    monkeypatch.setattr(embedding_cache, "_connection", None)
+    monkeypatch.setattr(embedding_cache, "_memory", OrderedDict())
+    monkeypatch.setattr(embedding_cache, "_stats", {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0})
+    yield embedding_cache
+    if embedding_cache._connection is not None:
+        embedding_cache._connection.close()
+
+
+@pytest.fixture
+def api(monkeypatch, cache):
+    embeddings = _FakeEmbeddings()
+    monkeypatch.setattr(azure_oai, "get_oai_client", lambda: SimpleNamespace(embeddings=embeddings))
+    monkeypatch.setattr(azure_oai, "AZURE_OPENAI_EMBEDDING_MODEL", "embedding-test")
+    monkeypatch.setattr(azure_oai, "EMBEDDING_DIM", 3)
+    return embeddings
+
+
+def test_vectors_come_back_in_input_order(api):
+    texts = [f"call {i} " + "word " * (i % 7) for i in range(100)]
+    vectors = azure_oai.get_embeddings(texts, max_items=8, max_workers=4)
+    assert vectors == [_vector(text) for text in texts]
+    assert len(api.requests) == 13
+    assert sorted(api.inputs()) == sorted(texts)
+
+
+def test_batches_respect_item_and_token_budgets(api):
+    texts = ["x" * 40 * (1 + i % 5) for i in range(60)] + ["y" * 2000]
+    vectors = azure_oai.get_embeddings([f"{i} {text}" for i, text in enumerate(texts)], max_items=10, max_tokens=120)
+    assert len(vectors) == len(texts)
+    for request in api.requests:
+        assert len(request) <= 10
+        # A single text above the token budget is sent on its own
+        assert len(request) == 1 or sum(azure_oai.estimate_tokens(text) for text in request) <= 120
+    assert [len(request) for request in api.requests if request[0].endswith("y" * 2000)] == [1]
+
+
+def test_pack_embedding_batches():
+    texts = ["a" * 39, "b" * 39, "c" * 39, "d" * 400, "e"]  # 10, 10, 10, 101, 1 estimated tokens
+    assert azure_oai.pack_embedding_batches(texts, max_items=2, max_tokens=100) == [[0, 1], [2], [3], [4]]
+    assert azure_oai.pack_embedding_batches([], max_items=2, max_tokens=100) == []
+
+
+def test_second_pass_makes_no_api_calls(api, cache):
+    texts = [f"document {i}" for i in range(30)]
+    first = azure_oai.get_embeddings(texts, max_items=7)
+    requests = len(api.requests)
+
+    assert azure_oai.get_embeddings(texts, max_items=7) == first
+    assert azure_oai.get_embedding("document 3") == first[3]
+    assert len(api.requests) == requests
+    assert cache.get_stats()["memory_hits"] == 31
+
+    # After a restart the vectors come from disk
+    cache._memory.clear()
+    assert azure_oai.get_embeddings(texts) == first
+    assert len(api.requests) == requests
+    assert cache.get_stats()["disk_hits"] == 30
+
+
+def test_repeat_query_makes_no_api_call(api):
+    assert azure_oai.get_embedding("cancel my  contract") == _vector("cancel my contract")
+    # Whitespace differences hit the same entry
+    assert azure_oai.get_embedding(" cancel my contract\n") == _vector("cancel my contract")
+    assert api.requests == [["cancel my  contract"]]
+
+
+def test_duplicates_and_empty_texts_are_sent_once(api):
+    texts = ["same text", "same  text", "", "other", "same text", None]
+    vectors = azure_oai.get_embeddings(texts)
+    assert api.inputs().count("same text") == 1 and "same  text" not in api.inputs()
+    assert api.inputs().count(" ") == 1
+    assert vectors[0] == vectors[1] == vectors[4] == _vector("same text")
+    assert vectors[2] == vectors[5] == _vector(" ")
+    assert len(api.inputs()) == 3
+
+
+def test_cache_is_keyed_by_model_and_dimension(api, monkeypatch):
+    azure_oai.get_embeddings(["hello"])
+    monkeypatch.setattr(azure_oai, "EMBEDDING_DIM", 1024)
+    azure_oai.get_embeddings(["hello"])
+    monkeypatch.setattr(azure_oai, "AZURE_OPENAI_EMBEDDING_MODEL", "embedding-other")
+    azure_oai.get_embeddings(["hello"])
+    assert api.requests == [["hello"]] * 3
+
+
+def test_memory_tier_is_bounded(cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MEMORY_ITEMS", 2)
+    cache.put_many("m", 3, ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    assert len(cache._memory) == 2
+    assert cache.get_many("m", 3, ["a", "c", "z"]) == [[1.0], [3.0], None]
+    stats = cache.get_stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import signal
+import subprocess
+
+import entrypoint
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_crashed_process_stops_the_other(tmp_path):
+    pid_file = tmp_path / "ui.pid"
+    started = time.monotonic()
+    status = entrypoint.supervise({
+        "ui": _python(f"import os, time; open({str(pid_file)!r}, 'w').write(str(os.getpid())); time.sleep(60)"),
+        "worker": _python("import time; time.sleep(0.5); raise SystemExit(3)"),
+    }, poll_interval=0.05, stop_timeout=5)
+    assert status == 3
+    assert time.monotonic() - started < 10
+    assert not _alive(int(pid_file.read_text()))
+
+
+def test_clean_exit_still_fails_the_container():
+    status = entrypoint.supervise({
+        "ui": _python("import time; time.sleep(60)"),
+        "worker": _python("pass"),
+    }, poll_interval=0.05, stop_timeout=5)
+    assert status == 1
+
+
+def test_process_ignoring_terminate_is_killed():
+    started = time.monotonic()
+    status = entrypoint.supervise({
+        "stubborn": _python("import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"),
+        "worker": _python("import time; time.sleep(0.5); raise SystemExit(2)"),
+    }, poll_interval=0.05, stop_timeout=0.5)
+    assert status == 2
+    assert time.monotonic() - started < 10
+
+
+def test_sigterm_stops_both_and_exits_cleanly():
+    code = (
+        "import sys, entrypoint; sys.exit(entrypoint.supervise({"
+        "'ui': [sys.executable, '-c', 'import time; time.sleep(60)'],"
+        "'worker': [sys.executable, '-c', 'import time; time.sleep(60)']}, poll_interval=0.05, stop_timeout=5))"
+    )
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=SRC_DIR)
+    time.sleep(1)
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(15) == 0
+
+
+def test_signal_handlers_are_restored():
+    before = signal.getsignal(signal.SIGINT)
+    entrypoint.supervise({"worker": _python("pass")}, poll_interval=0.05, stop_timeout=5)
+    assert signal.getsignal(signal.SIGINT) is before
@@ -0,0 +1,51 @@
+import pytest
+
+from services import azure_oai, insights
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    """
+    Records the estimated prompt tokens of every request and answers with a
+    reply of reply_tokens estimated tokens.
+    """
+    monkeypatch.setattr(insights, "INSIGHTS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(insights, "INSIGHTS_CHUNK_TOKENS", 1000)
+    requests = []
+    settings = {"reply_tokens": 50}
+
+    def chat_completion(messages, max_tokens=None):
+        # The values the chunks were sized by, without their "<label>: " prefix
+        items = [m["content"].split(": ", 1)[1].rstrip() for m in messages[1:]]
+        requests.append((messages[0]["content"], sum(azure_oai.estimate_tokens(item) for item in items)))
+        return f"summary of {len(requests)} " + "x" * (settings["reply_tokens"] * 4)
+
+    monkeypatch.setattr(azure_oai, "chat_completion", chat_completion)
+    return requests, settings
+
+
+def _values(count):
+    return [f"call {i} " + "word " * 40 for i in range(count)]
+
+
+def test_reduces_until_one_analysis(fake_llm):
+    requests, settings = fake_llm
+    settings["reply_tokens"] = 300
+    result, stats = insights.get_insights(_values(400), return_stats=True)
+    assert result.startswith("summary of")
+    reduces = [tokens for prompt, tokens in requests if prompt == insights.REDUCE_PROMPT]
+    # More partials than one prompt holds: several reduce rounds, all within budget
+    assert len(reduces) > 1
+    assert max(tokens for _, tokens in requests) <= insights.INSIGHTS_CHUNK_TOKENS
+    assert stats["truncated"] == 0
+
+
+def test_oversized_partials_are_truncated_not_sent_whole(fake_llm):
+    requests, settings = fake_llm
+    # Every partial alone is larger than a whole prompt
+    settings["reply_tokens"] = 3000
+    result, stats = insights.get_insights(_values(200), return_stats=True)
+    assert result.startswith("summary of")
+    assert stats["truncated"] > 0
+    reduces = [tokens for prompt, tokens in requests if prompt == insights.REDUCE_PROMPT]
+    assert reduces and max(reduces) <= insights.INSIGHTS_CHUNK_TOKENS
@@ -0,0 +1,177 @@
+import threading
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from services import oai_scheduler
+
+
+class _Clock:
+    """
+    monotonic() and sleep() for the scheduler: sleeping advances the clock at once.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(oai_scheduler, "time", clock)
+    monkeypatch.setattr(oai_scheduler.random, "random", lambda: 1.0)  # no jitter
+    return clock
+
+
+def _response(status, headers=None):
+    return httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "https://localhost.invalid"))
+
+
+def _throttled(headers=None):
+    return openai.RateLimitError("Too Many Requests", response=_response(429, headers), body=None)
+
+
+def _calls(*outcomes):
+    """
+    A request that raises or returns each outcome in turn.
+    """
+    outcomes = list(outcomes)
+    calls = []
+
+    def request():
+        calls.append(1)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return request, calls
+
+
+def test_bucket_larger_request_is_charged_the_capacity(clock):
+    bucket = oai_scheduler.TokenBucket(rate_per_minute=600, capacity=100)
+    assert bucket.acquire(1000) == 100
+    assert bucket.available == 0
+    # The next small request waits for its own refill, not for 900 units of debt
+    assert bucket.acquire(10) == 10
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_bucket_refund_keeps_it_between_empty_and_full(clock):
+    bucket = oai_scheduler.TokenBucket(rate_per_minute=600, capacity=100)
+    bucket.acquire(50)
+    bucket.refund(-500)
+    assert bucket.available == 0
+    bucket.refund(500)
+    assert bucket.available == 100
+
+
+def test_bucket_waits_for_refill(clock):
+    bucket = oai_scheduler.TokenBucket(rate_per_minute=60)
+    for _ in range(60):
+        bucket.acquire(1)
+    assert clock.sleeps == []
+    bucket.acquire(2)
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+
+def test_throttled_call_waits_retry_after_and_halves_concurrency(clock):
+    scheduler = oai_scheduler.Scheduler("gpt-test", initial_concurrency=8, max_retries=3)
+    request, calls = _calls(_throttled({"retry-after": "7"}), _throttled({"retry-after-ms": "1500"}), "done")
+    assert scheduler.run(request) == "done"
+    assert len(calls) == 3
+    assert clock.sleeps == [7.0, 1.5]
+    stats = scheduler.get_throughput()
+    assert (stats["throttled"], stats["retries"], stats["requests"], stats["failures"]) == (2, 2, 1, 0)
+    # 8 -> 4 -> 2, then one success adds 1/2
+    assert scheduler.concurrency.limit == pytest.approx(2.5)
+
+
+def test_throttled_call_without_retry_after_backs_off_exponentially(clock):
+    scheduler = oai_scheduler.Scheduler("gpt-test", max_retries=2, base_delay=1.0)
+    request, calls = _calls(_throttled(), _throttled(), _throttled())
+    with pytest.raises(openai.RateLimitError):
+        scheduler.run(request)
+    assert len(calls) == 3
+    assert clock.sleeps == [1.0, 2.0]
+    assert scheduler.get_throughput()["failures"] == 1
+
+
+def test_transient_errors_are_retried_without_throttling(clock):
+    scheduler = oai_scheduler.Scheduler("gpt-test", initial_concurrency=4)
+    request, calls = _calls(openai.APITimeoutError(httpx.Request("POST", "https://localhost.invalid")), "done")
+    assert scheduler.run(request) == "done"
+    assert len(calls) == 2
+    # The timeout leaves the limit alone, the success adds 1/4
+    assert scheduler.concurrency.limit == pytest.approx(4.25)
+
+
+def test_other_errors_are_raised_at_once(clock):
+    scheduler = oai_scheduler.Scheduler("gpt-test")
+    request, calls = _calls(openai.BadRequestError("bad", response=_response(400), body=None))
+    with pytest.raises(openai.BadRequestError):
+        scheduler.run(request)
+    assert len(calls) == 1 and clock.sleeps == []
+    assert scheduler.concurrency.in_flight == 0
+    assert scheduler.concurrency.limit == 8
+
+
+def test_tokens_are_settled_with_the_real_usage(clock):
+    scheduler = oai_scheduler.Scheduler("gpt-test", tokens_per_minute=1000)
+    scheduler.run(lambda: SimpleNamespace(total_tokens=100), estimated_tokens=400,
+                  usage_tokens=lambda result: result.total_tokens)
+    assert scheduler.tokens.available == pytest.approx(900)
+    # A prompt estimated above the whole budget does not leave the bucket in debt
+    scheduler.run(lambda: SimpleNamespace(total_tokens=5000), estimated_tokens=5000,
+                  usage_tokens=lambda result: result.total_tokens)
+    assert scheduler.tokens.available == 0
+    assert scheduler.get_throughput()["tokens_per_minute"] == 5100
+
+
+def test_aimd_decrease_and_increase():
+    concurrency = oai_scheduler.AdaptiveConcurrency(initial=8, minimum=1, maximum=4)
+    for expected in (4, 2, 1, 1):
+        concurrency.acquire()
+        concurrency.release(throttled=True)
+        assert concurrency.limit == expected
+    # Additive increase: about one slot per window of `limit` successes, up to the maximum
+    for _ in range(3):
+        concurrency.acquire()
+        concurrency.release()
+    assert concurrency.limit == pytest.approx(1 + 1 + 1 / 2 + 1 / 2.5)
+    for _ in range(50):
+        concurrency.acquire()
+        concurrency.release()
+    assert concurrency.limit == 4
+
+
+def test_concurrency_limit_blocks_extra_callers():
+    concurrency = oai_scheduler.AdaptiveConcurrency(initial=2, minimum=1, maximum=4)
+    concurrency.acquire()
+    concurrency.acquire()
+    entered = threading.Event()
+
+    def third():
+        concurrency.acquire()
+        entered.set()
+
+    threading.Thread(target=third, daemon=True).start()
+    assert not entered.wait(0.2)
+    concurrency.release()
+    assert entered.wait(5)
+
+
+def test_retry_after_http_date(clock):
+    error = _throttled({"retry-after": "Thu, 01 Jan 1970 00:17:00 GMT"})
+    assert oai_scheduler.retry_after_seconds(error) == pytest.approx(1020 - clock.now)
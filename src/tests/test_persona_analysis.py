@@ -0,0 +1,94 @@
+import pytest
+
+from services import azure_storage, persona_analysis
+
+PROMPT = "You are an analyst."
+ANALYSES = f"{azure_storage.LLM_ANALYSIS_FOLDER}/churn/"
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """
+    Transcript and analysis listings, and blobs written under ANALYSIS_RUNS_FOLDER,
+    instead of the storage account.
+    """
+    indexes = {azure_storage.TRANSCRIPTION_FOLDER: {}, ANALYSES: {}}
+    blobs = {}
+    monkeypatch.setattr(azure_storage, "get_blob_index", lambda prefix, refresh=False: indexes[prefix])
+    monkeypatch.setattr(azure_storage, "upload_blob",
+                        lambda data, blob_name, prefix="": blobs.__setitem__(f"{prefix}/{blob_name}", data))
+    monkeypatch.setattr(azure_storage, "read_blob", lambda blob_name, prefix="": blobs.get(f"{prefix}/{blob_name}"))
+    return indexes, blobs
+
+
+def _add_call(indexes, name, etag, analysis_metadata=None):
+    indexes[azure_storage.TRANSCRIPTION_FOLDER][f"{azure_storage.TRANSCRIPTION_FOLDER}/{name}.txt"] = {"etag": etag}
+    if analysis_metadata is not None:
+        indexes[ANALYSES][f"{ANALYSES}{name}.json"] = {"metadata": analysis_metadata}
+
+
+def test_plan_analyzes_missing_and_stale_calls(storage):
+    indexes, _ = storage
+    current = persona_analysis.prompt_hash(PROMPT)
+    _add_call(indexes, "fresh", '"e1"', persona_analysis.analysis_metadata('"e1"', current))
+    _add_call(indexes, "missing", '"e2"')
+    _add_call(indexes, "new_transcript", '"e3-v2"', persona_analysis.analysis_metadata('"e3"', current))
+    _add_call(indexes, "old_prompt", '"e4"', persona_analysis.analysis_metadata('"e4"', persona_analysis.prompt_hash("Old")))
+    _add_call(indexes, "no_metadata", '"e5"', {})
+
+    to_analyze, up_to_date = persona_analysis.plan_analysis("churn.txt", PROMPT)
+    assert up_to_date == 1
+    assert to_analyze == [
+        ("missing.txt", '"e2"'), ("new_transcript.txt", '"e3-v2"'), ("no_metadata.txt", '"e5"'), ("old_prompt.txt", '"e4"'),
+    ]
+
+
+def test_plan_compares_etags_without_quotes(storage):
+    indexes, _ = storage
+    # Listings return quoted etags, metadata stores them stripped
+    _add_call(indexes, "c1", '"0x8D1"', {"transcript_etag": "0x8D1", "prompt_hash": persona_analysis.prompt_hash(PROMPT)})
+    assert persona_analysis.plan_analysis("churn.txt", PROMPT) == ([], 1)
+
+
+def test_plan_without_only_stale_analyzes_everything(storage):
+    indexes, _ = storage
+    _add_call(indexes, "c1", '"e1"', persona_analysis.analysis_metadata('"e1"', persona_analysis.prompt_hash(PROMPT)))
+    _add_call(indexes, "c2", '"e2"')
+    assert persona_analysis.plan_analysis("churn.txt", PROMPT, only_stale=False) == (
+        [("c1.txt", '"e1"'), ("c2.txt", '"e2"')], 0,
+    )
+
+
+def test_interrupted_run_resumes_from_its_pending_calls(storage):
+    indexes, _ = storage
+    current = persona_analysis.prompt_hash(PROMPT)
+    for i in range(1, 6):
+        _add_call(indexes, f"c{i}", f'"e{i}"')
+    persona_analysis.save_checkpoint("churn.txt", PROMPT, {"c1.txt", "c2.txt", "c3.txt", "c4.txt", "c5.txt"}, 0, set())
+    # c1 completed and was checkpointed, c2 completed after the last checkpoint, c3 failed
+    _add_call(indexes, "c1", '"e1"', persona_analysis.analysis_metadata('"e1"', current))
+    _add_call(indexes, "c2", '"e2"', persona_analysis.analysis_metadata('"e2"', current))
+    persona_analysis.save_checkpoint("churn.txt", PROMPT, {"c2.txt", "c4.txt", "c5.txt"}, 1, {"c3.txt"})
+
+    checkpoint = persona_analysis.read_checkpoint("churn.txt")
+    assert checkpoint["completed"] == 1 and checkpoint["failed"] == ["c3.txt"]
+    only_files = persona_analysis.resume_files(checkpoint, PROMPT)
+    assert only_files == ["c2.txt", "c4.txt", "c5.txt"]
+
+    assert persona_analysis.plan_analysis("churn.txt", PROMPT, True, only_files=only_files) == (
+        [("c4.txt", '"e4"'), ("c5.txt", '"e5"')], 1,
+    )
+    # Re-analysis of every call is limited to the calls the run had left
+    assert persona_analysis.plan_analysis("churn.txt", PROMPT, False, only_files=only_files) == (
+        [("c2.txt", '"e2"'), ("c4.txt", '"e4"'), ("c5.txt", '"e5"')], 0,
+    )
+
+
+def test_nothing_to_resume(storage):
+    persona_analysis.save_checkpoint("churn.txt", PROMPT, {"c1.txt"}, 0, set())
+    checkpoint = persona_analysis.read_checkpoint("churn.txt")
+    assert persona_analysis.resume_files(checkpoint, "Another prompt") is None
+    assert persona_analysis.resume_files(checkpoint, PROMPT, ["risk"]) is None
+    persona_analysis.save_checkpoint("churn.txt", PROMPT, set(), 1, set(), status="completed")
+    assert persona_analysis.resume_files(persona_analysis.read_checkpoint("churn.txt"), PROMPT) is None
+    assert persona_analysis.resume_files(None, PROMPT) is None
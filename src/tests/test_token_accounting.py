@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from services import token_accounting
+
+
+class _FakeEncoding:
+    # One token per word
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    """
+    A tiktoken stand-in whose get_encoding blocks until released (a slow or
+    unreachable download) or raises when given an error.
+    """
+    state = SimpleNamespace(released=threading.Event(), error=None, loads=0)
+
+    def get_encoding(name):
+        state.loads += 1
+        state.released.wait(10)
+        if state.error:
+            raise state.error
+        return _FakeEncoding()
+
+    monkeypatch.setattr(token_accounting, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+    monkeypatch.setattr(token_accounting, "OAI_TOKENIZER_LOAD_TIMEOUT", 0.2)
+    monkeypatch.setattr(token_accounting, "_encoding", None)
+    monkeypatch.setattr(token_accounting, "_encoding_loader", None)
+    yield state
+    state.released.set()
+
+
+def _wait_loaded():
+    token_accounting._encoding_loader.join(5)
+
+
+def test_hung_download_falls_back_to_estimate(tokenizer):
+    text = "one two three four five six seven eight"
+    started = time.monotonic()
+    assert token_accounting.count_tokens(text) == len(text) // 4 + 1
+    assert time.monotonic() - started < 2
+    # Later calls do not wait again while the download is still pending
+    started = time.monotonic()
+    assert token_accounting.count_tokens(text) == len(text) // 4 + 1
+    assert time.monotonic() - started < 0.1
+
+    tokenizer.released.set()
+    _wait_loaded()
+    assert token_accounting.count_tokens(text) == 8
+    assert tokenizer.loads == 1
+
+
+def test_loaded_encoding_is_used_without_waiting(tokenizer):
+    tokenizer.released.set()
+    assert token_accounting.count_tokens("a b c") == 3
+
+
+def test_failed_load_estimates_and_is_not_retried(tokenizer):
+    tokenizer.error = OSError("network unreachable")
+    tokenizer.released.set()
+    assert token_accounting.count_tokens("x" * 16) == 16 // 4 + 1
+    _wait_loaded()
+    text, dropped = token_accounting.truncate_text("x" * 400, 20, "head")
+    assert len(text) == 19 * 4 and dropped > 0
+    assert tokenizer.loads == 1
+
+
+def test_tiktoken_cache_dir_is_set():
+    assert os.environ["TIKTOKEN_CACHE_DIR"] == token_accounting.TIKTOKEN_CACHE_DIR
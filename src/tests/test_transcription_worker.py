@@ -0,0 +1,168 @@
+import json
+import time
+import uuid
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import transcription_worker
+
+
+class _MemoryQueue:
+    """
+    A storage queue in memory: received messages stay hidden until expire() (or
+    their visibility timeout, when it is short), and deletes and updates need
+    the latest pop receipt, like the service.
+    """
+    def __init__(self):
+        self.messages = {}
+        self.lock = threading.Lock()
+        self.updates = 0
+
+    def send_message(self, content):
+        with self.lock:
+            message_id = uuid.uuid4().hex
+            self.messages[message_id] = {"content": content, "dequeue_count": 0, "pop_receipt": None, "hidden_until": 0.0}
+            return SimpleNamespace(id=message_id)
+
+    def receive_messages(self, max_messages=1, messages_per_page=None, visibility_timeout=30):
+        received = []
+        with self.lock:
+            for message_id, message in self.messages.items():
+                if len(received) == max_messages:
+                    break
+                if message["hidden_until"] > time.monotonic():
+                    continue
+                message.update(dequeue_count=message["dequeue_count"] + 1, pop_receipt=uuid.uuid4().hex,
+                               hidden_until=time.monotonic() + visibility_timeout)
+                received.append(SimpleNamespace(id=message_id, **{k: message[k] for k in ("content", "dequeue_count", "pop_receipt")}))
+        return received
+
+    def _check(self, message_id, pop_receipt):
+        if message_id not in self.messages or self.messages[message_id]["pop_receipt"] != pop_receipt:
+            raise LookupError(f"Stale pop receipt for {message_id}")
+
+    def update_message(self, message_id, pop_receipt, visibility_timeout):
+        with self.lock:
+            self._check(message_id, pop_receipt)
+            message = self.messages[message_id]
+            message.update(pop_receipt=uuid.uuid4().hex, hidden_until=time.monotonic() + visibility_timeout)
+            self.updates += 1
+            return SimpleNamespace(pop_receipt=message["pop_receipt"])
+
+    def delete_message(self, message_id, pop_receipt):
+        with self.lock:
+            self._check(message_id, pop_receipt)
+            del self.messages[message_id]
+
+    def expire(self):
+        with self.lock:
+            for message in self.messages.values():
+                message["hidden_until"] = 0.0
+
+    def contents(self):
+        return [message["content"] for message in self.messages.values()]
+
+
+@pytest.fixture
+def queues(monkeypatch):
+    monkeypatch.setattr(transcription_worker, "TRANSCRIPTION_POLL_INTERVAL", 0.01)
+    return _MemoryQueue(), _MemoryQueue()
+
+
+def _run(queues, transcribe, uploaded):
+    queue, poison = queues
+    return transcription_worker.run(
+        queue, poison, max_workers=4, drain=True, transcribe=transcribe,
+        upload=lambda name, transcript: uploaded.__setitem__(name, transcript),
+    )
+
+
+def _job(audio):
+    return json.dumps({"audio": audio})
+
+
+def test_completed_job_is_deleted_after_upload(queues):
+    queue, poison = queues
+    queue.send_message(_job("call1.wav"))
+    queue.send_message(_job("call2.wav"))
+    uploaded = {}
+    counts = _run(queues, lambda audio: f"Speaker 1: {audio}", uploaded)
+    assert counts == {"completed": 2, "failed": 0, "poisoned": 0}
+    assert uploaded == {"call1": "Speaker 1: call1.wav", "call2": "Speaker 1: call2.wav"}
+    assert queue.messages == {} and poison.messages == {}
+
+
+def test_failed_job_is_left_for_retry(queues):
+    queue, poison = queues
+    queue.send_message(_job("call1.wav"))
+    queue.send_message(_job("call2.wav"))
+    attempts = []
+
+    def transcribe(audio):
+        attempts.append(audio)
+        if audio == "call2.wav" and attempts.count(audio) == 1:
+            raise IOError("download interrupted")
+        return "text"
+
+    uploaded = {}
+    assert _run(queues, transcribe, uploaded) == {"completed": 1, "failed": 1, "poisoned": 0}
+    assert queue.contents() == [_job("call2.wav")]
+
+    # Visible again once its visibility timeout runs out
+    queue.expire()
+    assert _run(queues, transcribe, uploaded) == {"completed": 1, "failed": 0, "poisoned": 0}
+    assert sorted(uploaded) == ["call1", "call2"]
+    assert queue.messages == {} and poison.messages == {}
+
+
+def test_job_is_poisoned_after_max_dequeue(queues, monkeypatch):
+    monkeypatch.setattr(transcription_worker, "TRANSCRIPTION_MAX_DEQUEUE", 2)
+    queue, poison = queues
+    queue.send_message(_job("broken.wav"))
+    attempts = []
+
+    def transcribe(audio):
+        attempts.append(audio)
+        return "Error transcribing broken.wav: unsupported audio"
+
+    uploaded = {}
+    for expected in ("failed", "failed", "poisoned"):
+        counts = _run(queues, transcribe, uploaded)
+        assert counts[expected] == 1
+        queue.expire()
+    assert len(attempts) == 2 and uploaded == {}
+    assert queue.messages == {}
+    [moved] = poison.contents()
+    assert json.loads(moved) == {"message": _job("broken.wav"), "reason": "failed 2 times"}
+
+
+@pytest.mark.parametrize("content", ["not json", json.dumps({"file": "call1.wav"}), json.dumps(["call1.wav"])])
+def test_malformed_job_is_poisoned(queues, content):
+    queue, poison = queues
+    queue.send_message(content)
+    transcribe_calls = []
+    counts = _run(queues, transcribe_calls.append, {})
+    assert counts == {"completed": 0, "failed": 0, "poisoned": 1}
+    assert transcribe_calls == [] and queue.messages == {}
+    [moved] = poison.contents()
+    assert json.loads(moved)["message"] == content
+    assert json.loads(moved)["reason"].startswith("invalid job")
+
+
+def test_long_job_stays_invisible_and_is_deleted_with_the_latest_receipt(queues, monkeypatch):
+    monkeypatch.setattr(transcription_worker, "TRANSCRIPTION_VISIBILITY_TIMEOUT", 0.1)
+    queue, _ = queues
+    queue.send_message(_job("long.wav"))
+
+    def transcribe(audio):
+        # Outlives the visibility timeout several times; a second worker would see it
+        # again if the worker did not renew it
+        time.sleep(0.35)
+        assert queue.receive_messages(visibility_timeout=0.1) == []
+        return "text"
+
+    assert _run(queues, transcribe, {}) == {"completed": 1, "failed": 0, "poisoned": 0}
+    assert queue.updates >= 2
+    assert queue.messages == {}
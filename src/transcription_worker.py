@@ -0,0 +1,170 @@
+"""
+Standalone transcription worker.
+
+Consumes {"audio": "<blob name>"} jobs from TRANSCRIPTION_QUEUE_NAME (queued by the
+Calls Management page) and keeps up to TRANSCRIPTION_WORKERS jobs in flight. Jobs go
+through the staged transcription pipeline (download, transcription, speaker labeling),
+so different calls occupy different stages at once. Each transcript is written with
+upload_transcription_to_blob.
+
+Run with: python transcription_worker.py
+"""
+import os
+import json
+import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+
+from services import audio_processing, azure_storage, azure_transcription
+
+load_dotenv()
+
+# Jobs in flight; keep this at least the sum of the pipeline stage workers so no stage idles
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "10"))
+# Seconds a received job stays hidden from other workers; renewed while it is processed
+TRANSCRIPTION_VISIBILITY_TIMEOUT = int(os.getenv("TRANSCRIPTION_VISIBILITY_TIMEOUT", "300"))
+# Jobs received more often than this are moved to the poison queue
+TRANSCRIPTION_MAX_DEQUEUE = int(os.getenv("TRANSCRIPTION_MAX_DEQUEUE", "5"))
+TRANSCRIPTION_POLL_INTERVAL = float(os.getenv("TRANSCRIPTION_POLL_INTERVAL", "5"))
+# Seconds between pipeline stage reports while jobs are in flight
+TRANSCRIPTION_STATS_INTERVAL = float(os.getenv("TRANSCRIPTION_STATS_INTERVAL", "60"))
+POISON_QUEUE_NAME = f"{azure_storage.TRANSCRIPTION_QUEUE_NAME}-poison"
+
+
+def _keep_invisible(queue_client, lease, done):
+    """
+    Renew the job's visibility timeout until `done` is set, so long transcriptions
+    are not handed to another worker. The latest pop receipt is kept in `lease`.
+    """
+    while not done.wait(TRANSCRIPTION_VISIBILITY_TIMEOUT / 2):
+        with lease["lock"]:
+            try:
+                updated = queue_client.update_message(
+                    lease["id"], pop_receipt=lease["pop_receipt"],
+                    visibility_timeout=TRANSCRIPTION_VISIBILITY_TIMEOUT,
+                )
+                lease["pop_receipt"] = updated.pop_receipt
+            except Exception as e:
+                print(f"Could not extend visibility of job {lease['id']}: {e}")
+                return
+
+
+def _move_to_poison(queue_client, poison_queue_client, message, reason):
+    print(f"Moving job {message.id} to '{POISON_QUEUE_NAME}': {reason}")
+    poison_queue_client.send_message(json.dumps({"message": message.content, "reason": reason}))
+    queue_client.delete_message(message.id, message.pop_receipt)
+
+
+def handle_message(queue_client, poison_queue_client, message,
+                   transcribe=azure_transcription.transcribe_audio_pipelined,
+                   upload=azure_storage.upload_transcription_to_blob):
+    """
+    Process one job. The message is deleted only after its transcript is stored;
+    on failure it becomes visible again and is retried until it is poisoned.
+    """
+    try:
+        audio_name = json.loads(message.content)["audio"]
+    except (ValueError, KeyError, TypeError) as e:
+        _move_to_poison(queue_client, poison_queue_client, message, f"invalid job: {e}")
+        return "poisoned"
+
+    if message.dequeue_count > TRANSCRIPTION_MAX_DEQUEUE:
+        _move_to_poison(queue_client, poison_queue_client, message,
+                        f"failed {message.dequeue_count - 1} times")
+        return "poisoned"
+
+    lease = {"id": message.id, "pop_receipt": message.pop_receipt, "lock": threading.Lock()}
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_keep_invisible, args=(queue_client, lease, done), daemon=True)
+    heartbeat.start()
+    try:
+        transcript = transcribe(audio_name)
+        if azure_transcription.is_transcription_error(transcript):
+            print(f"Transcription of {audio_name} failed, will retry: {transcript}")
+            return "failed"
+        upload(audio_name.split(".")[0], transcript)
+    finally:
+        done.set()
+        heartbeat.join()
+
+    with lease["lock"]:
+        queue_client.delete_message(lease["id"], lease["pop_receipt"])
+    print(f"Transcribed {audio_name}")
+    return "completed"
+
+
+def format_pipeline_stats(stats) -> str:
+    return "; ".join(
+        f"{name}: {s['queue_depth']} queued, {s['in_flight']}/{s['workers']} busy, "
+        f"{s['items_per_minute']}/min, {s['avg_seconds']:.1f}s avg"
+        for name, s in stats.items()
+    )
+
+
+def run(queue_client=None, poison_queue_client=None, max_workers=TRANSCRIPTION_WORKERS,
+        stop_event=None, drain=False, **handler_kwargs):
+    """
+    Poll the queue and keep up to max_workers jobs in flight until stop_event is set.
+    With drain=True the worker returns once the queue is empty. Queue clients and
+    the transcribe/upload callables can be replaced by local stand-ins.
+    """
+    queue_client = queue_client or azure_storage.get_queue_client(azure_storage.TRANSCRIPTION_QUEUE_NAME)
+    poison_queue_client = poison_queue_client or azure_storage.get_queue_client(POISON_QUEUE_NAME)
+    stop_event = stop_event or threading.Event()
+    counts = {"completed": 0, "failed": 0, "poisoned": 0}
+    last_report = time.monotonic()
+
+    def collect(finished):
+        for future in finished:
+            try:
+                counts[future.result()] += 1
+            except Exception as e:
+                print(f"Transcription job failed, will retry: {e}")
+                counts["failed"] += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+        while not stop_event.is_set():
+            free = max_workers - len(in_flight)
+            if free > 0:
+                messages = queue_client.receive_messages(
+                    max_messages=free,
+                    messages_per_page=min(free, 32),
+                    visibility_timeout=TRANSCRIPTION_VISIBILITY_TIMEOUT,
+                )
+                for message in messages:
+                    in_flight.add(executor.submit(
+                        handle_message, queue_client, poison_queue_client, message, **handler_kwargs
+                    ))
+
+            if not in_flight:
+                if drain:
+                    break
+                stop_event.wait(TRANSCRIPTION_POLL_INTERVAL)
+                continue
+            finished, in_flight = wait(in_flight, timeout=TRANSCRIPTION_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            collect(finished)
+            if "transcribe" not in handler_kwargs and time.monotonic() - last_report >= TRANSCRIPTION_STATS_INTERVAL:
+                pipeline = azure_transcription.get_pipeline()
+                print(f"Pipeline ({pipeline.bottleneck()} is the bottleneck): "
+                      f"{format_pipeline_stats(pipeline.get_stats())}")
+                last_report = time.monotonic()
+        collect(wait(in_flight).done)
+
+    return counts
+
+
+if __name__ == "__main__":
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    audio_processing.add_payload_hook(lambda m: print(
+        f"Audio payload for {m['file']}: {m['source_bytes']} bytes on disk, "
+        f"{m['payload_bytes']} bytes sent, encoded in {m['encode_seconds']:.3f}s"
+    ))
+    print(f"Transcription worker listening on '{azure_storage.TRANSCRIPTION_QUEUE_NAME}' "
+          f"with {TRANSCRIPTION_WORKERS} workers.")
+    print(run(stop_event=stop))